@@ -0,0 +1,37 @@
+"""add full-text search for knowledge and faqs
+
+Revision ID: add_fulltext_search
+Revises: add_message_templates
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.utils.fulltext import upgrade_statements, downgrade_statements
+
+# revision identifiers, used by Alembic.
+revision = 'add_fulltext_search'
+down_revision = 'add_message_templates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL: generated tsvector columns (spanish + unaccent) with GIN indexes
+    # SQLite: FTS5 virtual tables kept in sync by triggers
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not (inspector.has_table('knowledge') and inspector.has_table('faqs')):
+        # Fresh database: tables are created later by init_db(), which also
+        # creates the full-text structures
+        return
+    
+    dialect = bind.dialect.name
+    for statement in upgrade_statements(dialect):
+        op.execute(sa.text(statement))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in downgrade_statements(dialect):
+        op.execute(sa.text(statement))
@@ -0,0 +1,65 @@
+"""add llm_calls telemetry table and per-conversation LLM totals
+
+Revision ID: add_llm_telemetry
+Revises: add_normalized_columns
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_llm_telemetry'
+down_revision = 'add_normalized_columns'
+branch_labels = None
+depends_on = None
+
+CONVERSATION_COLUMNS = (
+    ('llm_calls', sa.Integer(), 0),
+    ('prompt_tokens', sa.Integer(), 0),
+    ('completion_tokens', sa.Integer(), 0),
+    ('llm_cost', sa.Float(), 0),
+    ('llm_latency_ms', sa.Float(), 0),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('llm_calls'):
+        op.create_table(
+            'llm_calls',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('conversation_id', sa.Integer(), nullable=True),
+            sa.Column('turn_id', sa.String(32), nullable=True),
+            sa.Column('stage', sa.String(30), nullable=False),
+            sa.Column('agent', sa.String(100), nullable=True),
+            sa.Column('model', sa.String(100), nullable=True),
+            sa.Column('priority', sa.String(20), nullable=True),
+            sa.Column('status', sa.String(20), nullable=False, server_default='ok'),
+            sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+            sa.Column('completion_tokens', sa.Integer(), nullable=True),
+            sa.Column('cost', sa.Float(), nullable=True),
+            sa.Column('latency_ms', sa.Float(), nullable=True),
+            sa.Column('queue_ms', sa.Float(), nullable=True),
+            sa.Column('retries', sa.Integer(), nullable=True),
+            sa.Column('hedged', sa.Boolean(), nullable=True),
+            sa.Column('cache_hit', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        for column in ('id', 'conversation_id', 'turn_id', 'stage', 'created_at'):
+            op.create_index(f'ix_llm_calls_{column}', 'llm_calls', [column])
+
+    if inspector.has_table('conversations'):
+        columns = {column['name'] for column in inspector.get_columns('conversations')}
+        for name, column_type, default in CONVERSATION_COLUMNS:
+            if name not in columns:
+                op.add_column('conversations', sa.Column(name, column_type, nullable=True, server_default=str(default)))
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if inspector.has_table('conversations'):
+        for name, _, _ in reversed(CONVERSATION_COLUMNS):
+            op.drop_column('conversations', name)
+    if inspector.has_table('llm_calls'):
+        op.drop_table('llm_calls')
@@ -0,0 +1,39 @@
+"""add normalized text columns for knowledge, faqs and message templates
+
+Revision ID: add_normalized_columns
+Revises: add_fulltext_search
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_normalized_columns'
+down_revision = 'add_fulltext_search'
+branch_labels = None
+depends_on = None
+
+TABLES = ('knowledge', 'faqs', 'message_templates')
+
+
+def upgrade():
+    # Values are filled on save and backfilled by init_db() at startup
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        if not inspector.has_table(table):
+            # Fresh database: init_db() creates the table with the columns
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'normalized_text' not in columns:
+            op.add_column(table, sa.Column('normalized_text', sa.Text(), nullable=True))
+        if 'normalized_tokens' not in columns:
+            op.add_column(table, sa.Column('normalized_tokens', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        if inspector.has_table(table):
+            op.drop_column(table, 'normalized_tokens')
+            op.drop_column(table, 'normalized_text')
@@ -11,6 +11,7 @@ from app.schemas.agent_config import (
     AgentConfigUpdate
 )
 from app.utils.database import get_db
+from app.bot.knowledge_snapshot import snapshot_store
 
 router = APIRouter(prefix="/api/agents", tags=["agents"])
 
@@ -122,6 +123,7 @@ async def list_agents(db: Session = Depends(get_db)):
             agent = AgentConfig(**agent_data)
             db.add(agent)
         db.commit()
+        snapshot_store.invalidate()
         agents = db.query(AgentConfig).all()
     
     return agents
@@ -151,6 +153,7 @@ async def create_agent(agent: AgentConfigCreate, db: Session = Depends(get_db)):
     db.add(db_agent)
     db.commit()
     db.refresh(db_agent)
+    snapshot_store.invalidate()
     return db_agent
 
 
@@ -173,6 +176,7 @@ async def update_agent(
     
     db.commit()
     db.refresh(db_agent)
+    snapshot_store.invalidate()
     return db_agent
 
 
@@ -186,6 +190,7 @@ async def delete_agent(agent_type: str, db: Session = Depends(get_db)):
     
     db.delete(db_agent)
     db.commit()
+    snapshot_store.invalidate()
     
     return {"message": f"Agent {agent_type} deleted"}
 
@@ -202,5 +207,6 @@ async def reset_to_defaults(db: Session = Depends(get_db)):
         db.add(agent)
     
     db.commit()
+    snapshot_store.invalidate()
     
     return {"message": "All agents reset to defaults"}
@@ -4,9 +4,12 @@ import logging
 import os
 import hmac
 import hashlib
+import httpx
 
 from app.bot.intelligent_agent import IntelligentAgent
-from app.utils.database import get_db
+from app.bot.job_queue import job_queue
+from app.bot.webhook import FAILURE_REPLY
+from app.utils.database import SessionLocal
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -40,7 +43,7 @@ async def chatwoot_webhook(
 ):
     """
     Webhook endpoint to receive events from Chatwoot.
-    Responds to incoming messages and sends intelligent responses.
+    Incoming messages are queued and answered by the job queue workers.
     """
     try:
         # Get raw body for signature verification
@@ -82,56 +85,93 @@ async def chatwoot_webhook(
         if not message:
             return {"status": "ignored", "reason": "no message content"}
         
-        logger.info(f"Processing message from {sender_name} in conversation {conversation_id}: {message}")
+        job_id = await job_queue.enqueue(
+            "chatwoot_api_message",
+            {"conversation_id": conversation_id, "message_id": payload.get("id"), "content": message, "sender_name": sender_name},
+            dedupe_key=f"chatwoot:{payload.get('id')}" if payload.get("id") else None,
+            partition=conversation_id
+        )
+        if job_id is None:
+            return {"status": "ignored", "reason": "duplicate message"}
         
-        # Get conversation context from database
-        db = next(get_db())
-        try:
+        logger.info(f"Queued message from {sender_name} in conversation {conversation_id} (job {job_id})")
+        
+        return {
+            "status": "queued",
+            "conversation_id": conversation_id,
+            "job_id": job_id
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing Chatwoot webhook: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def process_api_message(job: dict):
+    """
+    Answer a queued message (job queue handler; raising schedules a retry)
+    The reply is saved as job progress before sending, so a retry does not
+    generate it again nor send it twice.
+    """
+    conversation_id = job["conversation_id"]
+    progress_key = f"chatwoot:{job['message_id']}" if job.get("message_id") else None
+    reply = await job_queue.get_progress(progress_key) if progress_key else None
+    if reply is not None and reply.get("sent"):
+        logger.info(f"Message {job['message_id']} of conversation {conversation_id} already answered")
+        return
+    logger.info(f"Processing message from {job.get('sender_name')} in conversation {conversation_id}: {job['content']}")
+    
+    # Get conversation context from database
+    db = SessionLocal()
+    try:
+        if reply is None:
             # Generate intelligent response
             agent = IntelligentAgent(db)
             response = await agent.process_message(
-                message=message,
+                message=job["content"],
                 conversation_id=str(conversation_id)
             )
-            
-            # Send response back to Chatwoot
-            import httpx
-            async with httpx.AsyncClient() as client:
-                chatwoot_response = await client.post(
-                    f"{CHATWOOT_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/messages",
-                    headers={
-                        "api_access_token": CHATWOOT_ACCESS_TOKEN,
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "content": response.get("response", "Lo siento, no pude procesar tu mensaje."),
-                        "message_type": "outgoing",
-                        "private": False
-                    },
-                    timeout=30.0
-                )
-                
-                if chatwoot_response.status_code not in [200, 201]:
-                    logger.error(f"Failed to send message to Chatwoot: {chatwoot_response.text}")
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Failed to send response to Chatwoot"
-                    )
-            
-            logger.info(f"Successfully sent response to conversation {conversation_id}")
-            
-            return {
-                "status": "success",
-                "conversation_id": conversation_id,
-                "response_sent": True
-            }
-            
-        finally:
-            db.close()
+            reply = {"response": response.get("response", "Lo siento, no pude procesar tu mensaje.")}
+            if progress_key:
+                await job_queue.set_progress(progress_key, reply)
+        
+        # Send response back to Chatwoot
+        await send_reply(conversation_id, reply["response"])
+        if progress_key:
+            await job_queue.set_progress(progress_key, {**reply, "sent": True})
+        
+        logger.info(f"Successfully sent response to conversation {conversation_id}")
     
-    except Exception as e:
-        logger.error(f"Error processing Chatwoot webhook: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+async def notify_api_failure(job: dict, error: Exception):
+    """Tell the customer a human will follow up once every attempt failed"""
+    await send_reply(job["conversation_id"], FAILURE_REPLY)
+
+
+async def send_reply(conversation_id, content: str):
+    """Post an outgoing message to a Chatwoot conversation"""
+    async with httpx.AsyncClient() as client:
+        chatwoot_response = await client.post(
+            f"{CHATWOOT_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/messages",
+            headers={
+                "api_access_token": CHATWOOT_ACCESS_TOKEN,
+                "Content-Type": "application/json"
+            },
+            json={
+                "content": content,
+                "message_type": "outgoing",
+                "private": False
+            },
+            timeout=30.0
+        )
+        
+        if chatwoot_response.status_code not in [200, 201]:
+            raise RuntimeError(f"Failed to send message to Chatwoot: {chatwoot_response.text}")
 
 
 @router.get("/status")
@@ -144,3 +184,6 @@ async def chatwoot_status():
         "inbox_id": CHATWOOT_INBOX_ID,
         "webhook_secret_set": bool(CHATWOOT_WEBHOOK_SECRET)
     }
+
+
+job_queue.register("chatwoot_api_message", process_api_message, on_failure=notify_api_failure)
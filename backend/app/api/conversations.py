@@ -2,11 +2,63 @@ from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from app.models.conversation import Conversation
+from app.models.llm_call import LLMCall
 from app.schemas.conversation import Conversation as ConversationSchema, ConversationList, ConversationStats
 from app.utils.database import get_db
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
 router = APIRouter(prefix="/api/conversations")
 
+# Most recent calls considered for latency percentiles
+LATENCY_SAMPLE_LIMIT = 50000
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 1)
+
+
+def llm_stage_stats(db: Session, since: datetime) -> Dict:
+    """Latency percentiles overall and per stage from the llm_calls telemetry"""
+    rows = db.query(
+        LLMCall.stage, LLMCall.status, LLMCall.cache_hit, LLMCall.latency_ms,
+        LLMCall.prompt_tokens, LLMCall.completion_tokens
+    ).filter(LLMCall.created_at >= since).order_by(desc(LLMCall.id)).limit(LATENCY_SAMPLE_LIMIT).all()
+    
+    stages: Dict[str, Dict] = {}
+    latencies: List[float] = []
+    for stage, status, cache_hit, latency_ms, prompt_tokens, completion_tokens in rows:
+        entry = stages.setdefault(stage, {
+            "stage": stage, "calls": 0, "cache_hits": 0, "failed": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "latencies": []
+        })
+        if cache_hit:
+            entry["cache_hits"] += 1
+            continue
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens or 0
+        entry["completion_tokens"] += completion_tokens or 0
+        if status != "ok":
+            entry["failed"] += 1
+        elif latency_ms is not None:
+            entry["latencies"].append(latency_ms)
+            latencies.append(latency_ms)
+    
+    for entry in stages.values():
+        stage_latencies = sorted(entry.pop("latencies"))
+        entry["latency_p50_ms"] = percentile(stage_latencies, 0.5)
+        entry["latency_p95_ms"] = percentile(stage_latencies, 0.95)
+    
+    latencies.sort()
+    return {
+        "llm_latency_p50_ms": percentile(latencies, 0.5),
+        "llm_latency_p95_ms": percentile(latencies, 0.95),
+        "llm_stages": sorted(stages.values(), key=lambda e: e["calls"], reverse=True)
+    }
+
 
 @router.get("", response_model=ConversationList)
 @router.get("/", response_model=ConversationList)
@@ -23,8 +75,11 @@ async def list_conversations(
 
 
 @router.get("/stats", response_model=ConversationStats)
-async def get_stats(db: Session = Depends(get_db)):
-    """Get conversation statistics"""
+async def get_stats(
+    days: int = Query(7, ge=1, le=365),
+    db: Session = Depends(get_db)
+):
+    """Get conversation statistics (LLM latency percentiles cover the last `days`)"""
     total_conversations = db.query(func.count(Conversation.id)).scalar()
     total_messages = db.query(func.sum(Conversation.total_messages)).scalar() or 0
     
@@ -38,6 +93,14 @@ async def get_stats(db: Session = Depends(get_db)):
     
     avg_response_time = db.query(func.avg(Conversation.avg_response_time)).scalar() or 0
     
+    llm_calls, prompt_tokens, completion_tokens, llm_cost = db.query(
+        func.coalesce(func.sum(Conversation.llm_calls), 0),
+        func.coalesce(func.sum(Conversation.prompt_tokens), 0),
+        func.coalesce(func.sum(Conversation.completion_tokens), 0),
+        func.coalesce(func.sum(Conversation.llm_cost), 0.0)
+    ).one()
+    total_tokens = int(prompt_tokens) + int(completion_tokens)
+    
     return ConversationStats(
         total_conversations=total_conversations,
         total_messages=int(total_messages),
@@ -46,7 +109,13 @@ async def get_stats(db: Session = Depends(get_db)):
         human_escalation_rate=round(human_escalation_rate, 2),
         avg_response_time=round(avg_response_time, 2),
         top_knowledge_used=[],
-        top_faqs_used=[]
+        top_faqs_used=[],
+        total_llm_calls=int(llm_calls),
+        total_prompt_tokens=int(prompt_tokens),
+        total_completion_tokens=int(completion_tokens),
+        total_llm_cost=round(float(llm_cost), 4),
+        avg_tokens_per_conversation=round(total_tokens / total_conversations, 1) if total_conversations > 0 else 0,
+        **llm_stage_stats(db, datetime.now() - timedelta(days=days))
     )
 
 
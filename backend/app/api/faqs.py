@@ -5,6 +5,9 @@ from typing import List, Optional
 from app.models.faq import FAQ
 from app.schemas.faq import FAQ as FAQSchema, FAQCreate, FAQUpdate, FAQList
 from app.utils.database import get_db
+from app.utils.fulltext import fulltext_search
+from app.utils.text_processing import normalize_text
+from app.bot import index_sync
 
 router = APIRouter(prefix="/api/faqs")
 
@@ -28,9 +31,15 @@ async def list_faqs(
     if category:
         query = query.filter(FAQ.category == category)
     
-    if search:
+    if search and fulltext_search.is_available(db):
+        query = fulltext_search.filter_query(db, query, FAQ, search)
+    elif search:
         search_filter = f"%{search}%"
-        query = query.filter(or_(FAQ.question.ilike(search_filter), FAQ.answer.ilike(search_filter)))
+        query = query.filter(or_(
+            FAQ.question.ilike(search_filter),
+            FAQ.answer.ilike(search_filter),
+            FAQ.normalized_text.ilike(f"%{normalize_text(search)}%")
+        ))
     
     total = query.count()
     items = query.order_by(FAQ.priority.desc(), FAQ.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
@@ -55,6 +64,7 @@ async def create_faq(faq_in: FAQCreate, db: Session = Depends(get_db)):
     db.add(faq)
     db.commit()
     db.refresh(faq)
+    await index_sync.faq_saved([faq])
     return faq
 
 
@@ -71,6 +81,7 @@ async def update_faq(faq_id: int, faq_in: FAQUpdate, db: Session = Depends(get_d
     
     db.commit()
     db.refresh(faq)
+    await index_sync.faq_saved([faq])
     return faq
 
 
@@ -83,6 +94,7 @@ async def delete_faq(faq_id: int, db: Session = Depends(get_db)):
     
     db.delete(faq)
     db.commit()
+    await index_sync.faq_deleted(faq_id)
 
 
 @router.post("/{faq_id}/feedback")
@@ -10,6 +10,9 @@ from app.schemas.knowledge import (
     KnowledgeList
 )
 from app.utils.database import get_db
+from app.utils.fulltext import fulltext_search
+from app.utils.text_processing import normalize_text
+from app.bot import index_sync
 
 router = APIRouter(prefix="/api/knowledge")
 
@@ -33,13 +36,16 @@ async def list_knowledge(
     if category:
         query = query.filter(Knowledge.category == category)
     
-    if search:
+    if search and fulltext_search.is_available(db):
+        query = fulltext_search.filter_query(db, query, Knowledge, search)
+    elif search:
         search_filter = f"%{search}%"
         query = query.filter(
             or_(
                 Knowledge.title.ilike(search_filter),
                 Knowledge.content.ilike(search_filter),
-                Knowledge.keywords.cast(String).ilike(search_filter)
+                Knowledge.keywords.cast(String).ilike(search_filter),
+                Knowledge.normalized_text.ilike(f"%{normalize_text(search)}%")
             )
         )
     
@@ -66,6 +72,7 @@ async def create_knowledge(knowledge_in: KnowledgeCreate, db: Session = Depends(
     db.add(knowledge)
     db.commit()
     db.refresh(knowledge)
+    await index_sync.knowledge_saved([knowledge])
     return knowledge
 
 
@@ -82,6 +89,7 @@ async def update_knowledge(knowledge_id: int, knowledge_in: KnowledgeUpdate, db:
     
     db.commit()
     db.refresh(knowledge)
+    await index_sync.knowledge_saved([knowledge])
     return knowledge
 
 
@@ -94,6 +102,7 @@ async def delete_knowledge(knowledge_id: int, db: Session = Depends(get_db)):
     
     db.delete(knowledge)
     db.commit()
+    await index_sync.knowledge_deleted(knowledge_id)
 
 
 @router.get("/categories/list", response_model=List[str])
@@ -15,6 +15,7 @@ from app.schemas.message_template import (
     SendTemplateRequest
 )
 from app.services.chatwoot_service import chatwoot_service
+from app.bot.knowledge_snapshot import snapshot_store
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/templates", tags=["Message Templates"])
@@ -95,6 +96,7 @@ async def create_template(
     db.add(db_template)
     db.commit()
     db.refresh(db_template)
+    snapshot_store.invalidate()
     
     return db_template
 
@@ -137,6 +139,7 @@ async def update_template(
     
     db.commit()
     db.refresh(db_template)
+    snapshot_store.invalidate()
     
     return db_template
 
@@ -156,6 +159,7 @@ async def delete_template(template_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_template)
     db.commit()
+    snapshot_store.invalidate()
     
     return None
 
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.utils.database import get_db
 from app.models.settings import Settings
+from app.bot.knowledge_snapshot import snapshot_store
 from app.schemas.settings import SettingsCreate, SettingsUpdate, Settings as SettingResponse
 from typing import List
 
@@ -48,6 +49,7 @@ def create_or_update_setting(setting_data: SettingsCreate, db: Session = Depends
             setattr(existing, field, value)
         db.commit()
         db.refresh(existing)
+        snapshot_store.invalidate()
         return existing
     else:
         # Create new
@@ -55,6 +57,7 @@ def create_or_update_setting(setting_data: SettingsCreate, db: Session = Depends
         db.add(new_setting)
         db.commit()
         db.refresh(new_setting)
+        snapshot_store.invalidate()
         return new_setting
 
 
@@ -71,6 +74,7 @@ def update_setting(key: str, setting_data: SettingsUpdate, db: Session = Depends
     
     db.commit()
     db.refresh(setting)
+    snapshot_store.invalidate()
     return setting
 
 
@@ -84,5 +88,6 @@ def delete_setting(key: str, db: Session = Depends(get_db)):
     
     db.delete(setting)
     db.commit()
+    snapshot_store.invalidate()
     
     return {"message": "Setting deleted successfully"}
@@ -0,0 +1,80 @@
+from fastapi import APIRouter
+from app.bot.knowledge_snapshot import snapshot_store
+from app.bot.intent_cache import intent_cache
+from app.bot.response_cache import response_cache
+from app.bot.job_queue import job_queue
+from app.services.llm_clients import llm_clients
+from app.services.llm_gateway import llm_gateway
+from app.bot.specialized_agents import agent_registry
+from app.services.settings_service import bot_settings
+
+router = APIRouter(prefix="/api/system")
+
+
+@router.get("/snapshot")
+async def get_snapshot_status():
+    """Current content snapshot: version, size and build time"""
+    return snapshot_store.stats()
+
+
+@router.post("/snapshot/refresh")
+async def refresh_snapshot():
+    """Force a snapshot rebuild (e.g. after editing the database by hand)"""
+    snapshot_store.invalidate()
+    return {"message": "Snapshot rebuild scheduled"}
+
+
+@router.get("/intent-cache")
+async def get_intent_cache_stats():
+    """Intent classification cache hit/miss counters"""
+    return intent_cache.stats()
+
+
+@router.delete("/intent-cache")
+async def clear_intent_cache():
+    """Drop the in-process entries (Redis entries expire with their TTL)"""
+    intent_cache.clear()
+    return {"message": "Intent cache cleared"}
+
+
+@router.get("/response-cache")
+async def get_response_cache_stats():
+    """Semantic response cache hit/miss counters and enabled intents"""
+    return response_cache.stats()
+
+
+@router.delete("/response-cache")
+async def clear_response_cache():
+    """Drop the in-process entries (Redis entries expire with their TTL)"""
+    response_cache.clear()
+    return {"message": "Response cache cleared"}
+
+
+@router.get("/llm-clients")
+async def get_llm_client_stats():
+    """Shared LLM clients and their connection pool limits"""
+    return llm_clients.stats()
+
+
+@router.get("/llm-gateway")
+async def get_llm_gateway_stats():
+    """LLM scheduler: in-flight and queued requests, wait times and shed counts per priority"""
+    return llm_gateway.stats()
+
+
+@router.get("/job-queue")
+async def get_job_queue_stats():
+    """Webhook job queue: depth, oldest job age, wait/run times, retries and dead letters"""
+    return await job_queue.stats()
+
+
+@router.get("/agents")
+async def get_agent_registry_status():
+    """Agents in use and whether each comes from AgentConfig or the built-in defaults"""
+    return agent_registry.stats()
+
+
+@router.get("/settings")
+async def get_bot_settings():
+    """Typed settings the bot is currently answering with"""
+    return bot_settings.current._asdict()
@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from app.utils.database import get_db
+from app.utils.database import get_db, SessionLocal
 from app.bot.intelligent_agent import IntelligentAgent
+from app.services.llm_gateway import Priority, llm_priority
+import asyncio
+import json
+import time
 
 router = APIRouter(prefix="/api/test")
 
@@ -24,16 +29,7 @@ class TestResponse(BaseModel):
     engagement_level: str = ""
 
 
-@router.post("/chat", response_model=TestResponse)
-async def test_chat(test_msg: TestMessage, db: Session = Depends(get_db)):
-    """Test bot in real-time without Chatwoot"""
-    agent = IntelligentAgent(db)
-    
-    result = await agent.process_message(
-        message=test_msg.message,
-        history=test_msg.conversation_history
-    )
-    
+def to_test_response(result: dict) -> TestResponse:
     return TestResponse(
         response=result["response"],
         intent=result.get("intent", "unknown"),
@@ -45,3 +41,98 @@ async def test_chat(test_msg: TestMessage, db: Session = Depends(get_db)):
         customer_context=result.get("customer_context") or "",
         engagement_level=result.get("engagement_level") or ""
     )
+
+
+def sse_event(event: str, data: dict) -> str:
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat", response_model=TestResponse)
+async def test_chat(test_msg: TestMessage, db: Session = Depends(get_db)):
+    """Test bot in real-time without Chatwoot"""
+    agent = IntelligentAgent(db)
+    
+    # Las conversaciones reales tienen prioridad sobre el bot de prueba
+    with llm_priority(Priority.TEST):
+        result = await agent.process_message(
+            message=test_msg.message,
+            history=test_msg.conversation_history
+        )
+    
+    return to_test_response(result)
+
+
+@router.post("/chat/stream")
+async def test_chat_stream(test_msg: TestMessage):
+    """
+    Same as /chat, streamed as Server-Sent Events
+    
+    Events, in order of arrival:
+    - intent / knowledge / faqs: pipeline stages as they finish
+    - token: {"text": ...} chunks of the reply as the model writes it
+    - done: the /chat payload plus first_token_ms and total_ms; its
+      response is the final text (sales additions included)
+    """
+    async def events():
+        # Sesión propia: las dependencias con yield se cierran antes de que termine el stream
+        db = SessionLocal()
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def on_event(event: str, data: dict):
+            await queue.put((event, data))
+        
+        async def run():
+            try:
+                with llm_priority(Priority.TEST):
+                    result = await IntelligentAgent(db).process_message(
+                        message=test_msg.message,
+                        history=test_msg.conversation_history,
+                        on_event=on_event
+                    )
+                await queue.put(("result", result))
+            except Exception as e:
+                await queue.put(("error", {"detail": str(e)}))
+        
+        start = time.perf_counter()
+        first_token_ms = None
+        streamed = ""
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                if event == "result":
+                    response = data["response"]
+                    # Respuestas de plantillas/objeciones y los añadidos de ventas no pasan por el stream
+                    sent = streamed.rstrip()
+                    if response.startswith(sent) and len(response) > len(sent):
+                        if first_token_ms is None:
+                            first_token_ms = round((time.perf_counter() - start) * 1000)
+                        yield sse_event("token", {"text": response[len(sent):]})
+                    payload = to_test_response(data).model_dump()
+                    payload["first_token_ms"] = first_token_ms
+                    payload["total_ms"] = round((time.perf_counter() - start) * 1000)
+                    yield sse_event("done", payload)
+                    break
+                
+                if event == "error":
+                    yield sse_event("error", data)
+                    break
+                
+                if event == "token":
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - start) * 1000)
+                    streamed += data["text"]
+                yield sse_event(event, data)
+        finally:
+            # Cliente desconectado o turno terminado: esperar a que la tarea
+            # termine antes de cerrar la sesión que usa
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            db.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
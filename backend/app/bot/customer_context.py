@@ -120,6 +120,17 @@ class CustomerContext:
     
     def get_summary(self) -> str:
         """Genera un resumen del contexto para el agente"""
+        summary_parts = self._profile_parts()
+        summary_parts.append(f"Nivel de engagement: {self.context['engagement_level']}")
+        summary_parts.append(f"Mensajes: {self.context['message_count']}")
+        
+        return " | ".join(summary_parts) if summary_parts else "Nuevo cliente"
+    
+    def get_profile_summary(self) -> str:
+        """Resumen de los datos estables del cliente, sin los contadores que cambian en cada turno"""
+        return " | ".join(self._profile_parts())
+    
+    def _profile_parts(self) -> List[str]:
         summary_parts = []
         
         if self.context["name"]:
@@ -140,10 +151,7 @@ class CustomerContext:
         if self.context["objections_mentioned"]:
             summary_parts.append(f"Objeciones: {', '.join(self.context['objections_mentioned'])}")
         
-        summary_parts.append(f"Nivel de engagement: {self.context['engagement_level']}")
-        summary_parts.append(f"Mensajes: {self.context['message_count']}")
-        
-        return " | ".join(summary_parts) if summary_parts else "Nuevo cliente"
+        return summary_parts
     
     def should_push_for_sale(self) -> bool:
         """Determina si debe presionar para cerrar la venta"""
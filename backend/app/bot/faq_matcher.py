@@ -0,0 +1,222 @@
+"""
+FAQ matcher over questions and question_variations, plus tags and answer
+Every question/variation is indexed as normalized tokens and character
+trigrams; lookups only touch the variants that share features with the
+user message. Tags and answer are indexed by token only and score lower,
+so a FAQ is still found by words that only appear in its answer but a
+matching question always ranks first.
+"""
+from sqlalchemy.orm import Session
+from app.models.faq import FAQ, normalize_faq
+from app.utils.text_processing import NormalizedText, normalize, normalize_tokens
+from typing import Dict, List, Set, Tuple, Union
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def trigrams(tokens: List[str]) -> Set[str]:
+    """Character trigrams of the normalized tokens (word boundaries padded)"""
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class FAQMatcher:
+    """Token + trigram similarity index for FAQs"""
+
+    # Score blend: token containment dominates, trigrams add typo tolerance
+    TOKEN_WEIGHT = 0.5
+    TRIGRAM_CONTAINMENT_WEIGHT = 0.3
+    TRIGRAM_DICE_WEIGHT = 0.2
+
+    # Tags/answer: share of the query tokens they contain, scaled down
+    TAG_WEIGHT = 0.7
+    ANSWER_WEIGHT = 0.5
+
+    # Trigrams shared by more than this fraction of variants are too common
+    # to generate candidates on their own (only applied to larger corpora)
+    MAX_TRIGRAM_DF_RATIO = 0.2
+    MIN_VARIANTS_FOR_DF_CUTOFF = 50
+
+    def __init__(self, min_score: float = 0.35):
+        self.min_score = min_score
+        # variant_id -> (faq_id, tokens, trigrams)
+        self._variants: Dict[int, Tuple[int, Set[str], Set[str]]] = {}
+        self._faq_variants: Dict[int, List[int]] = {}
+        self._faq_priority: Dict[int, int] = {}
+        self._token_postings: Dict[str, Set[int]] = {}
+        self._trigram_postings: Dict[str, Set[int]] = {}
+        # token -> {faq_id: weight} for tags and answer
+        self._content_postings: Dict[str, Dict[int, float]] = {}
+        self._faq_content: Dict[int, Set[str]] = {}
+        self._next_variant_id = 0
+        self._lock = threading.RLock()
+        self.is_built = False
+
+    @property
+    def size(self) -> int:
+        return len(self._faq_variants)
+
+    def build(self, db: Session):
+        """Rebuild the matcher from the database"""
+        faqs = db.query(FAQ).filter(FAQ.is_active == True).all()
+        with self._lock:
+            self._variants = {}
+            self._faq_variants = {}
+            self._faq_priority = {}
+            self._token_postings = {}
+            self._trigram_postings = {}
+            self._content_postings = {}
+            self._faq_content = {}
+            for faq in faqs:
+                self._add(faq)
+            self.is_built = True
+        logger.info(f"FAQ matcher built: {len(faqs)} FAQs, {len(self._variants)} variants")
+
+    def upsert(self, faq: FAQ):
+        """Add or replace a FAQ (inactive FAQs are removed)"""
+        with self._lock:
+            self._remove(faq.id)
+            if faq.is_active:
+                self._add(faq)
+
+    def remove(self, faq_id: int):
+        """Remove a FAQ from the matcher"""
+        with self._lock:
+            self._remove(faq_id)
+
+    def match(self, query: Union[str, NormalizedText], limit: int = 3) -> List[Tuple[int, float]]:
+        """
+        Find the FAQs whose question or variations resemble the query
+        (or, with a lower score, whose tags/answer contain its words)
+
+        Args:
+            query: User's message (raw or already normalized)
+            limit: Maximum number of results
+
+        Returns:
+            List of (faq_id, similarity 0-1) sorted by similarity desc
+        """
+        query_tokens = set(normalize(query).tokens)
+        if not query_tokens:
+            return []
+        query_grams = trigrams(query_tokens)
+
+        with self._lock:
+            token_hits: Dict[int, int] = {}
+            for token in query_tokens:
+                for variant_id in self._token_postings.get(token, ()):
+                    token_hits[variant_id] = token_hits.get(variant_id, 0) + 1
+
+            max_df = len(self._variants)
+            if max_df >= self.MIN_VARIANTS_FOR_DF_CUTOFF:
+                max_df = int(max_df * self.MAX_TRIGRAM_DF_RATIO)
+
+            gram_hits: Dict[int, int] = {}
+            for gram in query_grams:
+                postings = self._trigram_postings.get(gram)
+                if not postings or len(postings) > max_df:
+                    continue
+                for variant_id in postings:
+                    gram_hits[variant_id] = gram_hits.get(variant_id, 0) + 1
+
+            best: Dict[int, float] = {}
+            for variant_id in token_hits.keys() | gram_hits.keys():
+                faq_id, tokens, grams = self._variants[variant_id]
+                shared_grams = gram_hits.get(variant_id, 0)
+                score = (
+                    self.TOKEN_WEIGHT * token_hits.get(variant_id, 0) / len(tokens)
+                    + self.TRIGRAM_CONTAINMENT_WEIGHT * shared_grams / len(grams)
+                    + self.TRIGRAM_DICE_WEIGHT * 2 * shared_grams / (len(grams) + len(query_grams))
+                )
+                if score >= self.min_score and score > best.get(faq_id, 0.0):
+                    best[faq_id] = score
+
+            content_scores: Dict[int, float] = {}
+            for token in query_tokens:
+                for faq_id, weight in self._content_postings.get(token, {}).items():
+                    content_scores[faq_id] = content_scores.get(faq_id, 0.0) + weight
+            for faq_id, total in content_scores.items():
+                score = total / len(query_tokens)
+                if score >= self.min_score and score > best.get(faq_id, 0.0):
+                    best[faq_id] = score
+
+            priority = self._faq_priority
+            ranked = sorted(
+                best.items(),
+                key=lambda x: (round(x[1], 3), priority.get(x[0], 0)),
+                reverse=True
+            )
+
+        return [(faq_id, round(score, 4)) for faq_id, score in ranked[:limit]]
+
+    def _add(self, faq: FAQ):
+        variants = faq.normalized_tokens or normalize_faq(
+            faq.question, faq.question_variations
+        )["normalized_tokens"]
+        variant_ids = []
+
+        for variant_tokens in variants:
+            tokens = set(variant_tokens)
+            if not tokens:
+                continue
+            grams = trigrams(tokens)
+
+            variant_id = self._next_variant_id
+            self._next_variant_id += 1
+            self._variants[variant_id] = (faq.id, tokens, grams)
+            variant_ids.append(variant_id)
+
+            for token in tokens:
+                self._token_postings.setdefault(token, set()).add(variant_id)
+            for gram in grams:
+                self._trigram_postings.setdefault(gram, set()).add(variant_id)
+
+        self._faq_variants[faq.id] = variant_ids
+        self._faq_priority[faq.id] = faq.priority or 0
+
+        content: Dict[str, float] = {}
+        for token in normalize_tokens(faq.answer or ""):
+            content[token] = self.ANSWER_WEIGHT
+        for tag in faq.tags or []:
+            for token in normalize_tokens(str(tag)):
+                content[token] = self.TAG_WEIGHT
+        for token, weight in content.items():
+            self._content_postings.setdefault(token, {})[faq.id] = weight
+        self._faq_content[faq.id] = set(content)
+
+    def _remove(self, faq_id: int):
+        variant_ids = self._faq_variants.pop(faq_id, None)
+        self._faq_priority.pop(faq_id, None)
+        for token in self._faq_content.pop(faq_id, ()):
+            entries = self._content_postings.get(token)
+            if entries is not None:
+                entries.pop(faq_id, None)
+                if not entries:
+                    del self._content_postings[token]
+        if not variant_ids:
+            return
+
+        for variant_id in variant_ids:
+            _, tokens, grams = self._variants.pop(variant_id)
+            for token in tokens:
+                self._discard(self._token_postings, token, variant_id)
+            for gram in grams:
+                self._discard(self._trigram_postings, gram, variant_id)
+
+    @staticmethod
+    def _discard(postings: Dict[str, Set[int]], key: str, variant_id: int):
+        entries = postings.get(key)
+        if entries is not None:
+            entries.discard(variant_id)
+            if not entries:
+                del postings[key]
+
+
+# Global matcher instance
+faq_matcher = FAQMatcher()
@@ -0,0 +1,186 @@
+"""
+Keeps the in-memory retrieval indexes in sync with the database
+Built at startup. A write is indexed right away by the worker that handled
+it and announced through the content snapshot; every worker then applies
+the knowledge/FAQ rows that changed between its previous and new snapshot
+(sync_indexes), which is how writes made elsewhere reach its indexes.
+"""
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.models.knowledge import Knowledge
+from app.models.faq import FAQ
+from app.bot.knowledge_index import knowledge_index
+from app.bot.faq_matcher import faq_matcher
+from app.bot.vector_index import knowledge_vectors, faq_vectors
+from app.bot.retrieval_cache import retrieval_cache
+from app.bot.knowledge_snapshot import Snapshot, announce_change, snapshot_store
+from app.utils.database import SessionLocal
+from contextlib import asynccontextmanager
+from typing import List, Mapping, Optional, Tuple
+from pathlib import Path
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def vectors_enabled() -> bool:
+    """Whether the configured retrieval mode uses the vector indexes"""
+    return settings.retrieval_mode != "keyword"
+
+
+async def build_indexes(db: Session):
+    """Build every retrieval index from the database"""
+    # Rows may have been edited by scripts while the service was down
+    await announce_change()
+
+    knowledge_index.build(db)
+    faq_matcher.build(db)
+
+    if vectors_enabled():
+        cache_dir = settings.embedding_cache_dir
+        for index, model in ((knowledge_vectors, Knowledge), (faq_vectors, FAQ)):
+            if cache_dir:
+                index.load_cache(str(Path(cache_dir) / index.cache_file))
+            items = db.query(model).filter(model.is_active == True).all()
+            await index.build(items)
+            if cache_dir:
+                Path(cache_dir).mkdir(parents=True, exist_ok=True)
+                index.save_cache(str(Path(cache_dir) / index.cache_file))
+
+
+# Local writes indexed here but not yet announced (see _local_write)
+_pending_writes = 0
+# Last snapshot version applied to the local indexes (see sync_indexes)
+_synced_version: Optional[int] = None
+
+
+@asynccontextmanager
+async def _local_write():
+    """
+    Index a write in this worker, then announce it. Until the snapshot that
+    contains it is applied, the local indexes are ahead of the snapshot, so
+    rows are read from the database and retrieval results are not cached.
+    """
+    global _pending_writes
+    _pending_writes += 1
+    retrieval_cache.indexed_version = None
+    try:
+        yield
+    finally:
+        try:
+            await snapshot_store.publish()
+        finally:
+            _pending_writes -= 1
+            _mark_synced()
+
+
+def _mark_synced():
+    """Cache retrieval results again once the indexes match the latest version"""
+    if not _pending_writes and _synced_version == snapshot_store.target_version:
+        retrieval_cache.indexed_version = _synced_version
+
+
+async def _index_knowledge(items: List[Knowledge]):
+    for knowledge in items:
+        knowledge_index.upsert(knowledge)
+
+    if vectors_enabled():
+        try:
+            await knowledge_vectors.upsert(items)
+        except Exception as e:
+            logger.error(f"Error updating knowledge vectors: {e}")
+
+
+def _unindex_knowledge(knowledge_id: int):
+    knowledge_index.remove(knowledge_id)
+    knowledge_vectors.remove(knowledge_id)
+
+
+async def _index_faqs(items: List[FAQ]):
+    for faq in items:
+        faq_matcher.upsert(faq)
+
+    if vectors_enabled():
+        try:
+            await faq_vectors.upsert(items)
+        except Exception as e:
+            logger.error(f"Error updating FAQ vectors: {e}")
+
+
+def _unindex_faq(faq_id: int):
+    faq_matcher.remove(faq_id)
+    faq_vectors.remove(faq_id)
+
+
+async def knowledge_saved(items: List[Knowledge]):
+    """Index new or updated knowledge items"""
+    async with _local_write():
+        await _index_knowledge(items)
+
+
+async def knowledge_deleted(knowledge_id: int):
+    """Drop a knowledge item from the indexes"""
+    async with _local_write():
+        _unindex_knowledge(knowledge_id)
+
+
+async def faq_saved(items: List[FAQ]):
+    """Index new or updated FAQs"""
+    async with _local_write():
+        await _index_faqs(items)
+
+
+async def faq_deleted(faq_id: int):
+    """Drop a FAQ from the indexes"""
+    async with _local_write():
+        _unindex_faq(faq_id)
+
+
+def _changes(previous: Mapping, current: Mapping) -> Tuple[List[int], List[int]]:
+    """
+    (ids added or edited, ids removed or deactivated) between two snapshots
+    Records hold every indexed field, so comparing them finds every edit
+    """
+    changed = [
+        row_id for row_id, record in current.items()
+        if previous.get(row_id) != record
+    ]
+    removed = [row_id for row_id in previous if row_id not in current]
+    return changed, removed
+
+
+def _load_rows(model, ids: List[int]) -> list:
+    db = SessionLocal()
+    try:
+        return db.query(model).filter(model.id.in_(ids)).all()
+    finally:
+        db.close()
+
+
+async def sync_indexes(previous: Optional[Snapshot], snapshot: Snapshot):
+    """
+    Apply the knowledge/FAQ rows that changed between two snapshots to the
+    local indexes (snapshot_store listener). The first snapshot matches the
+    indexes built at startup. Once the indexes reflect the latest version,
+    retrieval results are cached again under it.
+    """
+    global _synced_version
+    if previous is not None:
+        loop = asyncio.get_running_loop()
+        for model, old, new, index, unindex in (
+            (Knowledge, previous.knowledge, snapshot.knowledge, _index_knowledge, _unindex_knowledge),
+            (FAQ, previous.faqs, snapshot.faqs, _index_faqs, _unindex_faq)
+        ):
+            changed, removed = _changes(old, new)
+            for row_id in removed:
+                unindex(row_id)
+            if changed:
+                await index(await loop.run_in_executor(None, _load_rows, model, changed))
+
+    _synced_version = snapshot.version
+    _mark_synced()
+
+
+snapshot_store.add_listener(sync_indexes)
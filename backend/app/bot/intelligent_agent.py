@@ -1,18 +1,32 @@
 from sqlalchemy.orm import Session
 from app.bot.knowledge_retriever import KnowledgeRetriever
 from app.bot.intent_classifier import IntentClassifier
-from app.bot.specialized_agents import get_agent
+from app.bot.specialized_agents import ERROR_REPLY, get_agent, get_combined_agent
+from app.bot.response_cache import response_cache
+from app.bot.prompt_builder import Passage
 from app.services.openai_service import openai_service
+from app.services.llm_gateway import LLMOverloaded, llm_deadline
+from app.services.llm_telemetry import LLMCallRecord, llm_telemetry, llm_turn
 from app.bot.response_templates import templates
 from app.bot.customer_profiler import profiler
 from app.bot.objection_handler import objection_handler
 from app.bot.customer_context import context_manager
 from app.bot.conversation_flows import flow_manager
 from app.bot.template_manager import TemplateManager
-from typing import List, Dict
+from app.bot.pipeline import Pipeline, ShortCircuit
+from app.utils.text_processing import normalize
+from app.config import get_settings
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Respuesta cuando la cola del LLM está saturada y no hay FAQ ni plantilla aplicable
+BUSY_REPLY = (
+    "¡Gracias por escribirnos! 🙌 En este momento estamos atendiendo muchas consultas. "
+    "Cuéntame un poco más de lo que necesitas y te respondo enseguida."
+)
 
 
 class IntelligentAgent:
@@ -31,22 +45,29 @@ class IntelligentAgent:
         self,
         message: str,
         history: List[Dict] = None,
-        conversation_id: int = None
+        conversation_id: int = None,
+        on_event: Callable[[str, Dict], Awaitable[None]] = None
     ) -> Dict:
         """
         Process user message with multi-agent routing
         
-        Flow:
-        1. Classify intent
-        2. Search relevant knowledge
-        3. Route to specialized agent
-        4. Generate response
-        5. Return with metadata
+        The turn runs as a stage graph (see app.bot.pipeline):
+        - template -> flow -> objection -> profile: cheap local checks that
+          may answer the turn on their own
+        - knowledge, faqs: independent, started right away and cancelled if
+          one of the checks above answers the turn
+        - cached -> intent: response cache lookup, then classification
+          (skipped on a cache hit)
+        - response: waits for all of the above and calls the agent, or
+          reuses the cached reply when the same knowledge was retrieved
         
         Args:
             message: User's message
             history: Conversation history
             conversation_id: Optional conversation ID
+            on_event: Optional async callback for live progress, called with
+                ("intent" | "knowledge" | "faqs", data) as those stages finish
+                and ("token", {"text": ...}) while the agent reply streams
         
         Returns:
             dict with response, intent, agent_used, knowledge_used, confidence
@@ -54,11 +75,18 @@ class IntelligentAgent:
         try:
             logger.info(f"Processing message: {message[:100]}...")
             
-            # === NUEVO: Verificar plantillas automáticas por palabras clave ===
-            # Primero verificar si hay una plantilla que coincida
-            template_match = self.template_manager.find_template_by_keyword(message)
+            # Normalizar una sola vez; plantillas y búsqueda reutilizan el resultado
+            normalized = normalize(message)
+            # In combined mode the LLM is only used through the combined agent
+            combined_mode = settings.agent_mode == "combined"
+            customer_ctx = context_manager.get_context(conversation_id or 0)
             
-            if template_match:
+            # === NUEVO: Verificar plantillas automáticas por palabras clave ===
+            def check_template():
+                template_match = self.template_manager.find_template_by_keyword(normalized)
+                if not template_match:
+                    return None
+                
                 logger.info(f"Template matched: {template_match.name}")
                 
                 # Construir respuesta con los mensajes de la plantilla
@@ -74,7 +102,7 @@ class IntelligentAgent:
                 
                 response_text = "\n\n".join(template_messages)
                 
-                return {
+                return ShortCircuit({
                     "response": response_text,
                     "intent": "template",
                     "agent_used": f"Template: {template_match.name}",
@@ -83,90 +111,213 @@ class IntelligentAgent:
                     "faqs_used": [],
                     "conversation_id": conversation_id,
                     "template_used": template_match.name
-                }
+                })
             
             # === NUEVO: Verificar si hay un flujo activo ===
-            if flow_manager.has_active_flow(conversation_id or 0):
-                flow_result = flow_manager.process_message(conversation_id or 0, message)
-                if flow_result:
-                    logger.info(f"Flow response generated")
-                    return {
-                        "response": flow_result["message"],
-                        "intent": "flow",
-                        "agent_used": "Flow Manager",
-                        "confidence": 1.0,
+            def check_flow(template):
+                if flow_manager.has_active_flow(conversation_id or 0):
+                    flow_result = flow_manager.process_message(conversation_id or 0, message)
+                    if flow_result:
+                        logger.info(f"Flow response generated")
+                        return ShortCircuit({
+                            "response": flow_result["message"],
+                            "intent": "flow",
+                            "agent_used": "Flow Manager",
+                            "confidence": 1.0,
+                            "knowledge_used": [],
+                            "faqs_used": [],
+                            "conversation_id": conversation_id,
+                            "in_flow": True,
+                            "flow_completed": flow_result.get("completed", False)
+                        })
+                return None
+            
+            # === NUEVO: Gestión de contexto y objeciones ===
+            def check_objection(flow):
+                customer_ctx.update_from_message(message)
+                
+                objection_response = objection_handler.handle_objection(message)
+                if objection_response:
+                    logger.info(f"Objection detected and handled")
+                    objection_data = objection_handler.detect_objection(message)
+                    customer_ctx.add_objection(objection_data["type"])
+                    return ShortCircuit({
+                        "response": objection_response,
+                        "intent": "sales",
+                        "agent_used": "Objection Handler (Sales)",
+                        "confidence": objection_data["confidence"],
                         "knowledge_used": [],
                         "faqs_used": [],
                         "conversation_id": conversation_id,
-                        "in_flow": True,
-                        "flow_completed": flow_result.get("completed", False)
+                        "customer_context": customer_ctx.get_summary()
+                    })
+                return None
+            
+            # === NUEVO: Detectar perfil del cliente ===
+            def detect_profile(objection):
+                profile_data = profiler.detect_profile(message, history)
+                if profile_data["profile"] != "general":
+                    customer_ctx.set_profile(profile_data["profile"])
+                    logger.info(f"Customer profile: {profile_data['profile']} (confidence: {profile_data['confidence']})")
+                return profile_data
+            
+            # 4-5. Route to the agent and generate the response
+            async def classify(cached):
+                if cached is not None:
+                    return {
+                        "intent": cached.intent,
+                        "confidence": cached.confidence,
+                        "reasoning": "Response cache",
+                        "source": "response_cache"
                     }
+                return await self.classifier.classify(normalized, history, use_llm=not combined_mode)
             
-            # === NUEVO: Gestión de contexto del cliente ===
-            customer_ctx = context_manager.get_context(conversation_id or 0)
-            customer_ctx.update_from_message(message)
-            
-            # === NUEVO: Detectar y manejar objeciones primero ===
-            objection_response = objection_handler.handle_objection(message)
-            if objection_response:
-                logger.info(f"Objection detected and handled")
-                objection_data = objection_handler.detect_objection(message)
-                customer_ctx.add_objection(objection_data["type"])
-                return {
-                    "response": objection_response,
-                    "intent": "sales",
-                    "agent_used": "Objection Handler (Sales)",
-                    "confidence": objection_data["confidence"],
-                    "knowledge_used": [],
-                    "faqs_used": [],
-                    "conversation_id": conversation_id,
-                    "customer_context": customer_ctx.get_summary()
+            async def respond(profile, intent, knowledge, faqs, cached):
+                if cached is not None and response_cache.matches(cached, knowledge, faqs):
+                    logger.info(f"Response cache hit ({cached.intent})")
+                    if on_event is not None:
+                        await on_event("token", {"text": cached.response})
+                    return get_agent(cached.intent).name, cached.intent, cached.confidence, cached.response, True
+                
+                # Relevancia por posición; el prompt builder descarta primero las de menor puntaje
+                knowledge_texts = [
+                    Passage(f"{k.title}: {k.content}", 1.0 / (rank + 1)) for rank, k in enumerate(knowledge)
+                ] + [
+                    Passage(f"FAQ - {f.question}: {f.answer}", 1.0 / (rank + 1)) for rank, f in enumerate(faqs)
+                ]
+                
+                context = {
+                    "history": history or [],
+                    "customer_profile": profile,
+                    "customer_context": customer_ctx.get_context(),
+                    "should_push_sale": customer_ctx.should_push_for_sale(),
+                    "customer_summary": customer_ctx.get_summary()
                 }
+                
+                if intent is None:
+                    # Single request: the combined agent classifies and answers
+                    agent = get_combined_agent()
+                    combined = await agent.respond_with_intent(
+                        message=message,
+                        context=context,
+                        knowledge=knowledge_texts
+                    )
+                    if on_event is not None:
+                        await on_event("intent", {
+                            "intent": combined["intent"],
+                            "confidence": combined["confidence"],
+                            "source": "combined"
+                        })
+                        await on_event("token", {"text": combined["response"]})
+                    if combined["valid_intent"]:
+                        await self.classifier.remember(normalized, history, {
+                            "intent": combined["intent"],
+                            "confidence": combined["confidence"],
+                            "reasoning": "Combined agent",
+                            "source": "llm"
+                        })
+                        await response_cache.store(
+                            normalized, customer_ctx.get_profile_summary(), combined["intent"], combined["confidence"],
+                            combined["response"], knowledge, faqs
+                        )
+                    logger.info(f"Intent (combined): {combined['intent']} (confidence: {combined['confidence']})")
+                    return agent.name, combined["intent"], combined["confidence"], combined["response"], False
+                
+                logger.info(f"Intent: {intent['intent']} (confidence: {intent.get('confidence', 0.5)})")
+                agent = get_agent(intent["intent"])
+                context["intent"] = intent["intent"]
+                context["confidence"] = intent.get("confidence", 0.5)
+                if on_event is None:
+                    response = await agent.respond(
+                        message=message,
+                        context=context,
+                        knowledge=knowledge_texts
+                    )
+                else:
+                    chunks = []
+                    async for chunk in agent.respond_stream(
+                        message=message,
+                        context=context,
+                        knowledge=knowledge_texts
+                    ):
+                        chunks.append(chunk)
+                        await on_event("token", {"text": chunk})
+                    response = "".join(chunks).strip()
+                
+                if response != ERROR_REPLY and intent.get("source") not in ("timeout", "shed"):
+                    await response_cache.store(
+                        normalized, customer_ctx.get_profile_summary(), intent["intent"], intent.get("confidence", 0.5),
+                        response, knowledge, faqs
+                    )
+                return agent.name, intent["intent"], intent.get("confidence", 0.5), response, False
             
-            # === NUEVO: Detectar perfil del cliente ===
-            profile_data = profiler.detect_profile(message, history)
-            if profile_data["profile"] != "general":
-                customer_ctx.set_profile(profile_data["profile"])
-                logger.info(f"Customer profile: {profile_data['profile']} (confidence: {profile_data['confidence']})")
-            
-            # 1. Classify intent
-            intent_result = await self.classifier.classify(message, history)
-            intent = intent_result["intent"]
-            confidence = intent_result.get("confidence", 0.5)
-            
-            logger.info(f"Intent: {intent} (confidence: {confidence})")
-            
-            # 2. Search relevant knowledge
-            knowledge_items = await self.retriever.search_knowledge(message, limit=5)
-            faqs = await self.retriever.search_faqs(message, limit=3)
-            
-            # Build knowledge context
-            knowledge_texts = [
-                f"{k.title}: {k.content}" for k in knowledge_items
-            ] + [
-                f"FAQ - {f.question}: {f.answer}" for f in faqs
-            ]
-            
-            # 3. Get specialized agent for intent
-            agent = get_agent(intent)
-            
-            # 4. Build enhanced context for agent
-            context = {
-                "history": history or [],
-                "intent": intent,
-                "confidence": confidence,
-                "customer_profile": profile_data,
-                "customer_context": customer_ctx.get_context(),
-                "should_push_sale": customer_ctx.should_push_for_sale(),
-                "customer_summary": customer_ctx.get_summary()
+            async def respond_or_shed(profile, intent, knowledge, faqs, cached):
+                try:
+                    return await respond(profile, intent, knowledge, faqs, cached)
+                except LLMOverloaded as e:
+                    # Cola del LLM saturada: responder con FAQ/plantilla en lugar de esperar
+                    logger.warning(f"{e}; answering without the LLM")
+                    intent_name = intent["intent"] if intent else "general"
+                    agent_name, response = self._shed_reply(intent_name, faqs)
+                    if on_event is not None:
+                        await on_event("token", {"text": response})
+                    return agent_name, intent_name, 0.0, response, False
+            
+            async def emit_stage(name, value):
+                if name == "intent" and value is not None:
+                    await on_event("intent", {
+                        "intent": value["intent"],
+                        "confidence": value.get("confidence", 0.5),
+                        "source": value.get("source", "llm")
+                    })
+                elif name == "knowledge":
+                    await on_event("knowledge", {"knowledge_used": self._knowledge_summary(value)})
+                elif name == "faqs":
+                    await on_event("faqs", {"faqs_used": self._faq_summary(value)})
+            
+            # En modo combined, si se agota el tiempo responde el agente combinado
+            intent_fallback = None if combined_mode else {
+                "intent": "general",
+                "confidence": 0.5,
+                "reasoning": "Classification timed out, defaulting to general",
+                "source": "timeout"
             }
             
-            # 5. Generate response using specialized agent
-            response = await agent.respond(
-                message=message,
-                context=context,
-                knowledge=knowledge_texts
+            pipeline = (
+                Pipeline("turn")
+                .add("template", check_template)
+                .add("flow", check_flow, after=["template"])
+                .add("objection", check_objection, after=["flow"])
+                .add("profile", detect_profile, after=["objection"])
+                # 1-2. Speculative: independent of each other and of the checks above
+                .add("knowledge", lambda: self.retriever.search_knowledge(normalized, limit=5),
+                     timeout=self._timeout(settings.stage_timeout_search), default=[])
+                .add("faqs", lambda: self.retriever.search_faqs(normalized, limit=3),
+                     timeout=self._timeout(settings.stage_timeout_search), default=[])
+                # Local lookup first, so a cached reply never reaches the LLM
+                # (after profile detection: the profile must match the one the reply is built with)
+                .add("cached", lambda profile: response_cache.lookup(normalized, customer_ctx.get_profile_summary()),
+                     after=["profile"],
+                     timeout=self._timeout(settings.stage_timeout_search), default=None)
+                .add("intent", classify, after=["cached"],
+                     timeout=self._timeout(settings.stage_timeout_intent), default=intent_fallback)
+                .add("response", respond_or_shed, after=["profile", "intent", "knowledge", "faqs", "cached"],
+                     timeout=self._timeout(settings.stage_timeout_response))
             )
+            # Las llamadas al LLM del turno comparten un presupuesto de latencia
+            with llm_deadline(settings.llm_turn_budget), llm_turn(conversation_id) as llm_usage:
+                outcome = await pipeline.run(on_stage=emit_stage if on_event is not None else None)
+                if not outcome.short_circuited:
+                    self._record_cache_hits(outcome.values)
+            logger.debug(f"Stage timings: {outcome.timings}")
+            
+            if outcome.short_circuited:
+                return outcome.result
+            
+            profile_data = outcome.values["profile"]
+            knowledge_items = outcome.values["knowledge"]
+            faqs = outcome.values["faqs"]
+            agent_name, intent, confidence, response, from_cache = outcome.values["response"]
             
             # === NUEVO: Mejorar respuesta con templates si es ventas ===
             if intent == "sales":
@@ -190,7 +341,7 @@ class IntelligentAgent:
             await self.retriever.update_usage_stats(knowledge_ids, faq_ids)
             
             logger.info(
-                f"Response generated by {agent.name} - "
+                f"Response generated by {agent_name} - "
                 f"Knowledge: {len(knowledge_items)}, FAQs: {len(faqs)}, "
                 f"Profile: {profile_data.get('profile', 'none')}, "
                 f"Customer: {customer_ctx.get_summary()}"
@@ -199,20 +350,16 @@ class IntelligentAgent:
             return {
                 "response": response,
                 "intent": intent,
-                "agent_used": agent.name,
+                "agent_used": agent_name,
                 "confidence": confidence,
-                "knowledge_used": [
-                    {"id": k.id, "title": k.title, "category": k.category}
-                    for k in knowledge_items
-                ],
-                "faqs_used": [
-                    {"id": f.id, "question": f.question, "category": f.category}
-                    for f in faqs
-                ],
+                "knowledge_used": self._knowledge_summary(knowledge_items),
+                "faqs_used": self._faq_summary(faqs),
                 "conversation_id": conversation_id,
                 "customer_profile": profile_data.get("profile"),
                 "customer_context": customer_ctx.get_summary(),
-                "engagement_level": customer_ctx.context["engagement_level"]
+                "engagement_level": customer_ctx.context["engagement_level"],
+                "cached_response": from_cache,
+                "llm_usage": llm_usage.as_dict()
             }
         
         except Exception as e:
@@ -230,3 +377,38 @@ class IntelligentAgent:
                 "engagement_level": None,
                 "error": str(e)
             }
+    
+    @staticmethod
+    def _knowledge_summary(items) -> List[Dict]:
+        return [{"id": k.id, "title": k.title, "category": k.category} for k in items]
+    
+    @staticmethod
+    def _faq_summary(items) -> List[Dict]:
+        return [{"id": f.id, "question": f.question, "category": f.category} for f in items]
+    
+    @staticmethod
+    def _record_cache_hits(values: Dict):
+        """Telemetry for the LLM calls this turn avoided"""
+        intent = values.get("intent") or {}
+        if intent.get("source") in ("local", "cache", "response_cache"):
+            llm_telemetry.record(LLMCallRecord(
+                stage="intent", agent="Intent Classifier",
+                model="local" if intent["source"] == "local" else None, cache_hit=True
+            ))
+        response = values.get("response")
+        if response is not None and response[4]:
+            llm_telemetry.record(LLMCallRecord(stage="agent", agent=response[0], cache_hit=True))
+    
+    @staticmethod
+    def _shed_reply(intent: str, faqs) -> Tuple[str, str]:
+        """(agent_used, response) when the LLM queue sheds the turn"""
+        if faqs:
+            return "Load Shedding (FAQ)", faqs[0].answer
+        if intent == "sales":
+            return "Load Shedding (Template)", templates.build_precio_response()
+        return "Load Shedding (Template)", BUSY_REPLY
+    
+    @staticmethod
+    def _timeout(seconds: float) -> Optional[float]:
+        """Stage timeout from settings (0 or less disables it)"""
+        return seconds if seconds and seconds > 0 else None
@@ -0,0 +1,98 @@
+"""
+Cache for LLM intent classifications
+In-process LRU in front of Redis. Entries are keyed by the normalized
+message plus a fingerprint of the last bot turn, since "sí" or "precio?"
+can mean different things depending on what the bot just said
+"""
+from app.config import get_settings
+from app.utils.cache import cache
+from app.utils.text_processing import NormalizedText
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def last_bot_turn(history: Optional[List[Dict]]) -> str:
+    """Content of the most recent non-user message in the history"""
+    for msg in reversed(history or []):
+        if msg.get("role") != "user":
+            return msg.get("content") or ""
+    return ""
+
+
+class IntentCache:
+    """Two-tier (memory LRU + Redis) classification cache with TTL"""
+
+    KEY_PREFIX = "intent:v1"
+
+    def __init__(self, max_size: int = 5000, ttl: int = 21600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def make_key(self, message: NormalizedText, history: Optional[List[Dict]]) -> str:
+        bot_turn = " ".join(last_bot_turn(history).lower().split())
+        fingerprint = hashlib.sha1(bot_turn.encode("utf-8")).hexdigest()[:12]
+        digest = hashlib.sha1(message.folded.encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}:{fingerprint}"
+
+    async def get(self, message: NormalizedText, history: Optional[List[Dict]]) -> Optional[Dict]:
+        """Cached classification or None"""
+        key = self.make_key(message, history)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return dict(result)
+            del self._entries[key]
+
+        result = await cache.get(key)
+        if result is not None:
+            self._remember(key, result)
+            self.redis_hits += 1
+            return dict(result)
+
+        self.misses += 1
+        return None
+
+    async def set(self, message: NormalizedText, history: Optional[List[Dict]], result: Dict):
+        """Store a classification in both tiers"""
+        key = self.make_key(message, history)
+        self._remember(key, result)
+        await cache.set(key, result, expire=self.ttl)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.redis_hits) / lookups, 4) if lookups else None
+        }
+
+    def _remember(self, key: str, result: Dict):
+        self._entries[key] = (time.monotonic() + self.ttl, dict(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+# Global cache instance
+intent_cache = IntentCache(max_size=settings.intent_cache_size, ttl=settings.intent_cache_ttl)
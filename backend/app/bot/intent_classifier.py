@@ -2,9 +2,13 @@
 Intent Classification System
 Classifies user messages to route to specialized agents
 """
-from typing import Dict, List
-from openai import AsyncOpenAI
+from typing import Dict, List, Optional, Union
 from app.config import get_settings
+from app.bot.intent_model import get_intent_model, classification_log
+from app.bot.intent_cache import intent_cache
+from app.services.llm_clients import SharedLLMClient
+from app.services.llm_gateway import LLMOverloaded, llm_gateway
+from app.utils.text_processing import NormalizedText, normalize
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,24 +25,57 @@ class IntentClassifier:
         "general": "Saludos, información general, otras consultas"
     }
     
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+    client = SharedLLMClient()
     
     async def classify(
         self,
-        message: str,
-        conversation_history: List[Dict] = None
-    ) -> Dict:
+        message: Union[str, NormalizedText],
+        conversation_history: List[Dict] = None,
+        use_llm: bool = True
+    ) -> Optional[Dict]:
         """
         Classify user intent from message
+        The local model answers when its confidence reaches
+        settings.intent_local_threshold; otherwise a cached LLM answer for
+        the same message and last bot turn is reused, or the LLM is asked
+        and its answer cached and logged as training data for the local model
+        
+        Args:
+            message: User's message (raw or already normalized)
+            conversation_history: Previous messages
+            use_llm: When False, return None instead of calling the LLM
+                (the caller classifies some other way, see CombinedAgent)
         
         Returns:
             {
                 "intent": "sales",
                 "confidence": 0.95,
-                "reasoning": "User asking about prices"
+                "reasoning": "User asking about prices",
+                "source": "local" | "cache" | "llm" | "shed"
             }
         """
+        normalized = normalize(message)
+        message = normalized.raw
+        
+        intent, confidence = get_intent_model().predict(normalized)
+        if intent in self.INTENTS and confidence >= settings.intent_local_threshold:
+            logger.info(f"Intent classified locally: {intent} (confidence: {confidence:.2f})")
+            return {
+                "intent": intent,
+                "confidence": round(confidence, 3),
+                "reasoning": "Local intent model",
+                "source": "local"
+            }
+        
+        cached = await intent_cache.get(normalized, conversation_history)
+        if cached is not None:
+            cached["source"] = "cache"
+            logger.info(f"Intent from cache: {cached['intent']}")
+            return cached
+        
+        if not use_llm:
+            return None
+        
         try:
             # Build context from history
             context = ""
@@ -72,7 +109,7 @@ Classify the intent of the current message. Respond in JSON format:
     "reasoning": "brief explanation"
 }}"""
 
-            response = await self.client.chat.completions.create(
+            response = await llm_gateway.call(lambda: self.client.chat.completions.create(
                 model=settings.openai_model,
                 messages=[
                     {"role": "system", "content": "You are an intent classification assistant. Always respond with valid JSON."},
@@ -80,17 +117,29 @@ Classify the intent of the current message. Respond in JSON format:
                 ],
                 temperature=0.3,
                 response_format={"type": "json_object"}
-            )
+            ), kind="intent", agent="Intent Classifier", model=settings.openai_model)
             
             import json
             result = json.loads(response.choices[0].message.content)
             
             # Validate intent
-            if result.get("intent") not in self.INTENTS:
+            valid = result.get("intent") in self.INTENTS
+            if not valid:
                 result["intent"] = "general"
+            result["source"] = "llm"
+            await self.remember(normalized, conversation_history, result, log=valid)
             
             logger.info(f"Intent classified: {result['intent']} (confidence: {result.get('confidence', 0)})")
             return result
+        
+        except LLMOverloaded:
+            # Cola saturada: mejor la predicción local (aunque tenga poca confianza) que esperar
+            return {
+                "intent": intent if intent in self.INTENTS else "general",
+                "confidence": round(confidence, 3),
+                "reasoning": "LLM queue overloaded, local intent model",
+                "source": "shed"
+            }
             
         except Exception as e:
             logger.error(f"Intent classification error: {e}")
@@ -99,3 +148,15 @@ Classify the intent of the current message. Respond in JSON format:
                 "confidence": 0.5,
                 "reasoning": "Error in classification, defaulting to general"
             }
+    
+    async def remember(
+        self,
+        message: NormalizedText,
+        conversation_history: List[Dict],
+        result: Dict,
+        log: bool = True
+    ):
+        """Cache an LLM classification and (if log) keep it as training data"""
+        if log:
+            classification_log.append(message.raw, result["intent"], result.get("confidence", 0))
+        await intent_cache.set(message, conversation_history, result)
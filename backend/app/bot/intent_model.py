@@ -0,0 +1,331 @@
+"""
+Local intent model (multinomial naive Bayes over stems and stem bigrams)
+Lets IntentClassifier answer confident cases without calling the LLM.
+Trained from seed examples plus the LLM classifications logged in
+production (see train_intent_model.py)
+"""
+from app.config import get_settings
+from app.utils.text_processing import NormalizedText, normalize, normalize_tokens
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import json
+import math
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+# Ejemplos semilla para que el modelo funcione antes de tener registros
+SEED_EXAMPLES = [
+    ("cuanto cuesta el megapack", "sales"),
+    ("precio del plan de 3 meses", "sales"),
+    ("quiero comprar", "sales"),
+    ("cuanto vale", "sales"),
+    ("como pago", "sales"),
+    ("aceptan yape o plin", "sales"),
+    ("hay descuento si pago 6 meses", "sales"),
+    ("que incluye el paquete", "sales"),
+    ("tienen promocion", "sales"),
+    ("me interesa el plan vip", "sales"),
+    ("que ias incluye", "sales"),
+    ("tienen chatgpt plus y claude", "sales"),
+    ("ok como compro", "sales"),
+    ("puedo pagar con tarjeta", "sales"),
+    ("es muy caro", "sales"),
+    ("quiero el catalogo de precios", "sales"),
+    ("quiero comprarlo", "sales"),
+    ("cuanto vale el plan", "sales"),
+    ("tienen promociones o descuentos", "sales"),
+    ("esta caro", "sales"),
+    ("necesito ayuda para diseñar un logo", "design"),
+    ("que ia me recomiendas para diseño grafico", "design"),
+    ("quiero crear imagenes para mi marca", "design"),
+    ("sirve para editar videos", "design"),
+    ("que colores van con mi logo", "design"),
+    ("como hago una presentacion bonita", "design"),
+    ("midjourney para ilustraciones", "design"),
+    ("quiero personalizar el estilo de mis post", "design"),
+    ("ya pague cuando me llega el acceso", "order_tracking"),
+    ("no me llegan las credenciales", "order_tracking"),
+    ("cual es el estado de mi pedido", "order_tracking"),
+    ("cuando activan mi cuenta", "order_tracking"),
+    ("ya hice la transferencia y no recibo nada", "order_tracking"),
+    ("cuanto demora la entrega", "order_tracking"),
+    ("envie el comprobante de pago", "order_tracking"),
+    ("no me funciona el login", "support"),
+    ("me sale error al entrar", "support"),
+    ("la cuenta no funciona", "support"),
+    ("quiero un reembolso", "support"),
+    ("tengo problemas con la activacion", "support"),
+    ("se cerro mi sesion y no puedo entrar", "support"),
+    ("quiero hacer un reclamo", "support"),
+    ("la contraseña no sirve", "support"),
+    ("quiero que me devuelvan mi dinero", "support"),
+    ("hola", "general"),
+    ("hola buenas", "general"),
+    ("hola buenos dias", "general"),
+    ("buenas tardes", "general"),
+    ("buenas noches", "general"),
+    ("gracias", "general"),
+    ("muchas gracias", "general"),
+    ("ok gracias", "general"),
+    ("info", "general"),
+    ("mas info", "general"),
+    ("quienes son ustedes", "general"),
+    ("informacion", "general"),
+    ("de donde son", "general"),
+    ("que es ia club", "general"),
+    ("hola que tal", "general"),
+    ("hablar con un humano", "general")
+]
+
+
+# Bumped when features() changes; models saved with another version are not loaded
+FEATURES_VERSION = 2
+
+
+def features(text: Union[str, NormalizedText]) -> List[str]:
+    """
+    Stems plus adjacent stem bigrams
+    Stop words are kept: greetings, thanks and negations ("hola", "gracias",
+    "no funciona") are what tells short messages apart
+    """
+    tokens = normalize_tokens(normalize(text).raw, remove_stop_words=False)
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class IntentModel:
+    """
+    Multinomial naive Bayes with additive smoothing
+    A small alpha keeps one-word messages ("hola", "gracias") decisive;
+    with alpha=1 the smoothing mass of a few hundred features drowns them
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.class_counts: Dict[str, int] = {}
+        self.feature_counts: Dict[str, Dict[str, int]] = {}
+        self.trained_at: Optional[str] = None
+        self._log_prior: Dict[str, float] = {}
+        self._log_likelihood: Dict[str, Dict[str, float]] = {}
+        self._log_unseen: Dict[str, float] = {}
+        self._vocabulary: set = set()
+
+    @property
+    def classes(self) -> List[str]:
+        return list(self.class_counts)
+
+    @property
+    def examples(self) -> int:
+        return sum(self.class_counts.values())
+
+    def fit(self, examples: Iterable[Tuple[str, str]]) -> "IntentModel":
+        """Train from (text, intent) pairs"""
+        class_counts: Counter = Counter()
+        feature_counts: Dict[str, Counter] = {}
+        for text, intent in examples:
+            class_counts[intent] += 1
+            feature_counts.setdefault(intent, Counter()).update(features(text))
+
+        self.class_counts = dict(class_counts)
+        self.feature_counts = {intent: dict(counts) for intent, counts in feature_counts.items()}
+        self.trained_at = datetime.now().isoformat()
+        self._prepare()
+        return self
+
+    def predict(self, text: Union[str, NormalizedText]) -> Tuple[str, float]:
+        """
+        Most likely intent and its posterior probability
+
+        Returns:
+            (intent, confidence 0-1); confidence is 0.0 when the message
+            has no known features or the model is untrained
+        """
+        if not self._log_prior:
+            return "general", 0.0
+
+        feats = [f for f in features(text) if f in self._vocabulary]
+        if not feats:
+            return "general", 0.0
+
+        scores = {}
+        for intent, log_prior in self._log_prior.items():
+            table = self._log_likelihood[intent]
+            unseen = self._log_unseen[intent]
+            scores[intent] = log_prior + sum(table.get(f, unseen) for f in feats)
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / total
+
+    def _prepare(self):
+        """Precompute log probabilities so predict() is only lookups"""
+        self._vocabulary = {f for counts in self.feature_counts.values() for f in counts}
+        vocabulary_size = max(len(self._vocabulary), 1)
+        total_examples = self.examples
+
+        self._log_prior = {
+            intent: math.log(count / total_examples)
+            for intent, count in self.class_counts.items()
+        }
+        self._log_likelihood = {}
+        self._log_unseen = {}
+        for intent in self.class_counts:
+            counts = self.feature_counts.get(intent, {})
+            denominator = sum(counts.values()) + self.alpha * vocabulary_size
+            self._log_likelihood[intent] = {
+                f: math.log((n + self.alpha) / denominator) for f, n in counts.items()
+            }
+            self._log_unseen[intent] = math.log(self.alpha / denominator)
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "features_version": FEATURES_VERSION,
+                "alpha": self.alpha,
+                "trained_at": self.trained_at,
+                "class_counts": self.class_counts,
+                "feature_counts": self.feature_counts
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("features_version", 1) != FEATURES_VERSION:
+            raise ValueError("saved with an older feature set, re-run train_intent_model.py")
+        model = cls(alpha=data.get("alpha", 1.0))
+        model.class_counts = data["class_counts"]
+        model.feature_counts = data["feature_counts"]
+        model.trained_at = data.get("trained_at")
+        model._prepare()
+        return model
+
+
+class ClassificationLog:
+    """
+    Appends LLM classifications to a JSONL file used as training data
+    Records are buffered in memory and written periodically in the
+    executor, keeping file I/O off the reply path
+    """
+
+    def __init__(self, path: str, flush_interval: int = 10, max_buffer: int = 10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def append(self, message: str, intent: str, confidence: float):
+        """Register one classification (no I/O)"""
+        if not self.path:
+            return
+        record = {
+            "message": message,
+            "intent": intent,
+            "confidence": confidence,
+            "logged_at": datetime.now().isoformat()
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                # Disk unwritable for a while: keep the newest records
+                self._buffer.pop(0)
+            self._buffer.append(record)
+
+    def flush(self) -> int:
+        """
+        Append buffered records to the file
+
+        Returns:
+            Number of records written
+        """
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return 0
+
+        try:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            return len(records)
+        except OSError as e:
+            logger.warning(f"Could not log intent classifications: {e}")
+            # Keep the records for the next attempt
+            with self._lock:
+                self._buffer[:0] = records[-self.max_buffer:]
+            return 0
+
+    def start(self):
+        """Start the periodic flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.error(f"Classification log flush error: {e}")
+
+
+def read_classification_log(path: str, min_confidence: float = 0.0) -> List[Tuple[str, str]]:
+    """(message, intent) pairs from a classification log, skipping bad lines"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            message, intent = record.get("message"), record.get("intent")
+            if message and intent and float(record.get("confidence") or 0) >= min_confidence:
+                examples.append((message, intent))
+    return examples
+
+
+_model: Optional[IntentModel] = None
+_model_lock = threading.Lock()
+
+
+def get_intent_model() -> IntentModel:
+    """Trained model from settings.intent_model_path, or one fit on the seed examples"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                path = settings.intent_model_path
+                if path and Path(path).exists():
+                    try:
+                        _model = IntentModel.load(path)
+                        logger.info(f"Intent model loaded from {path} ({_model.examples} examples)")
+                    except Exception as e:
+                        logger.error(f"Error loading intent model {path}: {e}")
+                if _model is None:
+                    _model = IntentModel().fit(SEED_EXAMPLES)
+    return _model
+
+
+# Global classification log
+classification_log = ClassificationLog(settings.intent_log_path, flush_interval=settings.usage_flush_interval)
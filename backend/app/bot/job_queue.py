@@ -0,0 +1,431 @@
+"""
+Durable job queue for webhook events
+Webhooks validate and enqueue the event and answer right away; a pool of
+workers runs the jobs in the background.
+
+With Redis the queue is a stream read through a consumer group: a job is
+acknowledged only after its handler finished, jobs left unacknowledged by a
+worker that died are reclaimed after twice the job timeout, and failed jobs
+wait in a sorted set until their backoff expires. Without Redis the same
+workers consume an in-process queue (lost on restart).
+
+Jobs of the same partition (a conversation) run one at a time, in the order
+workers take them: an in-process lock orders this process's workers and a
+Redis lease keeps other processes out. A job waiting for its retry backoff
+does not hold the partition. Handlers whose side effects must not repeat on
+a retry (sending a reply) record their progress with set_progress().
+"""
+from app.config import get_settings
+from app.utils.cache import cache
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from collections import Counter, deque
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+STREAM_KEY = "jobs:stream"
+GROUP = "workers"
+DELAYED_KEY = "jobs:delayed"
+DEDUPE_PREFIX = "jobs:seen:"
+PARTITION_PREFIX = "jobs:partition:"
+PROGRESS_PREFIX = "jobs:progress:"
+
+Handler = Callable[[Dict], Awaitable[Any]]
+FailureHandler = Callable[[Dict, Exception], Awaitable[Any]]
+
+
+class JobQueue:
+    """
+    At-least-once background jobs with retries
+
+    Args:
+        workers: Jobs run concurrently by this process
+        max_attempts: Attempts before a job is dropped as a dead letter
+        retry_base_delay: Seconds before the first retry, doubled per attempt
+        timeout: Seconds per attempt
+        dedupe_ttl: Seconds a dedupe key (and job progress) is remembered
+        maxlen: Approximate cap of the Redis stream
+    """
+
+    SAMPLES = 500  # Recent waits/durations kept for percentiles
+    POLL_INTERVAL = 1.0  # Seconds a worker blocks waiting for a job
+
+    def __init__(
+        self,
+        workers: int = 8,
+        max_attempts: int = 4,
+        retry_base_delay: float = 2.0,
+        timeout: float = 60.0,
+        dedupe_ttl: int = 3600,
+        maxlen: int = 10000
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.timeout = timeout
+        self.dedupe_ttl = dedupe_ttl
+        self.maxlen = maxlen
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+        self._handlers: Dict[str, Tuple[Handler, Optional[FailureHandler]]] = {}
+        self._redis = False
+        self._local: Deque[Dict] = deque()
+        self._ready = asyncio.Event()
+        self._delayed_local = 0
+        self._seen: Dict[str, float] = {}
+        self._progress: Dict[str, Tuple[float, Dict]] = {}
+        self._partition_locks: Dict[str, asyncio.Lock] = {}
+        self._partition_users: Counter = Counter()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._running = 0
+
+        self._waits: Deque[float] = deque(maxlen=self.SAMPLES)
+        self._durations: Deque[float] = deque(maxlen=self.SAMPLES)
+        self.counters: Counter = Counter()
+        self.dead_letters: Deque[Dict] = deque(maxlen=50)
+
+    def register(self, kind: str, handler: Handler, on_failure: FailureHandler = None):
+        """
+        Set the coroutine that runs jobs of a kind
+
+        Args:
+            kind: Job kind passed to enqueue()
+            handler: Receives the job payload; raising schedules a retry
+            on_failure: Called with the payload and last error once all attempts failed
+        """
+        self._handlers[kind] = (handler, on_failure)
+
+    async def enqueue(self, kind: str, payload: Dict, dedupe_key: str = None, partition: Any = None) -> Optional[str]:
+        """
+        Queue a job (returns without waiting for it to run)
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable job data
+            dedupe_key: Jobs with a key seen in the last dedupe_ttl seconds are dropped
+            partition: Jobs with the same partition (e.g. conversation id) never run concurrently
+
+        Returns:
+            Job id, or None for a duplicate
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+
+        if dedupe_key and not await self._first_seen(dedupe_key):
+            self.counters["duplicates"] += 1
+            logger.info(f"Duplicate {kind} job ignored: {dedupe_key}")
+            return None
+
+        job = {
+            "id": uuid.uuid4().hex[:16],
+            "kind": kind,
+            "payload": payload,
+            "partition": None if partition is None else str(partition),
+            "attempt": 0,
+            "enqueued_at": time.time()
+        }
+        await self._push(job)
+        self.counters["enqueued"] += 1
+        return job["id"]
+
+    async def get_progress(self, key: str) -> Optional[Dict]:
+        """Progress saved by an earlier attempt of a job (see set_progress)"""
+        if self._redis:
+            state = await cache.get(f"{PROGRESS_PREFIX}{key}")
+            if state is not None:
+                return state
+        entry = self._progress.get(key)
+        return entry[1] if entry is not None and entry[0] > time.time() else None
+
+    async def set_progress(self, key: str, state: Dict):
+        """
+        Save what a job already did (e.g. the reply generated, then that it
+        was sent), so a retry skips those steps; kept for dedupe_ttl seconds
+        """
+        if self._redis and await cache.set(f"{PROGRESS_PREFIX}{key}", state, expire=self.dedupe_ttl):
+            return
+        now = time.time()
+        if len(self._progress) > 10000:
+            self._progress = {k: entry for k, entry in self._progress.items() if entry[0] > now}
+        self._progress[key] = (now + self.dedupe_ttl, state)
+
+    def start(self):
+        """Start the workers (after cache.connect, so the stream can be used)"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._ready = asyncio.Event()
+        if self._local:
+            self._ready.set()
+        self._tasks = [asyncio.create_task(self._start())]
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """
+        Stop taking jobs from Redis, finish running and in-process jobs for up to
+        drain_timeout seconds, then cancel the rest. Unacknowledged Redis jobs
+        are reclaimed by another worker.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._ready.set()
+        workers = self._tasks[1:]
+        if workers:
+            await asyncio.wait(workers, timeout=drain_timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        lost = len(self._local) + self._delayed_local
+        if lost:
+            logger.warning(f"Job queue stopped with {lost} in-process jobs not run")
+
+    async def stats(self) -> Dict:
+        now = time.time()
+        stream = await cache.stream_stats(STREAM_KEY, GROUP) if self._redis else None
+        queued = len(self._local)
+        oldest = self._local[0]["enqueued_at"] if self._local else None
+        if stream:
+            # Acknowledged entries are deleted: the stream holds waiting and running jobs
+            queued += max(0, stream["length"] - stream["pending"])
+            if stream["oldest_id"]:
+                stream_oldest = int(stream["oldest_id"].split("-")[0]) / 1000
+                oldest = min(oldest or stream_oldest, stream_oldest)
+
+        waits = sorted(self._waits)
+        durations = sorted(self._durations)
+        return {
+            "backend": "redis" if self._redis else "memory",
+            "consumer": self.consumer,
+            "workers": self.workers,
+            "running": self._running,
+            "queued": queued,
+            "pending": stream["pending"] if stream else self._running,
+            "delayed": (await cache.count(DELAYED_KEY) if self._redis else 0) + self._delayed_local,
+            "oldest_job_age_s": round(now - oldest, 1) if oldest else None,
+            "wait_p50_ms": round(self._percentile(waits, 0.5) * 1000, 1),
+            "wait_p95_ms": round(self._percentile(waits, 0.95) * 1000, 1),
+            "duration_p50_ms": round(self._percentile(durations, 0.5) * 1000, 1),
+            "duration_p95_ms": round(self._percentile(durations, 0.95) * 1000, 1),
+            "max_attempts": self.max_attempts,
+            **{name: self.counters[name] for name in ("enqueued", "duplicates", "processed", "retried", "reclaimed", "dead")},
+            "dead_letters": list(self.dead_letters)[-10:]
+        }
+
+    async def _start(self):
+        self._redis = await cache.ensure_group(STREAM_KEY, GROUP)
+        logger.info(f"Job queue started: {self.workers} workers, backend {'redis' if self._redis else 'memory'}")
+        self._tasks.extend(asyncio.create_task(self._worker(i)) for i in range(self.workers))
+        await self._maintain()
+
+    async def _push(self, job: Dict):
+        if self._redis and await cache.stream_add(STREAM_KEY, job, self.maxlen):
+            return
+        # Redis down: keep the job in this process rather than losing it
+        self._local.append(job)
+        self._ready.set()
+
+    async def _first_seen(self, key: str) -> bool:
+        seen = await cache.set_if_absent(f"{DEDUPE_PREFIX}{key}", 1, expire=self.dedupe_ttl)
+        if seen is not None:
+            return seen
+
+        now = time.time()
+        if len(self._seen) > 10000:
+            self._seen = {k: expiry for k, expiry in self._seen.items() if expiry > now}
+        if self._seen.get(key, 0) > now:
+            return False
+        self._seen[key] = now + self.dedupe_ttl
+        return True
+
+    async def _worker(self, index: int):
+        consumer = f"{self.consumer}-{index}"
+        while not (self._stopping and not self._local):
+            try:
+                entry_id, job = await self._next(consumer)
+                if job is not None:
+                    await self._run(job, entry_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {consumer} error: {e}", exc_info=True)
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _next(self, consumer: str) -> Tuple[Optional[str], Optional[Dict]]:
+        if self._local:
+            return None, self._local.popleft()
+
+        if self._redis and not self._stopping:
+            entries = await cache.stream_read(
+                STREAM_KEY, GROUP, consumer, count=1, block_ms=int(self.POLL_INTERVAL * 1000)
+            )
+            if entries is not None:
+                return entries[0] if entries else (None, None)
+            # Redis not usable right now: fall back to the in-process queue
+
+        self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=self.POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        return (None, self._local.popleft()) if self._local else (None, None)
+
+    async def _run(self, job: Dict, entry_id: Optional[str]):
+        handler, on_failure = self._handlers.get(job.get("kind"), (None, None))
+        job["attempt"] += 1
+        self._waits.append(max(0.0, time.time() - job["enqueued_at"]))
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind: {job.get('kind')}")
+            async with self._partition(job.get("partition")):
+                await asyncio.wait_for(handler(job["payload"]), timeout=self.timeout)
+            self.counters["processed"] += 1
+        except Exception as e:
+            await self._failed(job, e, on_failure, retry=handler is not None)
+        finally:
+            self._running -= 1
+            self._durations.append(time.perf_counter() - started)
+
+        # Not reached when cancelled: the entry stays pending and is reclaimed
+        if entry_id:
+            await cache.stream_ack(STREAM_KEY, GROUP, entry_id)
+
+    @asynccontextmanager
+    async def _partition(self, key: Optional[str]):
+        """Hold a partition while its job runs (no-op for jobs without one)"""
+        if key is None:
+            yield
+            return
+
+        lock = self._partition_locks.get(key)
+        if lock is None:
+            lock = self._partition_locks[key] = asyncio.Lock()
+        self._partition_users[key] += 1
+        try:
+            async with lock:
+                lease = await self._partition_lease(key)
+                try:
+                    yield
+                finally:
+                    if lease is not None:
+                        await cache.release_lease(f"{PARTITION_PREFIX}{key}", lease)
+        finally:
+            self._partition_users[key] -= 1
+            if not self._partition_users[key]:
+                del self._partition_users[key]
+                del self._partition_locks[key]
+
+    async def _partition_lease(self, key: str) -> Optional[str]:
+        """
+        Cross-process lease on a partition, waited for up to the job timeout
+        (then the attempt fails and is retried). Expires after twice the job
+        timeout if its holder dies. None without Redis.
+        """
+        if not self._redis:
+            return None
+        member = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        while True:
+            granted = await cache.acquire_lease(f"{PARTITION_PREFIX}{key}", member, 1, self.timeout * 2)
+            if granted is None:
+                return None  # Redis unavailable: in-process lock only
+            if granted:
+                return member
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"partition {key} busy")
+            await asyncio.sleep(random.uniform(0.05, 0.15))
+
+    async def _failed(self, job: Dict, error: Exception, on_failure: Optional[FailureHandler], retry: bool = True):
+        reason = str(error) or type(error).__name__
+        if retry and job["attempt"] < self.max_attempts:
+            delay = self.retry_base_delay * 2 ** (job["attempt"] - 1) * random.uniform(0.8, 1.2)
+            self.counters["retried"] += 1
+            logger.warning(f"Job {job['id']} ({job['kind']}) attempt {job['attempt']} failed: {reason}; retrying in {delay:.1f}s")
+            await self._schedule(job, delay)
+            return
+
+        self.counters["dead"] += 1
+        logger.error(f"Job {job['id']} ({job['kind']}) failed after {job['attempt']} attempts: {reason}")
+        self.dead_letters.append({
+            "id": job["id"],
+            "kind": job["kind"],
+            "attempts": job["attempt"],
+            "error": reason,
+            "failed_at": time.time()
+        })
+        if on_failure:
+            try:
+                await on_failure(job["payload"], error)
+            except Exception as e:
+                logger.error(f"Job {job['id']} failure handler error: {e}")
+
+    async def _schedule(self, job: Dict, delay: float):
+        if self._redis and await cache.schedule(DELAYED_KEY, job, time.time() + delay):
+            return
+
+        def release():
+            self._delayed_local -= 1
+            self._local.append(job)
+            self._ready.set()
+
+        self._delayed_local += 1
+        asyncio.get_running_loop().call_later(delay, release)
+
+    async def _maintain(self):
+        """Move due retries to the stream and reclaim jobs of dead workers"""
+        last_claim = 0.0
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            if not self._redis or self._stopping:
+                continue
+            try:
+                for job in await cache.pop_due(DELAYED_KEY, time.time()):
+                    await self._push(job)
+
+                if time.monotonic() - last_claim < self.timeout:
+                    continue
+                last_claim = time.monotonic()
+                claimed = await cache.stream_claim(
+                    STREAM_KEY, GROUP, f"{self.consumer}-reclaim", min_idle_ms=int(self.timeout * 2000)
+                )
+                for entry_id, job in claimed:
+                    # The worker died mid-job: count it as a failed attempt
+                    self.counters["reclaimed"] += 1
+                    job["attempt"] += 1
+                    _, on_failure = self._handlers.get(job.get("kind"), (None, None))
+                    await self._failed(job, TimeoutError("worker lost"), on_failure)
+                    await cache.stream_ack(STREAM_KEY, GROUP, entry_id)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue maintenance error: {e}")
+
+    @staticmethod
+    def _percentile(values: List[float], fraction: float) -> float:
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Global job queue
+job_queue = JobQueue(
+    workers=settings.job_workers,
+    max_attempts=settings.job_max_attempts,
+    retry_base_delay=settings.job_retry_base_delay,
+    timeout=settings.job_timeout,
+    dedupe_ttl=settings.job_dedupe_ttl,
+    maxlen=settings.job_stream_maxlen
+)
@@ -0,0 +1,181 @@
+"""
+In-memory BM25 inverted index over active Knowledge rows
+Built at startup and kept in sync by the knowledge API
+"""
+from sqlalchemy.orm import Session
+from app.models.knowledge import Knowledge, normalize_knowledge
+from app.utils.text_processing import NormalizedText, normalize
+from typing import Dict, List, Tuple, Union
+from collections import Counter
+import heapq
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeIndex:
+    """BM25 inverted index with priority/usage blending"""
+
+    # BM25 parameters
+    K1 = 1.5
+    B = 0.75
+
+    # Field weights (title and keywords count more than body text)
+    TITLE_WEIGHT = 3
+    KEYWORDS_WEIGHT = 2
+
+    # Blending of editorial priority and popularity into the final score
+    PRIORITY_WEIGHT = 0.15
+    USAGE_WEIGHT = 0.05
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: Dict[int, Dict[str, int]] = {}
+        self._doc_length: Dict[int, int] = {}
+        self._boost: Dict[int, float] = {}
+        self._stats: Dict[int, List[int]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.is_built = False
+
+    @property
+    def size(self) -> int:
+        return len(self._doc_length)
+
+    def build(self, db: Session):
+        """Rebuild the whole index from the database"""
+        start = time.perf_counter()
+        items = db.query(Knowledge).filter(Knowledge.is_active == True).all()
+
+        with self._lock:
+            self._postings = {}
+            self._doc_terms = {}
+            self._doc_length = {}
+            self._boost = {}
+            self._stats = {}
+            self._total_length = 0
+            for item in items:
+                self._add(item)
+            self.is_built = True
+
+        logger.info(
+            f"Knowledge index built: {len(items)} items in "
+            f"{(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    def upsert(self, knowledge: Knowledge):
+        """Add or replace a knowledge item (inactive items are removed)"""
+        with self._lock:
+            self._remove(knowledge.id)
+            if knowledge.is_active:
+                self._add(knowledge)
+
+    def remove(self, knowledge_id: int):
+        """Remove a knowledge item from the index"""
+        with self._lock:
+            self._remove(knowledge_id)
+
+    def record_usage(self, knowledge_id: int, increment: int = 1):
+        """Refresh the popularity boost of an indexed item"""
+        with self._lock:
+            stats = self._stats.get(knowledge_id)
+            if stats is not None:
+                stats[1] += increment
+                self._boost[knowledge_id] = self._compute_boost(*stats)
+
+    def search(self, query: Union[str, NormalizedText], limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        Rank knowledge items for a query
+
+        Args:
+            query: User's message (raw or already normalized)
+            limit: Maximum number of results
+
+        Returns:
+            List of (knowledge_id, score) sorted by score desc
+        """
+        query_terms = set(normalize(query).tokens)
+        if not query_terms:
+            return []
+
+        with self._lock:
+            n_docs = len(self._doc_length)
+            if n_docs == 0:
+                return []
+
+            avg_length = self._total_length / n_docs
+            k1 = self.K1
+            length_norm = k1 * (1 - self.B)
+            length_scale = k1 * self.B / avg_length
+            doc_length = self._doc_length
+            scores: Dict[int, float] = {}
+
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    denom = tf + length_norm + length_scale * doc_length[doc_id]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / denom
+
+            boost = self._boost
+            ranked = heapq.nlargest(
+                limit,
+                ((score + boost[doc_id], doc_id) for doc_id, score in scores.items())
+            )
+
+        return [(doc_id, score) for score, doc_id in ranked]
+
+    def _add(self, knowledge: Knowledge):
+        fields = knowledge.normalized_tokens or normalize_knowledge(
+            knowledge.title, knowledge.content, knowledge.keywords
+        )["normalized_tokens"]
+
+        terms = Counter(fields["content"])
+        for token in fields["title"]:
+            terms[token] += self.TITLE_WEIGHT
+        for token in fields["keywords"]:
+            terms[token] += self.KEYWORDS_WEIGHT
+
+        doc_id = knowledge.id
+        self._doc_terms[doc_id] = dict(terms)
+        length = sum(terms.values())
+        self._doc_length[doc_id] = length
+        self._total_length += length
+        self._stats[doc_id] = [knowledge.priority or 0, knowledge.times_used or 0]
+        self._boost[doc_id] = self._compute_boost(*self._stats[doc_id])
+
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _remove(self, doc_id: int):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+        self._total_length -= self._doc_length.pop(doc_id, 0)
+        self._boost.pop(doc_id, None)
+        self._stats.pop(doc_id, None)
+
+    def _compute_boost(self, priority: int, times_used: int) -> float:
+        return (
+            self.PRIORITY_WEIGHT * (priority or 0)
+            + self.USAGE_WEIGHT * math.log1p(times_used or 0)
+        )
+
+
+# Global index instance
+knowledge_index = KnowledgeIndex()
@@ -1,95 +1,127 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, String
 from app.models.knowledge import Knowledge
 from app.models.faq import FAQ
-from typing import List
-from datetime import datetime
+from app.bot.knowledge_index import knowledge_index
+from app.bot.faq_matcher import faq_matcher
+from app.bot.vector_index import knowledge_vectors, faq_vectors
+from app.bot.retrieval_cache import retrieval_cache
+from app.bot.usage_tracker import usage_tracker
+from app.bot.knowledge_snapshot import snapshot_store
+from app.services.settings_service import bot_settings
+from app.config import get_settings
+from app.utils.fulltext import fulltext_search
+from app.utils.text_processing import NormalizedText, normalize
+from typing import Dict, List, Tuple, Union
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def reciprocal_rank_fusion(
+    rankings: List[Tuple[List[Tuple[int, float]], float]],
+    k: float = 60.0,
+    limit: int = 5
+) -> List[Tuple[int, float]]:
+    """
+    Weighted reciprocal rank fusion
+    
+    Args:
+        rankings: List of (ranked (id, score) list, weight)
+        k: RRF smoothing constant (higher flattens rank differences)
+        limit: Maximum number of results
+    
+    Returns:
+        List of (id, fused_score) sorted by fused score desc
+    """
+    fused: Dict[int, float] = {}
+    for ranked, weight in rankings:
+        for rank, (item_id, _) in enumerate(ranked, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank)
+    
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)[:limit]
 
 
 class KnowledgeRetriever:
     """Search and retrieve relevant knowledge for answering questions"""
     
+    # Candidates taken from each path before fusing (multiple of limit)
+    HYBRID_DEPTH = 4
+    
     def __init__(self, db: Session):
         self.db = db
     
-    async def search_knowledge(self, query: str, limit: int = 5) -> List[Knowledge]:
+    async def search_knowledge(self, query: Union[str, NormalizedText], limit: int = 5) -> List[Knowledge]:
         """
         Search for relevant knowledge items
-        Uses simple keyword-based search
+        Uses the in-memory BM25 index (keyword mode), the embedding
+        index (vector mode) or both fused (hybrid mode),
+        see settings.retrieval_mode
         
         Args:
-            query: User's question
+            query: User's question (raw or normalized once per turn)
             limit: Maximum number of results
         
         Returns:
             List of relevant Knowledge items
         """
-        search_terms = query.lower().split()
-        
-        knowledge_items = []
-        seen_ids = set()
-        
-        for term in search_terms:
-            if len(term) < 3:  # Skip very short words
-                continue
-            
-            term_filter = f"%{term}%"
-            
-            results = self.db.query(Knowledge).filter(
-                Knowledge.is_active == True
-            ).filter(
-                or_(
-                    Knowledge.title.ilike(term_filter),
-                    Knowledge.content.ilike(term_filter),
-                    Knowledge.keywords.cast(String).ilike(term_filter)
-                )
-            ).order_by(
-                Knowledge.priority.desc(),
-                Knowledge.times_used.desc()
-            ).limit(limit).all()
-            
-            for item in results:
-                if item.id not in seen_ids:
-                    knowledge_items.append(item)
-                    seen_ids.add(item.id)
-        
-        # Sort by priority and usage
-        knowledge_items.sort(key=lambda x: (x.priority, x.times_used), reverse=True)
-        
-        return knowledge_items[:limit]
-    
-    async def search_faqs(self, query: str, limit: int = 3) -> List[FAQ]:
+        query = normalize(query)
+        cached, version = await retrieval_cache.lookup("knowledge", query, limit)
+        if cached is not None:
+            return cached
+        
+        mode = settings.retrieval_mode
+        if mode == "vector":
+            ranked = await self._vector_search(knowledge_vectors, Knowledge, query, limit)
+        elif mode == "hybrid":
+            depth = limit * self.HYBRID_DEPTH
+            ranked = await self._hybrid_search(
+                self._vector_search(knowledge_vectors, Knowledge, query, depth),
+                self._lexical_knowledge(query, depth),
+                limit
+            )
+        else:
+            ranked = await self._lexical_knowledge(query, limit)
+        
+        items = self._load_knowledge([doc_id for doc_id, _ in ranked])
+        await retrieval_cache.store("knowledge", query, limit, items, version)
+        return items
+    
+    async def search_faqs(self, query: Union[str, NormalizedText], limit: int = 3) -> List[FAQ]:
         """
         Search for relevant FAQs
+        Uses the token/trigram FAQ matcher (keyword mode), the embedding
+        index (vector mode) or both fused (hybrid mode)
         
         Args:
-            query: User's question
+            query: User's question (raw or normalized once per turn)
             limit: Maximum number of results
         
         Returns:
             List of relevant FAQ items
         """
-        search_filter = f"%{query}%"
+        query = normalize(query)
+        cached, version = await retrieval_cache.lookup("faq", query, limit)
+        if cached is not None:
+            return cached
         
-        faqs = self.db.query(FAQ).filter(
-            FAQ.is_active == True
-        ).filter(
-            or_(
-                FAQ.question.ilike(search_filter),
-                FAQ.answer.ilike(search_filter),
-                FAQ.question_variations.cast(String).ilike(search_filter),
-                FAQ.tags.cast(String).ilike(search_filter)
+        mode = settings.retrieval_mode
+        if mode == "vector":
+            ranked = await self._vector_search(faq_vectors, FAQ, query, limit)
+        elif mode == "hybrid":
+            depth = limit * self.HYBRID_DEPTH
+            ranked = await self._hybrid_search(
+                self._vector_search(faq_vectors, FAQ, query, depth),
+                self._lexical_faqs(query, depth),
+                limit
             )
-        ).order_by(
-            FAQ.priority.desc(),
-            FAQ.times_used.desc(),
-            FAQ.helpful_count.desc()
-        ).limit(limit).all()
+        else:
+            ranked = await self._lexical_faqs(query, limit)
         
-        return faqs
+        items = self._load_faqs([faq_id for faq_id, _ in ranked])
+        await retrieval_cache.store("faq", query, limit, items, version)
+        return items
     
     async def get_by_category(self, category: str, limit: int = 10) -> List[Knowledge]:
         """
@@ -109,33 +141,127 @@ class KnowledgeRetriever:
             Knowledge.priority.desc()
         ).limit(limit).all()
     
+    @staticmethod
+    def _use_fulltext(db: Session) -> bool:
+        """Whether lexical search runs in the database (see settings.lexical_backend)"""
+        return settings.lexical_backend == "fulltext" and fulltext_search.is_available(db)
+    
+    async def _lexical_knowledge(self, query: NormalizedText, limit: int) -> List[Tuple[int, float]]:
+        """BM25 search, building the index on first use"""
+        return await self._in_thread(self._lexical_knowledge_sync, query, limit)
+    
+    async def _lexical_faqs(self, query: NormalizedText, limit: int) -> List[Tuple[int, float]]:
+        """Token/trigram FAQ matching, building the matcher on first use"""
+        return await self._in_thread(self._lexical_faqs_sync, query, limit)
+    
+    def _lexical_knowledge_sync(self, db: Session, query: NormalizedText, limit: int) -> List[Tuple[int, float]]:
+        if self._use_fulltext(db):
+            return fulltext_search.search(db, Knowledge.__tablename__, query.raw, limit)
+        
+        if not knowledge_index.is_built:
+            knowledge_index.build(db)
+        return knowledge_index.search(query, limit=limit)
+    
+    def _lexical_faqs_sync(self, db: Session, query: NormalizedText, limit: int) -> List[Tuple[int, float]]:
+        if self._use_fulltext(db):
+            return fulltext_search.search(db, FAQ.__tablename__, query.raw, limit)
+        
+        if not faq_matcher.is_built:
+            faq_matcher.build(db)
+        return faq_matcher.match(query, limit=limit)
+    
+    async def _in_thread(self, func, *args):
+        """
+        Run blocking search work (index scoring, database queries) in a worker
+        thread, so it neither stalls other turns nor escapes the pipeline's
+        stage timeouts. Sessions are not thread-safe: the thread gets its own,
+        bound to the same engine as self.db.
+        """
+        def run():
+            db = Session(bind=self.db.get_bind())
+            try:
+                return func(db, *args)
+            finally:
+                db.close()
+        
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+    
+    async def _hybrid_search(self, vector_search, lexical_search, limit: int) -> List[Tuple[int, float]]:
+        """
+        Run the vector and lexical paths concurrently and fuse them
+        (the lexical path runs in a worker thread while the embedding
+        request is in flight)
+        """
+        vector_ranked, lexical_ranked = await asyncio.gather(vector_search, lexical_search)
+        
+        # Fusion weights are admin settings (retrieval_*_weight, retrieval_rrf_k)
+        weights = bot_settings.get(self.db)
+        return reciprocal_rank_fusion(
+            [
+                (lexical_ranked, weights.retrieval_lexical_weight),
+                (vector_ranked, weights.retrieval_vector_weight)
+            ],
+            k=weights.retrieval_rrf_k,
+            limit=limit
+        )
+    
+    async def _vector_search(self, index, model, query: NormalizedText, limit: int):
+        """Semantic search, building the vector index on first use"""
+        if not index.is_built:
+            await index.build(self.db.query(model).filter(model.is_active == True).all())
+        
+        try:
+            return await index.search(query.raw, limit=limit)
+        except Exception as e:
+            logger.error(f"Vector search error ({index.name}): {e}")
+            return []
+    
+    def _load_knowledge(self, knowledge_ids: List[int]) -> List[Knowledge]:
+        """Resolve ranked knowledge ids keeping the ranking order"""
+        snapshot = self._indexed_snapshot()
+        return self._load(Knowledge, knowledge_ids, snapshot.knowledge if snapshot else {})
+    
+    def _load_faqs(self, faq_ids: List[int]) -> List[FAQ]:
+        """Resolve ranked FAQ ids keeping the ranking order"""
+        snapshot = self._indexed_snapshot()
+        return self._load(FAQ, faq_ids, snapshot.faqs if snapshot else {})
+    
+    @staticmethod
+    def _indexed_snapshot():
+        """
+        The current snapshot if the indexes were synced to it; None right
+        after a local write, while the indexes are ahead of it and its
+        records may hold the old title/content of the rows just ranked
+        """
+        snapshot = snapshot_store.current
+        if snapshot is None or snapshot.version != retrieval_cache.indexed_version:
+            return None
+        return snapshot
+    
+    def _load(self, model, ids: List[int], records) -> list:
+        """
+        Read rows from the snapshot; ids it does not have (or all of them,
+        without a usable snapshot) are fetched from the database
+        """
+        if not ids:
+            return []
+        by_id = {row_id: records[row_id] for row_id in ids if row_id in records}
+        missing = [row_id for row_id in ids if row_id not in by_id]
+        if missing:
+            rows = self.db.query(model).filter(
+                model.id.in_(missing),
+                model.is_active == True
+            ).all()
+            by_id.update((row.id, row) for row in rows)
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
+    
     async def update_usage_stats(self, knowledge_ids: List[int], faq_ids: List[int]):
         """
         Update usage statistics for knowledge and FAQs
+        Increments are buffered and written in batches by usage_tracker
         
         Args:
             knowledge_ids: List of Knowledge IDs that were used
             faq_ids: List of FAQ IDs that were used
         """
-        now = datetime.now()
-        
-        try:
-            # Update knowledge usage
-            for kid in knowledge_ids:
-                knowledge = self.db.query(Knowledge).filter(Knowledge.id == kid).first()
-                if knowledge:
-                    knowledge.times_used = (knowledge.times_used or 0) + 1
-                    knowledge.last_used_at = now
-            
-            # Update FAQ usage
-            for fid in faq_ids:
-                faq = self.db.query(FAQ).filter(FAQ.id == fid).first()
-                if faq:
-                    faq.times_used = (faq.times_used or 0) + 1
-            
-            self.db.commit()
-            logger.info(f"Updated usage stats: {len(knowledge_ids)} knowledge, {len(faq_ids)} FAQs")
-        
-        except Exception as e:
-            logger.error(f"Error updating usage stats: {e}")
-            self.db.rollback()
+        usage_tracker.record(knowledge_ids, faq_ids)
@@ -0,0 +1,361 @@
+"""
+Process-wide, read-only snapshot of the bot's content
+Active knowledge, FAQs, message templates, agent configs and settings are loaded into
+compact immutable records. Request handlers read the current snapshot
+without locks; writers call invalidate() and a new snapshot is built in
+the background and swapped in with a single reference assignment.
+A version counter in Redis lets every worker notice writes made by others:
+changes are announced on a pub/sub channel and polled as a fallback.
+Listeners (see add_listener) are told about every snapshot swapped in, so
+state derived from the content, like the retrieval indexes, follows writes
+made by any worker.
+"""
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.models.knowledge import Knowledge
+from app.models.faq import FAQ
+from app.models.message_template import MessageTemplate, normalize_template
+from app.models.settings import Settings
+from app.models.agent_config import AgentConfig
+from app.utils.cache import cache
+from app.utils.database import SessionLocal
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, List, Mapping, NamedTuple, Optional, Tuple
+from datetime import datetime
+import asyncio
+import sys
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class KnowledgeRecord(NamedTuple):
+    id: int
+    title: str
+    content: str
+    category: Optional[str]
+    keywords: Tuple[str, ...]
+    priority: int
+
+
+class FAQRecord(NamedTuple):
+    id: int
+    question: str
+    answer: str
+    category: Optional[str]
+    priority: int
+    question_variations: Tuple[str, ...]
+    tags: Tuple[str, ...]
+
+
+class TemplateRecord(NamedTuple):
+    id: int
+    name: str
+    category: Optional[str]
+    messages: Tuple[dict, ...]
+    trigger_keywords: Tuple[str, ...]
+    normalized_text: str
+    normalized_tokens: Tuple[Tuple[str, ...], ...]
+
+
+class AgentRecord(NamedTuple):
+    agent_type: str
+    name: str
+    role: str
+    instructions: str
+    temperature: float  # 0-1 (stored as 0-100)
+    max_tokens: int
+    is_active: bool
+
+
+class SettingRecord(NamedTuple):
+    key: str
+    value: Optional[str]
+    value_json: Any
+
+
+class Snapshot(NamedTuple):
+    version: int
+    built_at: datetime
+    build_seconds: float
+    approx_bytes: int
+    knowledge: Mapping[int, KnowledgeRecord]
+    faqs: Mapping[int, FAQRecord]
+    templates: Tuple[TemplateRecord, ...]  # Active templates with trigger keywords
+    agents: Mapping[str, AgentRecord]  # All agent configs (active or not) by agent_type
+    settings: Mapping[str, SettingRecord]
+
+    def setting(self, key: str, default: Any = None) -> Any:
+        """Raw value of a settings row (default when missing)"""
+        record = self.settings.get(key)
+        return record.value if record is not None and record.value is not None else default
+
+
+def _approx_size(records) -> int:
+    """Rough memory footprint of the records and their strings"""
+    total = 0
+    for record in records:
+        total += sys.getsizeof(record)
+        for value in record:
+            if isinstance(value, str):
+                total += sys.getsizeof(value)
+    return total
+
+
+def build_snapshot(db: Session, version: int) -> Snapshot:
+    """Load the active content into a new snapshot"""
+    start = time.perf_counter()
+
+    knowledge = {
+        row.id: KnowledgeRecord(
+            row.id, row.title, row.content, row.category,
+            tuple(str(k) for k in row.keywords or ()), row.priority or 0
+        )
+        for row in db.query(Knowledge).filter(Knowledge.is_active == True)
+    }
+
+    faqs = {
+        row.id: FAQRecord(
+            row.id, row.question, row.answer, row.category, row.priority or 0,
+            tuple(str(v) for v in row.question_variations or ()), tuple(str(t) for t in row.tags or ())
+        )
+        for row in db.query(FAQ).filter(FAQ.is_active == True)
+    }
+
+    templates = []
+    for row in db.query(MessageTemplate).filter(
+        MessageTemplate.is_active == True,
+        MessageTemplate.trigger_keywords.isnot(None)
+    ).order_by(MessageTemplate.id):
+        if not row.trigger_keywords:
+            continue
+        folded, stems = row.normalized_text, row.normalized_tokens
+        if stems is None:
+            normalized = normalize_template(row.trigger_keywords)
+            folded, stems = normalized["normalized_text"], normalized["normalized_tokens"]
+        templates.append(TemplateRecord(
+            row.id, row.name, row.category, tuple(row.messages or ()),
+            tuple(row.trigger_keywords), folded, tuple(tuple(s) for s in stems)
+        ))
+
+    agents = {
+        row.agent_type: AgentRecord(
+            row.agent_type, row.agent_name, row.role_description, row.instructions,
+            (row.temperature if row.temperature is not None else 70) / 100,
+            row.max_tokens or 500, bool(row.is_active)
+        )
+        for row in db.query(AgentConfig)
+    }
+
+    settings_rows = {
+        row.key: SettingRecord(row.key, row.value, row.value_json)
+        for row in db.query(Settings)
+    }
+
+    approx_bytes = sum(
+        _approx_size(records)
+        for records in (knowledge.values(), faqs.values(), templates, agents.values(), settings_rows.values())
+    )
+
+    return Snapshot(
+        version=version,
+        built_at=datetime.now(),
+        build_seconds=round(time.perf_counter() - start, 4),
+        approx_bytes=approx_bytes,
+        knowledge=MappingProxyType(knowledge),
+        faqs=MappingProxyType(faqs),
+        templates=tuple(templates),
+        agents=MappingProxyType(agents),
+        settings=MappingProxyType(settings_rows)
+    )
+
+
+class SnapshotStore:
+    """Holds the current snapshot and rebuilds it when the version changes"""
+
+    VERSION_KEY = "snapshot:version"
+    CHANNEL = "snapshot:changed"
+
+    def __init__(self, poll_interval: int = 5):
+        self.poll_interval = poll_interval
+        self._current: Optional[Snapshot] = None
+        self._target_version = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._listen_task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Optional[Snapshot], Snapshot], Awaitable[None]]] = []
+
+    @property
+    def current(self) -> Optional[Snapshot]:
+        """The snapshot to read from (None until the first build)"""
+        return self._current
+
+    @property
+    def target_version(self) -> int:
+        """Latest version known to this process (current may still be behind)"""
+        return self._target_version
+
+    def add_listener(self, callback: Callable[[Optional[Snapshot], Snapshot], Awaitable[None]]):
+        """
+        Call callback(previous, snapshot) after each snapshot is swapped in
+        (previous is None for the first one). Rebuilds wait for it.
+        """
+        self._listeners.append(callback)
+
+    def stats(self) -> dict:
+        """Summary for the admin endpoint"""
+        snapshot = self._current
+        if snapshot is None:
+            return {"built": False, "pending_version": self._target_version}
+
+        return {
+            "built": True,
+            "version": snapshot.version,
+            "pending_version": self._target_version,
+            "built_at": snapshot.built_at.isoformat(),
+            "build_seconds": snapshot.build_seconds,
+            "approx_bytes": snapshot.approx_bytes,
+            "knowledge": len(snapshot.knowledge),
+            "faqs": len(snapshot.faqs),
+            "templates": len(snapshot.templates),
+            "agents": len(snapshot.agents),
+            "settings": len(snapshot.settings)
+        }
+
+    async def start(self):
+        """Build the first snapshot and start following the version counter"""
+        self._loop = asyncio.get_running_loop()
+        self._target_version = await self._remote_version() or 0
+        await self._rebuild()
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll())
+        if self._listen_task is None:
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        for task in (self._poll_task, self._listen_task, self._rebuild_task):
+            if task is not None:
+                task.cancel()
+        self._poll_task = self._listen_task = self._rebuild_task = None
+
+    def invalidate(self):
+        """
+        Signal that knowledge, FAQs, templates, agents or settings changed
+        Safe to call from async handlers and from sync endpoints running
+        in the threadpool; does nothing before start()
+        """
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(
+            lambda: asyncio.ensure_future(self.publish())
+        )
+
+    async def publish(self):
+        """Like invalidate(), but target_version is the new version when it returns"""
+        if self._loop is None:
+            return
+        remote = await cache.incr(self.VERSION_KEY)
+        self._target_version = remote if remote is not None else self._target_version + 1
+        self._schedule_rebuild()
+        if remote is not None:
+            await cache.publish(self.CHANNEL, remote)
+
+    async def _remote_version(self) -> Optional[int]:
+        value = await cache.get(self.VERSION_KEY)
+        return int(value) if value is not None else None
+
+    def _schedule_rebuild(self):
+        # A running rebuild loops until it reaches the latest version
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild())
+
+    async def _rebuild(self):
+        loop = asyncio.get_running_loop()
+        while self._current is None or self._current.version != self._target_version:
+            version = self._target_version
+            try:
+                snapshot = await loop.run_in_executor(None, self._build, version)
+            except Exception as e:
+                logger.error(f"Snapshot build error: {e}")
+                return
+            previous, self._current = self._current, snapshot
+            logger.info(
+                f"Snapshot v{version} built in {snapshot.build_seconds}s: "
+                f"{len(snapshot.knowledge)} knowledge, {len(snapshot.faqs)} FAQs, "
+                f"{len(snapshot.templates)} templates"
+            )
+            for callback in self._listeners:
+                try:
+                    await callback(previous, snapshot)
+                except Exception as e:
+                    logger.error(f"Snapshot listener error: {e}")
+
+    @staticmethod
+    def _build(version: int) -> Snapshot:
+        db = SessionLocal()
+        try:
+            return build_snapshot(db, version)
+        finally:
+            db.close()
+
+    async def _listen(self):
+        """Rebuild as soon as another worker announces a change"""
+        pubsub = cache.pubsub()
+        if pubsub is None:
+            return
+        try:
+            await pubsub.subscribe(self.CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    version = int(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                if version > self._target_version:
+                    self._target_version = version
+                    self._schedule_rebuild()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Snapshot listener error: {e} - relying on polling")
+        finally:
+            await pubsub.aclose()
+
+    async def _poll(self):
+        """Pick up writes made by other worker processes (fallback for missed messages)"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                remote = await self._remote_version()
+                if remote is not None and remote != self._target_version:
+                    self._target_version = remote
+                    self._schedule_rebuild()
+            except Exception as e:
+                logger.error(f"Snapshot poll error: {e}")
+
+
+async def announce_change() -> bool:
+    """
+    Tell running workers that content changed, for scripts that write to the
+    database directly. Returns False when Redis is not reachable
+    """
+    connected_here = cache.redis_client is None
+    if connected_here:
+        await cache.connect()
+    try:
+        version = await cache.incr(SnapshotStore.VERSION_KEY)
+        if version is None:
+            return False
+        await cache.publish(SnapshotStore.CHANNEL, version)
+        return True
+    finally:
+        if connected_here:
+            await cache.disconnect()
+
+
+# Global snapshot store
+snapshot_store = SnapshotStore(poll_interval=settings.snapshot_poll_interval)
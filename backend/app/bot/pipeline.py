@@ -0,0 +1,189 @@
+"""
+Small dependency-graph executor for the per-message pipeline
+Every stage starts as soon as the stages it depends on have finished, so
+independent work (intent classification, knowledge and FAQ search) runs
+concurrently and a turn costs roughly its slowest path instead of the sum.
+A stage can finish the turn early by returning ShortCircuit(result); the
+stages still running (speculative work) are then cancelled.
+"""
+from typing import Any, Callable, Dict, Iterable, Optional
+import asyncio
+import inspect
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class ShortCircuit:
+    """Returned by a stage to end the pipeline with `result`"""
+
+    __slots__ = ("result",)
+
+    def __init__(self, result: Any):
+        self.result = result
+
+
+class Stage:
+    """
+    A named step of the pipeline
+
+    Args:
+        name: Stage name; dependants receive its value as a keyword argument
+        func: Sync or async callable taking the values of `after` as kwargs
+        after: Names of the stages that must finish first
+        timeout: Seconds before the stage is abandoned (None = no limit).
+            Timeouts can only interrupt a stage while it awaits: sync stages
+            run on the event loop to completion, so blocking work (database
+            queries, index scoring) belongs in async stages that hand it to a
+            thread, as KnowledgeRetriever does
+        default: Value used when the stage times out or fails; without it
+            the error is propagated and the whole pipeline fails
+    """
+
+    __slots__ = ("name", "func", "after", "timeout", "default")
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        after: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = _MISSING
+    ):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.default = default
+
+
+class PipelineResult:
+    """Outcome of a run: stage values, or the short-circuiting stage and its result"""
+
+    __slots__ = ("values", "short_circuit_by", "result", "timings")
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.short_circuit_by: Optional[str] = None
+        self.result: Any = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def short_circuited(self) -> bool:
+        return self.short_circuit_by is not None
+
+
+# Marker for stages skipped because a dependency short-circuited
+_SKIPPED = object()
+
+
+class Pipeline:
+    """Stages registered in dependency order, run concurrently by run()"""
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self._stages: Dict[str, Stage] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        after: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = _MISSING
+    ) -> "Pipeline":
+        """Register a stage; its dependencies must already be registered"""
+        stage = Stage(name, func, after, timeout, default)
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        missing = [dep for dep in stage.after if dep not in self._stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        self._stages[name] = stage
+        return self
+
+    async def run(self, on_stage: Callable[[str, Any], Any] = None) -> PipelineResult:
+        """
+        Execute every stage
+
+        Args:
+            on_stage: Optional (sync or async) callback invoked with the name
+                and value of each stage as soon as it finishes
+
+        When several stages short-circuit in the same tick, the one registered
+        first wins. Stage errors without a default are re-raised after the
+        remaining stages have been cancelled.
+        """
+        outcome = PipelineResult()
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.create_task(
+                self._run_stage(stage, tasks, outcome, on_stage),
+                name=f"{self.name}:{stage.name}"
+            )
+
+        names = {task: name for name, task in tasks.items()}
+        order = {name: index for index, name in enumerate(tasks)}
+        pending = set(tasks.values())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: order[names[t]]):
+                    value = task.result()
+                    if isinstance(value, ShortCircuit):
+                        outcome.short_circuit_by = names[task]
+                        outcome.result = value.result
+                        return outcome
+            return outcome
+        finally:
+            if pending:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.debug(f"{self.name}: cancelled {len(pending)} pending stage(s)")
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        tasks: Dict[str, asyncio.Task],
+        outcome: PipelineResult,
+        on_stage: Optional[Callable[[str, Any], Any]]
+    ):
+        if stage.after:
+            results = await asyncio.gather(*(tasks[dep] for dep in stage.after))
+            # Never run past a stage that ended the turn
+            if any(value is _SKIPPED or isinstance(value, ShortCircuit) for value in results):
+                return _SKIPPED
+
+        inputs = {dep: outcome.values[dep] for dep in stage.after}
+        start = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(self._call(stage.func, inputs), stage.timeout)
+        except asyncio.TimeoutError:
+            if stage.default is _MISSING:
+                raise
+            logger.warning(f"{self.name}: stage {stage.name} timed out after {stage.timeout}s, using default")
+            value = stage.default
+        except Exception as e:
+            if stage.default is _MISSING:
+                raise
+            logger.error(f"{self.name}: stage {stage.name} failed ({e}), using default")
+            value = stage.default
+        finally:
+            outcome.timings[stage.name] = round(time.perf_counter() - start, 4)
+
+        if not isinstance(value, ShortCircuit):
+            outcome.values[stage.name] = value
+            if on_stage is not None:
+                await self._call(on_stage, {"name": stage.name, "value": value})
+        return value
+
+    @staticmethod
+    async def _call(func: Callable[..., Any], inputs: Dict[str, Any]) -> Any:
+        value = func(**inputs)
+        if inspect.isawaitable(value):
+            value = await value
+        return value
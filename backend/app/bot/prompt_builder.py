@@ -0,0 +1,141 @@
+"""
+Token-budgeted system prompt assembly
+The agent prompt is split into sections that get a share of a fixed token
+budget: the fixed part (agent header, length and response instructions) is
+always kept, history and customer summary are capped, and knowledge gets the
+rest. When knowledge does not fit, the lowest-scoring passages are dropped
+first, so prompt size (and with it LLM latency and cost) stays bounded no
+matter how long the retrieved chunks are.
+"""
+from app.config import get_settings
+from app.utils.tokens import count_tokens, truncate_to_tokens
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class Passage(NamedTuple):
+    """Retrieved text for the Knowledge Base section, with its relevance"""
+    text: str
+    score: float = 0.0
+
+
+class PromptBudget(NamedTuple):
+    total: int = 1600  # Whole system prompt
+    history: int = 300  # Recent conversation
+    summary: int = 80  # Customer summary
+
+
+class BuiltPrompt(NamedTuple):
+    text: str
+    tokens: int
+    passages_used: int
+    passages_dropped: int
+
+
+def as_passages(knowledge: Optional[Sequence[Union[str, Passage]]]) -> List[Passage]:
+    """Passages from plain strings (ranked by position) or Passage objects"""
+    passages = []
+    for rank, item in enumerate(knowledge or []):
+        passages.append(item if isinstance(item, Passage) else Passage(item, 1.0 / (rank + 1)))
+    return passages
+
+
+class PromptBuilder:
+    """Assembles an agent's system prompt within a token budget"""
+
+    HISTORY_TURNS = 3
+
+    def __init__(self, budget: PromptBudget = None):
+        self.budget = budget or PromptBudget(
+            total=settings.prompt_token_budget,
+            history=settings.prompt_history_tokens,
+            summary=settings.prompt_summary_tokens
+        )
+
+    def build(
+        self,
+        header: str,
+        knowledge: Optional[Sequence[Union[str, Passage]]],
+        context: Optional[Dict],
+        length_instruction: str,
+        response_instruction: str
+    ) -> BuiltPrompt:
+        """
+        System prompt for one turn
+
+        Args:
+            header: Precompiled agent header (instructions, role, company)
+            knowledge: Passages, or strings ordered by relevance
+            context: Turn context (history, customer_summary)
+            length_instruction: Response length instruction from the settings
+            response_instruction: Agent's closing instruction
+        """
+        history = self._history(context)
+        summary = truncate_to_tokens((context or {}).get("customer_summary") or "", self.budget.summary)
+
+        fixed = (
+            count_tokens(header) + count_tokens(length_instruction)
+            + count_tokens(response_instruction) + count_tokens(history)
+            + count_tokens(summary) + 20  # Section titles and separators
+        )
+        passages = as_passages(knowledge)
+        kept = self._fit_passages(passages, self.budget.total - fixed)
+
+        sections = [header]
+        if kept:
+            sections.append("Knowledge Base:\n" + "\n".join(f"- {text}" for text in kept))
+        if summary:
+            sections.append(f"Customer summary: {summary}")
+        sections.append(f"Previous conversation:\n{history if history else 'Starting new conversation'}")
+        sections.append(length_instruction)
+        sections.append(response_instruction)
+
+        text = "\n\n".join(sections)
+        return BuiltPrompt(text, count_tokens(text), len(kept), len(passages) - len(kept))
+
+    def _history(self, context: Optional[Dict]) -> str:
+        """Last turns, newest kept first when over the history budget"""
+        if not context or not context.get("history"):
+            return ""
+        lines: List[str] = []
+        remaining = self.budget.history
+        for msg in reversed(context["history"][-self.HISTORY_TURNS:]):
+            speaker = "User" if msg.get("role") == "user" else "Assistant"
+            line = f"{speaker}: {msg.get('content', '')}"
+            tokens = count_tokens(line)
+            if tokens > remaining:
+                line = truncate_to_tokens(line, remaining)
+                if line:
+                    lines.append(line)
+                break
+            lines.append(line)
+            remaining -= tokens
+        return "\n".join(reversed(lines))
+
+    @staticmethod
+    def _fit_passages(passages: List[Passage], budget: int) -> List[str]:
+        """Passage texts that fit, in their original order; lowest scores dropped first"""
+        if not passages or budget <= 0:
+            return []
+        costs = [count_tokens(p.text) + 2 for p in passages]
+        keep = set(range(len(passages)))
+        total = sum(costs)
+        # Later passages go first among equal scores
+        for index in sorted(keep, key=lambda i: (passages[i].score, -i)):
+            if total <= budget or len(keep) == 1:
+                break
+            keep.discard(index)
+            total -= costs[index]
+
+        kept = [passages[i].text for i in sorted(keep)]
+        if total > budget:
+            # A single passage larger than the whole budget is cut instead of dropped
+            kept = [truncate_to_tokens(kept[0], budget - 2)]
+        return [text for text in kept if text]
+
+
+# Global prompt builder
+prompt_builder = PromptBuilder()
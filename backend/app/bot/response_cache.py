@@ -0,0 +1,271 @@
+"""
+Semantic cache of generated replies
+Near-identical questions answered from the same knowledge get the reply
+generated the first time, skipping both the classification and the agent
+LLM calls. Messages are matched exactly (memory, then Redis) or by
+LocalEmbedder similarity within this process. A cached reply is only
+reused when:
+- its intent is enabled in the response_cache_intents admin setting
+- the customer profile is the same: name, profile, interests, products,
+  budget and objections (replies may address the customer by name or quote
+  their budget, so they are never shared between different customers).
+  Per-turn counters (message count, engagement) are left out, or only a
+  conversation's first message could ever hit
+- the numbers in both messages are the same ("1 mes" vs "3 meses")
+- the knowledge/FAQ rows it was built from, the agent config and the
+  response style are unchanged (checked against the content snapshot,
+  so edits invalidate entries on every worker without coordination)
+- retrieval for the new message returns the same knowledge/FAQ ids
+"""
+from app.config import get_settings
+from app.bot.knowledge_snapshot import snapshot_store
+from app.bot.vector_index import LocalEmbedder
+from app.services.settings_service import bot_settings
+from app.utils.cache import cache
+from app.utils.text_processing import NormalizedText
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_NUMBER = re.compile(r"\d+")
+
+
+class CachedReply(NamedTuple):
+    intent: str
+    confidence: float
+    response: str
+    knowledge_ids: Tuple[int, ...]
+    faq_ids: Tuple[int, ...]
+    fingerprint: str  # Content of those rows + agent config + response style + customer profile
+
+
+def _digest(text: str, size: int = 40) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:size]
+
+
+class ResponseCache:
+    """Exact + nearest-neighbour reply cache (memory LRU, Redis for exact repeats)"""
+
+    KEY_PREFIX = "response:v3"
+
+    def __init__(self, max_size: int = 2000, ttl: int = 3600, threshold: float = 0.92):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._embedder = LocalEmbedder(settings.embedding_dimensions)
+        # key -> (expires_at, reply, slot); vectors live in a fixed matrix by slot
+        self._entries: "OrderedDict[str, Tuple[float, CachedReply, int]]" = OrderedDict()
+        self._vectors = np.zeros((max_size, self._embedder.dimensions), dtype=np.float32)
+        self._slot_keys: List[Optional[str]] = [None] * max_size
+        self._numbers: Dict[str, List[str]] = {}
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._config_stamps: Dict[Tuple[int, str], str] = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def enabled_for(self, intent: str) -> bool:
+        """Per-intent switch (admin setting response_cache_intents)"""
+        intents = bot_settings.current.response_cache_intents
+        return intent in {i.strip() for i in intents.split(",")}
+
+    @staticmethod
+    def context_digest(customer_profile: str) -> str:
+        """Digest of the stable customer data (CustomerContext.get_profile_summary)"""
+        return _digest(customer_profile or "", 16)
+
+    def make_key(self, message: NormalizedText, customer_profile: str) -> str:
+        return f"{self.KEY_PREFIX}:{_digest(message.folded)}:{self.context_digest(customer_profile)}"
+
+    async def lookup(self, message: NormalizedText, customer_profile: str) -> Optional[CachedReply]:
+        """Reusable reply for the message for this customer profile, or None"""
+        if not self.max_size:
+            return None
+        key = self.make_key(message, customer_profile)
+
+        entry = self._entries.get(key)
+        reply = None
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            reply = entry[1]
+        else:
+            stored = await cache.get(key)
+            if stored is not None:
+                intent, confidence, response, knowledge_ids, faq_ids, fingerprint = stored
+                reply = CachedReply(intent, confidence, response, tuple(knowledge_ids), tuple(faq_ids), fingerprint)
+                await self._remember(key, message, reply)
+        if reply is not None and self._usable(key, reply):
+            self.exact_hits += 1
+            return reply
+
+        reply = await self._nearest(message, key)
+        if reply is not None:
+            self.similar_hits += 1
+            return reply
+
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def matches(reply: CachedReply, knowledge: Sequence, faqs: Sequence) -> bool:
+        """Whether the new message retrieved the same rows the reply was built from"""
+        return (set(reply.knowledge_ids) == {k.id for k in knowledge}
+                and set(reply.faq_ids) == {f.id for f in faqs})
+
+    async def store(
+        self,
+        message: NormalizedText,
+        customer_profile: str,
+        intent: str,
+        confidence: float,
+        response: str,
+        knowledge: Sequence,
+        faqs: Sequence
+    ):
+        """Cache a freshly generated reply (ignored for disabled intents)"""
+        if not self.max_size or not self.enabled_for(intent):
+            return
+        knowledge_ids = tuple(sorted(k.id for k in knowledge))
+        faq_ids = tuple(sorted(f.id for f in faqs))
+        key = self.make_key(message, customer_profile)
+        fingerprint = self._fingerprint(intent, knowledge_ids, faq_ids, self._key_context(key))
+        if fingerprint is None:
+            return
+
+        reply = CachedReply(intent, confidence, response, knowledge_ids, faq_ids, fingerprint)
+        await self._remember(key, message, reply)
+        await cache.set(key, list(reply), expire=self.ttl)
+
+    def clear(self):
+        for key in list(self._entries):
+            self._forget(key)
+        self._config_stamps.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "intents": bot_settings.current.response_cache_intents,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else None
+        }
+
+    async def _nearest(self, message: NormalizedText, key: str) -> Optional[CachedReply]:
+        if not self._entries or not message.tokens:
+            return None
+        vector = await self._embed(message)
+        similarities = self._vectors @ vector
+        context = self._key_context(key)
+        numbers = _NUMBER.findall(message.folded)
+
+        candidates = np.flatnonzero(similarities >= self.threshold)
+        for slot in candidates[np.argsort(-similarities[candidates])]:
+            candidate_key = self._slot_keys[slot]
+            if candidate_key is None or self._key_context(candidate_key) != context:
+                continue
+            expires_at, reply, _ = self._entries[candidate_key]
+            if expires_at <= time.monotonic():
+                self._forget(candidate_key)
+                continue
+            if self._numbers.get(candidate_key) != numbers:
+                continue
+            if self._usable(candidate_key, reply):
+                self._entries.move_to_end(candidate_key)
+                return reply
+        return None
+
+    def _usable(self, key: str, reply: CachedReply) -> bool:
+        """Intent still enabled and nothing it depends on has changed"""
+        if not self.enabled_for(reply.intent):
+            return False
+        fingerprint = self._fingerprint(reply.intent, reply.knowledge_ids, reply.faq_ids, self._key_context(key))
+        if fingerprint != reply.fingerprint:
+            self.stale += 1
+            self._forget(key)
+            return False
+        return True
+
+    @staticmethod
+    def _key_context(key: str) -> str:
+        return key.rsplit(":", 1)[1]
+
+    def _fingerprint(
+        self, intent: str, knowledge_ids: Sequence[int], faq_ids: Sequence[int], context: str
+    ) -> Optional[str]:
+        """Hash of the rows, configuration and customer profile a reply depends on (None if unknown)"""
+        snapshot = snapshot_store.current
+        if snapshot is None:
+            return None
+
+        parts = [self._config_stamp(snapshot, intent), context]
+        for knowledge_id in knowledge_ids:
+            record = snapshot.knowledge.get(knowledge_id)
+            if record is None:
+                return None
+            parts.append(f"k{knowledge_id}:{record.title}\x1f{record.content}")
+        for faq_id in faq_ids:
+            record = snapshot.faqs.get(faq_id)
+            if record is None:
+                return None
+            parts.append(f"f{faq_id}:{record.question}\x1f{record.answer}")
+        return _digest("\x1e".join(parts))
+
+    def _config_stamp(self, snapshot, intent: str) -> str:
+        stamp = self._config_stamps.get((snapshot.version, intent))
+        if stamp is None:
+            values = bot_settings.current
+            stamp = _digest(repr((
+                snapshot.agents.get(intent), values.response_style, values.max_response_tokens,
+                settings.agent_mode, settings.openai_model
+            )))
+            if len(self._config_stamps) > 64:
+                self._config_stamps.clear()
+            self._config_stamps[(snapshot.version, intent)] = stamp
+        return stamp
+
+    async def _embed(self, message: NormalizedText) -> np.ndarray:
+        return (await self._embedder.embed([" ".join(message.tokens)]))[0]
+
+    async def _remember(self, key: str, message: NormalizedText, reply: CachedReply):
+        if key in self._entries:
+            slot = self._entries[key][2]
+        else:
+            while not self._free_slots:
+                self._forget(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+        self._vectors[slot] = await self._embed(message)
+        self._slot_keys[slot] = key
+        self._numbers[key] = _NUMBER.findall(message.folded)
+        self._entries[key] = (time.monotonic() + self.ttl, reply, slot)
+        self._entries.move_to_end(key)
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        self._numbers.pop(key, None)
+        if entry is not None:
+            slot = entry[2]
+            self._vectors[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+
+# Global cache instance
+response_cache = ResponseCache(
+    max_size=settings.response_cache_size,
+    ttl=settings.response_cache_ttl,
+    threshold=settings.response_cache_threshold
+)
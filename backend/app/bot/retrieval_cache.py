@@ -0,0 +1,96 @@
+"""
+Query-result cache for knowledge/FAQ retrieval on top of RedisCache
+Entries are tagged with the content snapshot version, which every write
+bumps, so stale entries are ignored without scanning keys. A worker only
+stores results once its own indexes reflect the latest version (see
+index_sync.sync_indexes): one still catching up may read entries cached by
+the others but never writes its stale rankings under the new version.
+"""
+from app.config import get_settings
+from app.models.knowledge import Knowledge
+from app.models.faq import FAQ
+from app.bot.knowledge_snapshot import SnapshotStore
+from app.services.settings_service import bot_settings
+from app.utils.cache import cache
+from app.utils.text_processing import NormalizedText, normalize
+from typing import Optional, Tuple, Union
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+# Fields cached per row type (enough to build the agent context)
+CACHED_FIELDS = {
+    "knowledge": ("id", "title", "content", "category"),
+    "faq": ("id", "question", "answer", "category")
+}
+
+MODELS = {
+    "knowledge": Knowledge,
+    "faq": FAQ
+}
+
+
+class RetrievalCache:
+    """Versioned retrieval result cache"""
+
+    VERSION_KEY = SnapshotStore.VERSION_KEY
+    KEY_PREFIX = "retrieval:query"
+
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Snapshot version the local indexes reflect (None while a local
+        # write is indexed but not yet in a snapshot)
+        self.indexed_version: Optional[int] = None
+
+    def make_key(self, kind: str, query: Union[str, NormalizedText], limit: int) -> str:
+        """Cache key from the normalized query (word order, accents and inflection ignored)"""
+        normalized = " ".join(sorted(set(normalize(query).tokens)))
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        mode = f"{settings.retrieval_mode}-{settings.lexical_backend}"
+        if settings.retrieval_mode == "hybrid":
+            # Hybrid rankings depend on the fusion weights (admin settings)
+            values = bot_settings.current
+            mode += f"-{values.retrieval_lexical_weight:g}-{values.retrieval_vector_weight:g}-{values.retrieval_rrf_k:g}"
+        return f"{self.KEY_PREFIX}:{kind}:{mode}:{limit}:{digest}"
+
+    async def lookup(self, kind: str, query: Union[str, NormalizedText], limit: int) -> Tuple[Optional[list], int]:
+        """
+        Look up cached results
+
+        Returns:
+            (rows or None on miss, version to tag a new entry with; None
+            when the local indexes are behind and results must not be stored)
+        """
+        version, entry = await cache.get_many([self.VERSION_KEY, self.make_key(kind, query, limit)])
+        version = int(version or 0)
+
+        if entry and entry.get("version") == version:
+            self.hits += 1
+            model = MODELS[kind]
+            return [model(**row) for row in entry["rows"]], version
+
+        self.misses += 1
+        return None, version if version == self.indexed_version else None
+
+    async def store(self, kind: str, query: Union[str, NormalizedText], limit: int, items: list, version: Optional[int]):
+        """Cache results computed against the given snapshot version"""
+        if version is None:
+            return
+        rows = [
+            {field: getattr(item, field) for field in CACHED_FIELDS[kind]}
+            for item in items
+        ]
+        await cache.set(
+            self.make_key(kind, query, limit),
+            {"version": version, "rows": rows},
+            expire=self.ttl
+        )
+
+
+# Global cache instance
+retrieval_cache = RetrievalCache(ttl=settings.retrieval_cache_ttl)
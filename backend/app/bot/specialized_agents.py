@@ -2,103 +2,171 @@
 Specialized Agents for different intents
 Each agent has specific knowledge and capabilities
 """
-from typing import Dict, List
-from openai import AsyncOpenAI
+from typing import AsyncIterator, Dict, Mapping, Optional, Sequence, Tuple, Union
 from app.config import get_settings
+from app.services.llm_clients import SharedLLMClient
+from app.services.llm_gateway import LLMOverloaded, llm_gateway
+from app.bot.knowledge_snapshot import AgentRecord, snapshot_store
+from app.bot.prompt_builder import Passage, prompt_builder
+from app.utils.tokens import count_tokens
+from app.services.settings_service import BotSettings, SettingsService, bot_settings
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+ERROR_REPLY = "Lo siento, tuve un problema al procesar tu solicitud. ¿Puedes reformular tu pregunta?"
+
+# Contexto fijo de la empresa, común a todos los agentes
+COMPANY_CONTEXT = """Company: IA Club - Club de inteligencias artificiales que vende paquetes de IA
+Product: MEGAPACK - Más de 40 IAs premium (ChatGPT Plus, Claude, Sora 2, Veo 3.1, Midjourney, etc.)"""
+
+
 class BaseAgent:
     """Base class for specialized agents"""
     
-    def __init__(self, name: str, role: str, instructions: str):
+    client = SharedLLMClient()
+    
+    RESPONSE_INSTRUCTION = (
+        "Respond naturally, helpfully, and stay within your specialization. "
+        "If the question is outside your area, politely redirect to appropriate support."
+    )
+    
+    def __init__(
+        self,
+        name: str,
+        role: str,
+        instructions: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        settings_service: SettingsService = None
+    ):
         self.name = name
         self.role = role
         self.instructions = instructions
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.temperature = temperature
+        self.max_tokens = max_tokens  # Upper bound from AgentConfig (None = admin setting only)
+        self.settings_service = settings_service or bot_settings
+        self.prompt_builder = prompt_builder
+        # Parte fija del system prompt, compilada una sola vez
+        self.prompt_header = self._compile_header()
+    
+    @classmethod
+    def from_record(cls, record: AgentRecord, **kwargs) -> "BaseAgent":
+        """Agent configured by an AgentConfig row"""
+        return cls(record.name, record.role, record.instructions, record.temperature, record.max_tokens, **kwargs)
     
     async def respond(
         self,
         message: str,
         context: Dict = None,
-        knowledge: List[str] = None
+        knowledge: Sequence[Union[str, Passage]] = None
     ) -> str:
-        """Generate response using agent's specialization"""
+        """
+        Generate response using agent's specialization
         
-        # Build knowledge context
-        knowledge_context = ""
-        if knowledge:
-            knowledge_context = "\n\nKnowledge Base:\n" + "\n".join([
-                f"- {k}" for k in knowledge[:5]  # Top 5 relevant items
-            ])
+        Raises:
+            LLMOverloaded: The LLM queue is over its latency budget
+        """
+        try:
+            request = self._completion_request(message, context, knowledge)
+            response = await llm_gateway.call(
+                lambda: self.client.chat.completions.create(**request),
+                kind="agent", agent=self.name, model=request["model"]
+            )
+            
+            return response.choices[0].message.content.strip()
         
-        # Build conversation context
-        conversation_context = ""
-        if context and context.get("history"):
-            recent = context["history"][-3:]
-            conversation_context = "\n".join([
-                f"{'User' if msg.get('role') == 'user' else 'Assistant'}: {msg.get('content', '')}"
-                for msg in recent
-            ])
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Agent {self.name} error: {e}")
+            return ERROR_REPLY
+    
+    async def respond_stream(
+        self,
+        message: str,
+        context: Dict = None,
+        knowledge: Sequence[Union[str, Passage]] = None
+    ) -> AsyncIterator[str]:
+        """Same as respond(), yielding the reply in chunks as it is generated"""
+        emitted = False
+        try:
+            request = self._completion_request(message, context, knowledge)
+            # The slot is held until the whole reply has been streamed
+            async with llm_gateway.stream(
+                lambda: self.client.chat.completions.create(**request, stream=True),
+                kind="agent_stream", agent=self.name, model=request["model"],
+                prompt_tokens=sum(count_tokens(m["content"]) for m in request["messages"])
+            ) as stream:
+                async for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if not emitted:
+                        text = text.lstrip()
+                        if not text:
+                            continue
+                    emitted = True
+                    yield text
         
-        # Obtener configuración de longitud de respuestas
-        from app.models.settings import Settings
-        response_style_setting = self.db.query(Settings).filter_by(key="response_style").first()
-        response_style = response_style_setting.value if response_style_setting else "concisa"
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Agent {self.name} stream error: {e}")
+            if not emitted:
+                yield ERROR_REPLY
+    
+    def _completion_request(
+        self,
+        message: str,
+        context: Optional[Dict],
+        knowledge: Optional[Sequence[Union[str, Passage]]]
+    ) -> Dict:
+        """Chat completion arguments for a reply"""
+        # Longitud de respuestas y max_tokens según configuración
+        length_instruction, max_tokens = response_preferences(self.settings_service.current)
+        if self.max_tokens:
+            max_tokens = min(max_tokens, self.max_tokens)
         
-        # Configurar instrucciones de longitud según el estilo
-        style_instructions = {
-            "concisa": "IMPORTANTE: Sé MUY BREVE y DIRECTO. Máximo 2-3 oraciones. Ve al grano.",
-            "normal": "Sé claro y conciso. Respuestas de longitud media.",
-            "detallada": "Proporciona respuestas completas y detalladas cuando sea necesario."
+        return {
+            "model": settings.openai_model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt(knowledge, context, length_instruction)},
+                {"role": "user", "content": message}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": max_tokens
         }
-        
-        length_instruction = style_instructions.get(response_style, style_instructions["concisa"])
-        
-        system_prompt = f"""{self.instructions}
+    
+    def system_prompt(
+        self,
+        knowledge: Optional[Sequence[Union[str, Passage]]],
+        context: Optional[Dict],
+        length_instruction: str
+    ) -> str:
+        """Precompiled header plus the per-turn sections, within the prompt token budget"""
+        prompt = self.prompt_builder.build(
+            self.prompt_header, knowledge, context, length_instruction, self.RESPONSE_INSTRUCTION
+        )
+        if prompt.passages_dropped:
+            logger.debug(f"Agent {self.name}: {prompt.passages_dropped} passage(s) over the prompt budget")
+        return prompt.text
+    
+    def _compile_header(self) -> str:
+        return f"""{self.instructions}
 
 You are {self.name}, specialized in {self.role}.
 
-Company: IA Club - Club de inteligencias artificiales que vende paquetes de IA
-Product: MEGAPACK - Más de 40 IAs premium (ChatGPT Plus, Claude, Sora 2, Veo 3.1, Midjourney, etc.)
-{knowledge_context}
-
-Previous conversation:
-{conversation_context if conversation_context else 'Starting new conversation'}
-
-{length_instruction}
-
-Respond naturally, helpfully, and stay within your specialization. If the question is outside your area, politely redirect to appropriate support."""
-
-        # Obtener max_tokens según configuración
-        max_tokens_setting = self.db.query(Settings).filter_by(key="max_response_tokens").first()
-        max_tokens = int(max_tokens_setting.value) if max_tokens_setting else 150
-        
-        try:
-            response = await self.client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.error(f"Agent {self.name} error: {e}")
-            return "Lo siento, tuve un problema al procesar tu solicitud. ¿Puedes reformular tu pregunta?"
+{COMPANY_CONTEXT}"""
 
 
 class SalesAgent(BaseAgent):
     """Agent specialized in sales, products, pricing"""
     
-    def __init__(self):
+    def __init__(self, **kwargs):
         super().__init__(
             name="Sales Agent",
             role="sales and product inquiries",
@@ -112,14 +180,15 @@ Your expertise:
 - Personal accounts, unlimited usage
 
 Always be friendly, professional, and help customers find the best solution for their needs.
-Provide clear pricing when available, suggest options, and guide toward purchase."""
+Provide clear pricing when available, suggest options, and guide toward purchase.""",
+            **kwargs
         )
 
 
 class DesignAgent(BaseAgent):
     """Agent specialized in design and customization"""
     
-    def __init__(self):
+    def __init__(self, **kwargs):
         super().__init__(
             name="Design Agent",
             role="creative AI assistance",
@@ -132,14 +201,15 @@ Your expertise:
 - Creative project assistance
 - AI recommendations based on customer needs
 
-Help customers leverage the creative AIs in the MEGAPACK. Be enthusiastic and explain each AI's capabilities clearly."""
+Help customers leverage the creative AIs in the MEGAPACK. Be enthusiastic and explain each AI's capabilities clearly.""",
+            **kwargs
         )
 
 
 class OrderTrackingAgent(BaseAgent):
     """Agent specialized in order tracking and status"""
     
-    def __init__(self):
+    def __init__(self, **kwargs):
         super().__init__(
             name="Order Tracking Agent",
             role="order status and delivery tracking",
@@ -152,14 +222,15 @@ Your expertise:
 - Order tracking
 - Payment confirmation
 
-Be reassuring, provide clear timelines, and keep customers informed about their order progress."""
+Be reassuring, provide clear timelines, and keep customers informed about their order progress.""",
+            **kwargs
         )
 
 
 class SupportAgent(BaseAgent):
     """Agent specialized in support and problem resolution"""
     
-    def __init__(self):
+    def __init__(self, **kwargs):
         super().__init__(
             name="Support Agent",
             role="technical support and issue resolution",
@@ -172,14 +243,15 @@ Your expertise:
 - AI feature questions
 - Complaint handling and problem solving
 
-Be empathetic, solution-oriented, and professional. Always try to resolve issues or escalate appropriately."""
+Be empathetic, solution-oriented, and professional. Always try to resolve issues or escalate appropriately.""",
+            **kwargs
         )
 
 
 class GeneralAgent(BaseAgent):
     """General purpose agent for misc queries"""
     
-    def __init__(self):
+    def __init__(self, **kwargs):
         super().__init__(
             name="General Agent",
             role="general assistance",
@@ -191,11 +263,12 @@ Your role:
 - Route complex queries to specialists
 - Handle greetings and small talk
 
-Be friendly, helpful, and guide users to the right specialist when needed."""
+Be friendly, helpful, and guide users to the right specialist when needed.""",
+            **kwargs
         )
 
 
-# Agent factory
+# Built-in agents, used for intents without an AgentConfig row
 AGENT_MAP = {
     "sales": SalesAgent,
     "design": DesignAgent,
@@ -205,7 +278,218 @@ AGENT_MAP = {
 }
 
 
+# Instrucciones de longitud según el estilo configurado
+STYLE_INSTRUCTIONS = {
+    "concisa": "IMPORTANTE: Sé MUY BREVE y DIRECTO. Máximo 2-3 oraciones. Ve al grano.",
+    "normal": "Sé claro y conciso. Respuestas de longitud media.",
+    "detallada": "Proporciona respuestas completas y detalladas cuando sea necesario."
+}
+
+
+def response_preferences(values: BotSettings) -> Tuple[str, int]:
+    """Length instruction and max_tokens from the admin settings"""
+    instruction = STYLE_INSTRUCTIONS.get(values.response_style, STYLE_INSTRUCTIONS["concisa"])
+    return instruction, values.max_response_tokens
+
+
+def compact_instructions(instructions: str) -> str:
+    """One-line form of an agent's instructions (bullets joined with ';')"""
+    parts = []
+    for line in instructions.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("-") and parts and parts[-1].endswith((":", ";")):
+            parts[-1] += f" {line.lstrip('- ').strip()};"
+        elif line.startswith("-"):
+            parts.append(f"{line.lstrip('- ').strip()};")
+        else:
+            if parts and parts[-1].endswith(";"):
+                parts[-1] = parts[-1][:-1] + "."
+            parts.append(line)
+    text = " ".join(parts)
+    return text[:-1] + "." if text.endswith(";") else text
+
+
+class CombinedAgent(BaseAgent):
+    """
+    Classifies the intent and writes the reply in a single JSON-mode request
+    Used when settings.agent_mode is "combined": one LLM round-trip per turn
+    instead of classification followed by a specialized agent
+    """
+    
+    # Extra completion tokens for the JSON envelope around the reply
+    ENVELOPE_TOKENS = 60
+    
+    def __init__(self, agents: Dict[str, BaseAgent], **kwargs):
+        """
+        Args:
+            agents: Agent per intent whose guidelines are merged into the prompt
+        """
+        from app.bot.intent_classifier import IntentClassifier
+        
+        self.intents = IntentClassifier.INTENTS
+        guidelines = []
+        for intent, description in self.intents.items():
+            agent = agents.get(intent)
+            if agent is None:
+                # Agente desactivado: esas consultas las responde el agente general
+                guidelines.append(f"- {intent}: {description}. Answer as the general assistant.")
+                continue
+            guidelines.append(f"- {intent} ({agent.name}): {description}. {compact_instructions(agent.instructions)}")
+        
+        intent_names = ", ".join(self.intents)
+        self.RESPONSE_INSTRUCTION = (
+            "Respond ONLY with valid JSON:\n"
+            f'{{"intent": "one of {intent_names}", "confidence": 0.0-1.0, '
+            '"response": "your reply to the customer"}'
+        )
+        super().__init__(
+            name="Combined Agent",
+            role="intent routing and customer replies",
+            instructions="You are the customer assistant of IA Club. First decide which intent the "
+                         "current message has, then answer it following that intent's guidelines.\n\n"
+                         "Intents and guidelines:\n" + "\n".join(guidelines),
+            **kwargs
+        )
+    
+    def _compile_header(self) -> str:
+        return f"""{self.instructions}
+
+{COMPANY_CONTEXT}"""
+    
+    async def respond_with_intent(
+        self,
+        message: str,
+        context: Dict = None,
+        knowledge: Sequence[Union[str, Passage]] = None
+    ) -> Dict:
+        """
+        Classify and answer in one request
+        
+        Returns:
+            {"intent": "sales", "confidence": 0.9, "response": "..."}
+        
+        Raises:
+            LLMOverloaded: The LLM queue is over its latency budget
+        """
+        request = self._completion_request(message, context, knowledge)
+        request["max_tokens"] += self.ENVELOPE_TOKENS
+        
+        try:
+            response = await llm_gateway.call(lambda: self.client.chat.completions.create(
+                **request,
+                response_format={"type": "json_object"}
+            ), kind="combined", agent=self.name, model=request["model"])
+            result = json.loads(response.choices[0].message.content)
+            reply = str(result.get("response") or "").strip()
+            if not reply:
+                raise ValueError("Empty response field")
+            
+            intent = result.get("intent")
+            return {
+                "intent": intent if intent in self.intents else "general",
+                "confidence": float(result.get("confidence") or 0.5),
+                "response": reply,
+                "valid_intent": intent in self.intents
+            }
+        
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Agent {self.name} error: {e}")
+            return {
+                "intent": "general",
+                "confidence": 0.0,
+                "response": ERROR_REPLY,
+                "valid_intent": False
+            }
+
+
+class AgentRegistry:
+    """
+    Agents materialized from the AgentConfig rows in the content snapshot
+    Rebuilt only when the snapshot version changes and its agent configs
+    differ from the ones the current agents were built from, so admin edits
+    apply without a restart and without a database read per message.
+    Intents without an active AgentConfig row use the built-in agents.
+    """
+    
+    def __init__(self, settings_service: SettingsService = None):
+        self.settings_service = settings_service or bot_settings
+        self._version: Optional[int] = None  # Snapshot version last checked
+        self._configs: Optional[Mapping[str, AgentRecord]] = None
+        self._agents: Dict[str, BaseAgent] = {}
+        self._sources: Dict[str, str] = {}
+        self._combined: Optional[CombinedAgent] = None
+        self.builds = 0
+    
+    def get(self, intent: str) -> BaseAgent:
+        """Agent for an intent (general agent when unknown or inactive)"""
+        agents = self._refresh()
+        return agents.get(intent) or agents["general"]
+    
+    def combined(self) -> CombinedAgent:
+        """Combined agent built from the current agents"""
+        agents = self._refresh()
+        combined = self._combined
+        if combined is None:
+            combined = self._combined = CombinedAgent(agents, settings_service=self.settings_service)
+        return combined
+    
+    def stats(self) -> Dict:
+        self._refresh()
+        return {
+            "snapshot_version": self._version,
+            "builds": self.builds,
+            "agents": {
+                agent_type: {"name": agent.name, "source": self._sources[agent_type]}
+                for agent_type, agent in self._agents.items()
+            }
+        }
+    
+    def _refresh(self) -> Dict[str, BaseAgent]:
+        snapshot = snapshot_store.current
+        version = snapshot.version if snapshot else None
+        if self._agents and version == self._version:
+            return self._agents
+        
+        configs = snapshot.agents if snapshot else {}
+        if not self._agents or dict(configs) != self._configs:
+            self._build(configs)
+        self._version = version
+        return self._agents
+    
+    def _build(self, configs: Mapping[str, AgentRecord]):
+        agents = {
+            agent_type: agent_class(settings_service=self.settings_service)
+            for agent_type, agent_class in AGENT_MAP.items()
+        }
+        sources = dict.fromkeys(agents, "default")
+        for agent_type, record in configs.items():
+            if record.is_active:
+                agents[agent_type] = BaseAgent.from_record(record, settings_service=self.settings_service)
+                sources[agent_type] = "config"
+            elif agent_type != "general":
+                agents.pop(agent_type, None)
+                sources.pop(agent_type, None)
+        
+        # Se reemplazan los diccionarios completos; las peticiones en curso conservan su agente
+        self._agents, self._sources, self._combined = agents, sources, None
+        self._configs = dict(configs)
+        self.builds += 1
+        logger.info(f"Agent registry built: {', '.join(f'{t} ({s})' for t, s in sources.items())}")
+
+
+# Global agent registry
+agent_registry = AgentRegistry(bot_settings)
+
+
 def get_agent(intent: str) -> BaseAgent:
     """Get appropriate agent for intent"""
-    agent_class = AGENT_MAP.get(intent, GeneralAgent)
-    return agent_class()
+    return agent_registry.get(intent)
+
+
+def get_combined_agent() -> CombinedAgent:
+    """Shared combined agent (its prompt is assembled once per agent configuration)"""
+    return agent_registry.combined()
@@ -1,12 +1,23 @@
 from sqlalchemy.orm import Session
-from app.models.message_template import MessageTemplate
+from app.models.message_template import MessageTemplate, normalize_template
 from app.services.chatwoot_service import chatwoot_service
-from typing import Optional, List
+from app.bot.knowledge_snapshot import snapshot_store
+from app.utils.text_processing import NormalizedText, normalize
+from typing import Optional, List, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def contains_phrase(tokens: List[str], phrase: List[str]) -> bool:
+    """Whether phrase occurs as a contiguous run of tokens"""
+    phrase = tuple(phrase)
+    size = len(phrase)
+    if not size or size > len(tokens):
+        return False
+    return any(tuple(tokens[i:i + size]) == phrase for i in range(len(tokens) - size + 1))
+
+
 class TemplateManager:
     """
     Manager for sending predefined message templates
@@ -122,32 +133,46 @@ class TemplateManager:
                 "error": str(e)
             }
     
-    def find_template_by_keyword(self, message: str) -> Optional[MessageTemplate]:
+    def find_template_by_keyword(self, message: Union[str, NormalizedText]) -> Optional[MessageTemplate]:
         """
         Find a template that matches keywords in the message
+        A keyword matches when it appears in the message ignoring case and
+        accents, or when its stems appear in order ("diseño de logos"
+        matches "quiero diseñar logos", stop words are skipped)
         
         Args:
-            message: User's message
+            message: User's message (raw or already normalized)
         
         Returns:
             MessageTemplate if found, None otherwise
         """
         try:
-            message_lower = message.lower()
+            message = normalize(message)
             
-            # Get all active templates with keywords
-            templates = self.db.query(MessageTemplate).filter(
-                MessageTemplate.is_active == True,
-                MessageTemplate.trigger_keywords.isnot(None)
-            ).all()
+            # Active templates with keywords (from the shared snapshot when built)
+            snapshot = snapshot_store.current
+            if snapshot is not None:
+                templates = snapshot.templates
+            else:
+                templates = self.db.query(MessageTemplate).filter(
+                    MessageTemplate.is_active == True,
+                    MessageTemplate.trigger_keywords.isnot(None)
+                ).all()
             
             # Check each template's keywords
             for template in templates:
-                if template.trigger_keywords:
-                    for keyword in template.trigger_keywords:
-                        if keyword.lower() in message_lower:
-                            logger.info(f"Template '{template.name}' matched by keyword '{keyword}'")
-                            return template
+                if not template.trigger_keywords:
+                    continue
+                
+                folded, stems = template.normalized_text, template.normalized_tokens
+                if stems is None:
+                    normalized = normalize_template(template.trigger_keywords)
+                    folded, stems = normalized["normalized_text"], normalized["normalized_tokens"]
+                
+                for keyword, keyword_stems in zip(folded.split("\n"), stems):
+                    if (keyword and keyword in message.folded) or contains_phrase(message.tokens, keyword_stems):
+                        logger.info(f"Template '{template.name}' matched by keyword '{keyword}'")
+                        return template
             
             return None
         
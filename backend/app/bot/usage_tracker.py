@@ -0,0 +1,131 @@
+"""
+Buffered usage counters for knowledge and FAQs
+Increments are accumulated in memory and flushed periodically with one
+set-based UPDATE per table, keeping writes off the reply path
+"""
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.models.knowledge import Knowledge
+from app.models.faq import FAQ
+from app.bot.knowledge_index import knowledge_index
+from app.utils.database import SessionLocal
+from typing import Dict, List, Optional
+from collections import Counter
+from datetime import datetime
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class UsageTracker:
+    """Accumulates usage increments and flushes them in batches"""
+
+    # Rows per UPDATE statement (keeps the parameter count bounded)
+    BATCH_SIZE = 500
+
+    def __init__(self, flush_interval: int = 10):
+        self.flush_interval = flush_interval
+        self._knowledge: Counter = Counter()
+        self._faqs: Counter = Counter()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> Dict[str, int]:
+        return {"knowledge": len(self._knowledge), "faqs": len(self._faqs)}
+
+    def record(self, knowledge_ids: List[int], faq_ids: List[int]):
+        """Register one use of each knowledge item and FAQ (no I/O)"""
+        with self._lock:
+            self._knowledge.update(knowledge_ids)
+            self._faqs.update(faq_ids)
+
+        for kid in knowledge_ids:
+            knowledge_index.record_usage(kid)
+
+    def flush(self) -> int:
+        """
+        Write pending increments to the database
+
+        Returns:
+            Number of rows updated
+        """
+        with self._lock:
+            knowledge, faqs = self._knowledge, self._faqs
+            self._knowledge, self._faqs = Counter(), Counter()
+
+        if not knowledge and not faqs:
+            return 0
+
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            self._apply(db, Knowledge.__tablename__, knowledge, now)
+            self._apply(db, FAQ.__tablename__, faqs)
+            db.commit()
+            logger.info(f"Flushed usage stats: {len(knowledge)} knowledge, {len(faqs)} FAQs")
+            return len(knowledge) + len(faqs)
+
+        except Exception as e:
+            logger.error(f"Error flushing usage stats: {e}")
+            db.rollback()
+            # Keep the increments for the next attempt
+            with self._lock:
+                self._knowledge.update(knowledge)
+                self._faqs.update(faqs)
+            return 0
+
+        finally:
+            db.close()
+
+    def _apply(self, db: Session, table: str, counts: Counter, last_used: datetime = None):
+        """UPDATE ... FROM (SELECT ... UNION ALL ...) with one row per id"""
+        items = list(counts.items())
+        for start in range(0, len(items), self.BATCH_SIZE):
+            batch = items[start:start + self.BATCH_SIZE]
+            params = {}
+            rows = []
+            for i, (row_id, increment) in enumerate(batch):
+                rows.append(f"SELECT CAST(:id_{i} AS INTEGER) AS id, CAST(:n_{i} AS INTEGER) AS n")
+                params[f"id_{i}"] = row_id
+                params[f"n_{i}"] = increment
+
+            assignments = f"times_used = COALESCE({table}.times_used, 0) + increments.n"
+            if last_used is not None:
+                assignments += ", last_used_at = :last_used"
+                params["last_used"] = last_used
+
+            db.execute(text(
+                f"UPDATE {table} SET {assignments} "
+                f"FROM ({' UNION ALL '.join(rows)}) AS increments "
+                f"WHERE {table}.id = increments.id"
+            ), params)
+
+    def start(self):
+        """Start the periodic flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.error(f"Usage flush loop error: {e}")
+
+
+# Global tracker instance
+usage_tracker = UsageTracker(flush_interval=settings.usage_flush_interval)
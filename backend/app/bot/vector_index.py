@@ -0,0 +1,255 @@
+"""
+Semantic retrieval with a vectorized NumPy index
+Embeddings are computed once per row (keyed by content hash) and stored
+in a compact matrix that is queried with a single matrix-vector product
+"""
+from app.config import get_settings
+from app.services.openai_service import openai_service
+from app.services.llm_gateway import Priority, llm_priority
+from app.utils.text_processing import fold_accents, tokenize
+from typing import Dict, List, Tuple
+import numpy as np
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def content_hash(text: str) -> str:
+    """Stable hash used to reuse embeddings of unchanged rows"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def knowledge_text(knowledge) -> str:
+    """Text that represents a Knowledge row in the vector space"""
+    keywords = " ".join(str(k) for k in (knowledge.keywords or []))
+    return f"{knowledge.title or ''}\n{keywords}\n{knowledge.content or ''}"
+
+
+def faq_text(faq) -> str:
+    """Text that represents a FAQ row in the vector space"""
+    variations = "\n".join(str(v) for v in (faq.question_variations or []))
+    return f"{faq.question or ''}\n{variations}\n{faq.answer or ''}"
+
+
+class LocalEmbedder:
+    """
+    Deterministic offline embedding stand-in
+    Feature hashing of tokens and character trigrams into a fixed-size
+    vector, so tests and local runs need no network access
+    """
+
+    name = "local"
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dimensions] += sign * weight
+        return _normalize(matrix)
+
+    def _features(self, text: str):
+        for token in tokenize(text):
+            yield token, 1.0
+        folded = f" {fold_accents(text)} "
+        for i in range(len(folded) - 2):
+            trigram = folded[i:i + 3]
+            if trigram.strip():
+                yield f"#{trigram}", 0.3
+
+
+class OpenAIEmbedder:
+    """Embeddings from OpenAIService.generate_embeddings"""
+
+    name = "openai"
+    BATCH_SIZE = 256
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            vectors.extend(await openai_service.generate_embeddings(texts[start:start + self.BATCH_SIZE]))
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_embedder():
+    """Embedding backend selected by configuration"""
+    if settings.embedding_backend == "local":
+        return LocalEmbedder(settings.embedding_dimensions)
+    return OpenAIEmbedder()
+
+
+class VectorIndex:
+    """
+    Dense vector index over one table (rows are L2-normalized)
+
+    Args:
+        name: Index name (also names the embedding cache file)
+        text_builder: Row -> text to embed
+        embedder: Defaults to the configured backend (see get_embedder)
+        min_similarity: Rows less similar to the query are never returned
+            (defaults to settings.retrieval_min_similarity)
+    """
+
+    def __init__(self, name: str, text_builder, embedder=None, min_similarity: float = None):
+        self.name = name
+        self.text_builder = text_builder
+        self.embedder = embedder or get_embedder()
+        self.min_similarity = settings.retrieval_min_similarity if min_similarity is None else min_similarity
+        self.dtype = np.float16 if settings.embedding_dtype == "float16" else np.float32
+        self._matrix = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+        self._cache: Dict[str, np.ndarray] = {}
+        self._lock = threading.RLock()
+        self.is_built = False
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    async def build(self, items: list):
+        """Rebuild the index from a list of ORM rows"""
+        hashes, vectors = await self._embed_items(items)
+        with self._lock:
+            # Drop embeddings of rows that no longer exist or changed
+            self._cache = {h: self._cache[h] for h in hashes}
+            self._rows = {}
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._matrix = None
+            self._append(items, vectors)
+            self.is_built = True
+        logger.info(f"Vector index '{self.name}' built: {len(items)} rows")
+
+    async def upsert(self, items: list):
+        """Add or replace rows (inactive rows are removed)"""
+        active = [item for item in items if item.is_active]
+        _, vectors = await self._embed_items(active)
+        with self._lock:
+            for item in items:
+                self._remove(item.id)
+            self._append(active, vectors)
+
+    def remove(self, row_id: int):
+        """Remove a row from the index"""
+        with self._lock:
+            self._remove(row_id)
+
+    async def search(self, query: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        Rank rows by cosine similarity to the query
+
+        Returns:
+            List of (row_id, similarity) sorted by similarity desc, only rows
+            at or above min_similarity (may be empty)
+        """
+        if not self._rows or not query.strip():
+            return []
+
+        query_vector = (await self.embedder.embed([query]))[0].astype(self.dtype)
+        with self._lock:
+            count = len(self._rows)
+            scores = (self._matrix[:count] @ query_vector).astype(np.float32)
+            ids = self._ids[:count]
+
+        candidates = np.flatnonzero(scores >= self.min_similarity)
+        limit = min(limit, len(candidates))
+        if not limit:
+            return []
+        top = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    async def _embed_items(self, items: list) -> Tuple[List[str], List[np.ndarray]]:
+        texts = [self.text_builder(item) for item in items]
+        hashes = [content_hash(text) for text in texts]
+
+        missing = {h: t for h, t in zip(hashes, texts) if h not in self._cache}
+        if missing:
+            # Bulk embedding waits behind customer turns in the LLM queue
+            with llm_priority(Priority.BACKGROUND):
+                embedded = await self.embedder.embed(list(missing.values()))
+            for h, vector in zip(missing.keys(), embedded):
+                self._cache[h] = vector.astype(self.dtype)
+
+        return hashes, [self._cache[h] for h in hashes]
+
+    def _append(self, items: list, vectors: List[np.ndarray]):
+        if not items:
+            return
+
+        count = len(self._rows)
+        needed = count + len(items)
+        dimensions = len(vectors[0])
+        if self._matrix is None or self._matrix.shape[0] < needed:
+            capacity = max(needed, 2 * (0 if self._matrix is None else self._matrix.shape[0]), 64)
+            matrix = np.zeros((capacity, dimensions), dtype=self.dtype)
+            ids = np.zeros(capacity, dtype=np.int64)
+            if self._matrix is not None:
+                matrix[:count] = self._matrix[:count]
+                ids[:count] = self._ids[:count]
+            self._matrix, self._ids = matrix, ids
+
+        for offset, (item, vector) in enumerate(zip(items, vectors)):
+            row = count + offset
+            self._matrix[row] = vector
+            self._ids[row] = item.id
+            self._rows[item.id] = row
+
+    def _remove(self, row_id: int):
+        row = self._rows.pop(row_id, None)
+        if row is None:
+            return
+
+        # Move the last row into the freed slot to keep the matrix dense
+        last = len(self._rows)
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+
+    @property
+    def cache_file(self) -> str:
+        return f"{self.name}_{self.embedder.name}.npz"
+
+    def save_cache(self, path: str):
+        """Persist computed embeddings so restarts do not recompute them"""
+        with self._lock:
+            if not self._cache:
+                return
+            hashes = list(self._cache.keys())
+            np.savez_compressed(
+                path,
+                hashes=np.array(hashes),
+                vectors=np.stack([self._cache[h] for h in hashes])
+            )
+
+    def load_cache(self, path: str):
+        """Load embeddings persisted by save_cache"""
+        try:
+            data = np.load(path)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for h, vector in zip(data["hashes"], data["vectors"]):
+                self._cache[str(h)] = vector.astype(self.dtype)
+        logger.info(f"Loaded {len(data['hashes'])} cached embeddings for '{self.name}'")
+
+
+# Global index instances
+knowledge_vectors = VectorIndex("knowledge", knowledge_text)
+faq_vectors = VectorIndex("faq", faq_text)
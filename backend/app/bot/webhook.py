@@ -1,8 +1,8 @@
 from typing import List, Dict, Optional
-from fastapi import APIRouter, Request, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.utils.database import get_db
+from fastapi import APIRouter, Request, HTTPException
+from app.utils.database import SessionLocal
 from app.bot.intelligent_agent import IntelligentAgent
+from app.bot.job_queue import job_queue
 from app.services.chatwoot_service import chatwoot_service
 from app.models.conversation import Conversation
 from datetime import datetime
@@ -12,42 +12,89 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+FAILURE_REPLY = "Disculpa, estoy teniendo problemas técnicos. Un agente humano te atenderá pronto."
+
+
 @router.post("/webhook/chatwoot")
-async def chatwoot_webhook(
-    request: Request,
-    db: Session = Depends(get_db)
-):
+async def chatwoot_webhook(request: Request):
     """
     Webhook endpoint to receive messages from Chatwoot
     
     Chatwoot sends webhooks for various events.
-    We only process incoming messages (from customers).
+    We only process incoming messages (from customers): the message is
+    queued and answered by the job queue workers, so Chatwoot gets its
+    response right away and redeliveries of the same message are ignored.
+    Messages of one conversation are answered one at a time, in order.
     """
     try:
         data = await request.json()
-        
-        event = data.get('event')
-        logger.info(f"Webhook received: {event}")
-        
-        # Only process incoming messages
-        if event != 'message_created':
-            return {"status": "ignored", "reason": "not message_created event"}
-        
-        message_type = data.get('message_type')
-        if message_type != 'incoming':
-            return {"status": "ignored", "reason": "not incoming message"}
-        
-        # Extract data
-        conversation_id = data.get('conversation', {}).get('id')
-        user_message = data.get('content', '')
-        sender = data.get('sender', {})
-        
-        if not conversation_id or not user_message:
-            logger.warning("Missing conversation_id or message content")
-            return {"status": "error", "reason": "missing data"}
-        
-        logger.info(f"Processing message from conversation {conversation_id}")
-        
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    
+    event = data.get('event')
+    logger.info(f"Webhook received: {event}")
+    
+    # Only process incoming messages
+    if event != 'message_created':
+        return {"status": "ignored", "reason": "not message_created event"}
+    
+    message_type = data.get('message_type')
+    if message_type != 'incoming':
+        return {"status": "ignored", "reason": "not incoming message"}
+    
+    # Extract data
+    conversation_id = (data.get('conversation') or {}).get('id')
+    user_message = data.get('content') or ''
+    sender = data.get('sender') or {}
+    message_id = data.get('id')
+    
+    if not conversation_id or not user_message:
+        logger.warning("Missing conversation_id or message content")
+        return {"status": "error", "reason": "missing data"}
+    
+    try:
+        job_id = await job_queue.enqueue(
+            "chatwoot_message",
+            {
+                "conversation_id": conversation_id,
+                "message_id": message_id,
+                "content": user_message,
+                "sender": {"name": sender.get('name'), "email": sender.get('email')}
+            },
+            dedupe_key=f"chatwoot:{message_id}" if message_id else None,
+            partition=conversation_id
+        )
+    except Exception as e:
+        logger.error(f"Error queueing webhook: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if job_id is None:
+        return {"status": "ignored", "reason": "duplicate message", "conversation_id": conversation_id}
+    
+    logger.info(f"Queued message from conversation {conversation_id} (job {job_id})")
+    return {"status": "queued", "conversation_id": conversation_id, "job_id": job_id}
+
+
+async def process_chatwoot_message(job: Dict):
+    """
+    Answer a queued Chatwoot message (job queue handler)
+    Raising before the reply is sent makes the job queue retry it;
+    once it is sent, errors only affect the statistics. The reply is saved
+    as job progress before sending, so a retry resends it without running
+    the turn (and its LLM calls) again, and a reply already sent is not
+    sent twice.
+    """
+    conversation_id = job["conversation_id"]
+    sender = job.get("sender") or {}
+    progress_key = f"chatwoot:{job['message_id']}" if job.get("message_id") else None
+    reply = await job_queue.get_progress(progress_key) if progress_key else None
+    if reply is not None and reply.get("sent"):
+        logger.info(f"Message {job['message_id']} of conversation {conversation_id} already answered")
+        return
+    logger.info(f"Processing message from conversation {conversation_id}")
+    
+    db = SessionLocal()
+    try:
         # Get or create conversation record
         conversation = db.query(Conversation).filter(
             Conversation.chatwoot_conversation_id == conversation_id
@@ -67,64 +114,68 @@ async def chatwoot_webhook(
             db.commit()
             db.refresh(conversation)
         
-        # Get conversation history from Chatwoot
-        history = await get_conversation_history(conversation_id)
-        
-        # Process with intelligent agent
-        agent = IntelligentAgent(db)
-        result = await agent.process_message(
-            message=user_message,
-            history=history,
-            conversation_id=conversation_id
-        )
+        if reply is None:
+            # Get conversation history from Chatwoot
+            history = await get_conversation_history(conversation_id)
+            
+            # Process with intelligent agent
+            agent = IntelligentAgent(db)
+            result = await agent.process_message(
+                message=job["content"],
+                history=history,
+                conversation_id=conversation_id
+            )
+            reply = {
+                "response": result["response"],
+                "confidence": result["confidence"],
+                "knowledge_ids": [k["id"] for k in result["knowledge_used"]],
+                "faq_ids": [f["id"] for f in result["faqs_used"]]
+            }
+            if progress_key:
+                await job_queue.set_progress(progress_key, reply)
         
         # Send response back to Chatwoot
         await chatwoot_service.send_message(
             conversation_id=conversation_id,
-            content=result["response"]
+            content=reply["response"]
         )
+        if progress_key:
+            await job_queue.set_progress(progress_key, {**reply, "sent": True})
         
-        # Update conversation statistics
-        conversation.total_messages += 2  # User message + Bot response
-        conversation.bot_messages += 1
-        
-        # Track knowledge usage
-        knowledge_ids = [k["id"] for k in result["knowledge_used"]]
-        faq_ids = [f["id"] for f in result["faqs_used"]]
-        
-        conversation.knowledge_ids_used = list(set(
-            (conversation.knowledge_ids_used or []) + knowledge_ids
-        ))
-        conversation.faq_ids_used = list(set(
-            (conversation.faq_ids_used or []) + faq_ids
-        ))
-        
-        db.commit()
-        
-        logger.info(f"Response sent to conversation {conversation_id} (confidence: {result['confidence']})")
-        
-        return {
-            "status": "success",
-            "conversation_id": conversation_id,
-            "confidence": result["confidence"],
-            "knowledge_used": len(result["knowledge_used"]),
-            "faqs_used": len(result["faqs_used"])
-        }
-    
-    except Exception as e:
-        logger.error(f"Error processing webhook: {e}", exc_info=True)
-        
-        # Try to send error message to user
         try:
-            if conversation_id:
-                await chatwoot_service.send_message(
-                    conversation_id=conversation_id,
-                    content="Disculpa, estoy teniendo problemas técnicos. Un agente humano te atenderá pronto."
-                )
-        except:
-            pass
+            # Update conversation statistics
+            conversation.total_messages += 2  # User message + Bot response
+            conversation.bot_messages += 1
+            
+            # Track knowledge usage
+            knowledge_ids = reply["knowledge_ids"]
+            faq_ids = reply["faq_ids"]
+            
+            conversation.knowledge_ids_used = list(set(
+                (conversation.knowledge_ids_used or []) + knowledge_ids
+            ))
+            conversation.faq_ids_used = list(set(
+                (conversation.faq_ids_used or []) + faq_ids
+            ))
+            
+            db.commit()
+        except Exception as e:
+            # The reply is already out: retrying would send it twice
+            logger.error(f"Error updating conversation {conversation_id} stats: {e}")
+            db.rollback()
         
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.info(f"Response sent to conversation {conversation_id} (confidence: {reply['confidence']})")
+    
+    finally:
+        db.close()
+
+
+async def notify_chatwoot_failure(job: Dict, error: Exception):
+    """Tell the customer a human will follow up once every attempt failed"""
+    await chatwoot_service.send_message(
+        conversation_id=job["conversation_id"],
+        content=FAILURE_REPLY
+    )
 
 
 async def get_conversation_history(conversation_id: int) -> List[Dict]:
@@ -170,3 +221,6 @@ async def get_conversation_history(conversation_id: int) -> List[Dict]:
 async def webhook_health():
     """Health check endpoint for webhook"""
     return {"status": "ok", "webhook": "chatwoot"}
+
+
+job_queue.register("chatwoot_message", process_chatwoot_message, on_failure=notify_chatwoot_failure)
@@ -1,3 +1,4 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 from typing import List
@@ -19,11 +20,80 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379/0"
     
     # OpenAI
-    openai_api_key: str
+    openai_api_key: str = ""  # Required by the openai provider
     openai_model: str = "gpt-4o-mini"
     openai_temperature: float = 0.7
     openai_max_tokens: int = 800
     
+    # LLM provider: openai | openai_compatible (llm_base_url) | fake (offline, deterministic)
+    llm_provider: str = "openai"
+    llm_base_url: str = ""  # OpenAI-compatible server, e.g. http://localhost:8000/v1
+    llm_api_key: str = ""  # Key for llm_base_url (defaults to openai_api_key)
+    fake_llm_latency_distribution: str = "lognormal"  # fixed | uniform | lognormal
+    fake_llm_latency_p50_ms: float = 400.0
+    fake_llm_latency_p95_ms: float = 1200.0
+    fake_llm_completion_tokens: int = 60  # Mean reply length
+    fake_llm_tokens_per_second: float = 80.0  # Streaming pace
+    fake_llm_error_rate: float = 0.0  # Fraction of calls failing with a connection error
+    fake_llm_seed: int = 0
+    
+    # LLM HTTP connection pool (shared by every LLM caller)
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept open
+    llm_http2: bool = True  # Needs the 'h2' package; falls back to HTTP/1.1 without it
+    llm_timeout: float = 60.0  # Seconds per request
+    llm_connect_timeout: float = 5.0
+    
+    # LLM scheduler (priority queue in front of every LLM request)
+    llm_max_concurrency: int = 16  # Requests in flight per worker
+    llm_global_max_concurrency: int = 0  # Across workers via Redis (0 = per-worker limit only)
+    llm_queue_budget_live: float = 10.0  # Seconds a customer turn may wait before answering from templates/FAQs
+    llm_queue_budget_test: float = 20.0  # Admin test bot
+    llm_queue_budget_background: float = 0.0  # Embedding builds (0 = wait as long as needed)
+    llm_turn_budget: float = 25.0  # Seconds of LLM time per customer turn; calls and retries share it
+    llm_call_timeout: float = 20.0  # Seconds per request when the turn budget is not tighter
+    llm_max_retries: int = 2  # Jittered retries on transient errors, only while the budget allows
+    llm_retry_base_delay: float = 0.25  # First backoff in seconds, doubled per retry
+    llm_hedge: bool = True  # Second request for idempotent calls slower than their p95
+    llm_hedge_min_samples: int = 20  # Latency samples per request kind before hedging it
+    llm_telemetry: bool = True  # Record tokens/latency/cost of every call in llm_calls
+    
+    # Retrieval
+    retrieval_mode: str = "keyword"  # keyword | vector | hybrid
+    lexical_backend: str = "memory"  # memory (in-process indexes) | fulltext (database FTS)
+    retrieval_cache_ttl: int = 3600  # Seconds a cached retrieval result lives in Redis
+    retrieval_min_similarity: float = 0.2  # Cosine similarity below which vector matches are dropped
+    usage_flush_interval: int = 10  # Seconds between batched usage counter writes
+    embedding_backend: str = "openai"  # openai | local (deterministic, offline)
+    embedding_dimensions: int = 256  # Only used by the local embedder
+    embedding_dtype: str = "float32"  # float32 | float16
+    embedding_cache_dir: str = ""  # Directory to persist embeddings between restarts
+    snapshot_poll_interval: int = 5  # Seconds between checks for content changes made by other workers
+    
+    # Agents
+    agent_mode: str = "routed"  # routed (classify, then specialized agent) | combined (one LLM call per turn)
+    prompt_token_budget: int = 1600  # System prompt tokens; lowest-ranked knowledge is dropped to fit
+    prompt_history_tokens: int = 300  # Share of the budget for recent conversation
+    prompt_summary_tokens: int = 80  # Share of the budget for the customer summary
+    
+    # Message pipeline (per-stage timeouts in seconds; 0 = no limit)
+    stage_timeout_intent: float = 8.0  # Falls back to "general" when exceeded
+    stage_timeout_search: float = 3.0  # Knowledge/FAQ search; continues without context when exceeded
+    stage_timeout_response: float = 30.0  # Agent reply; the turn fails when exceeded
+    
+    # Response cache (enabled intents: admin setting response_cache_intents)
+    response_cache_size: int = 2000  # Replies kept in process memory (0 disables the cache)
+    response_cache_ttl: int = 3600  # Seconds a cached reply can be reused
+    response_cache_threshold: float = 0.92  # Cosine similarity for near-identical messages
+    
+    # Intent classification
+    intent_local_threshold: float = 0.85  # Local model confidence needed to skip the LLM (>1 disables it)
+    intent_model_path: str = "uploads/intent_model.json"  # Trained by train_intent_model.py
+    intent_log_path: str = "uploads/intent_log.jsonl"  # LLM classifications used as training data ("" disables)
+    intent_cache_size: int = 5000  # Classifications kept in process memory
+    intent_cache_ttl: int = 21600  # Seconds a cached classification stays valid
+    
     # Chatwoot
     chatwoot_url: str = ""
     chatwoot_access_token: str = ""
@@ -31,6 +101,14 @@ class Settings(BaseSettings):
     chatwoot_inbox_id: int = 0
     chatwoot_webhook_secret: str = ""
     
+    # Webhook job queue (Redis stream; in-process queue when Redis is down)
+    job_workers: int = 8  # Messages processed concurrently per worker process
+    job_max_attempts: int = 4  # Attempts before a message gets the fallback reply
+    job_retry_base_delay: float = 2.0  # Seconds before the first retry, doubled per attempt
+    job_timeout: float = 60.0  # Seconds per attempt; unacknowledged jobs are reclaimed after twice this
+    job_dedupe_ttl: int = 3600  # Seconds a Chatwoot message id is remembered to drop redeliveries
+    job_stream_maxlen: int = 10000  # Approximate cap of queued jobs in Redis
+    
     # CORS - En producción usar dominios específicos
     allowed_origins: str = "*"
     
@@ -58,6 +136,17 @@ class Settings(BaseSettings):
     # Logs
     log_level: str = "INFO"
     
+    @model_validator(mode="after")
+    def validate_llm_provider(self):
+        """Fail at startup instead of on the first LLM call"""
+        if self.llm_provider not in ("openai", "openai_compatible", "fake"):
+            raise ValueError(f"Unknown LLM_PROVIDER: {self.llm_provider} (expected openai, openai_compatible or fake)")
+        if self.llm_provider == "openai" and not self.openai_api_key:
+            raise ValueError("LLM_PROVIDER=openai requires OPENAI_API_KEY")
+        if self.llm_provider == "openai_compatible" and not self.llm_base_url:
+            raise ValueError("LLM_PROVIDER=openai_compatible requires LLM_BASE_URL")
+        return self
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,14 +1,21 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings
-from app.utils.database import init_db, get_db
+from app.utils.database import init_db, get_db, SessionLocal
 from app.utils.cache import cache
 from app.utils.logger import logger
 from app.bot.webhook import router as webhook_router
+from app.bot.index_sync import build_indexes
+from app.bot.usage_tracker import usage_tracker
+from app.bot.knowledge_snapshot import snapshot_store
+from app.bot.job_queue import job_queue
+from app.bot.intent_model import classification_log
+from app.services.llm_clients import llm_clients
+from app.services.llm_telemetry import llm_telemetry
 from sqlalchemy.orm import Session
 
 # Import API routers
-from app.api import knowledge, faqs, documents, conversations, test_bot, agents, flows, message_templates, settings as settings_api, auth, chatwoot
+from app.api import knowledge, faqs, documents, conversations, test_bot, agents, flows, message_templates, settings as settings_api, auth, chatwoot, system
 
 settings = get_settings()
 
@@ -53,12 +60,32 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Database initialization error: {e}")
     
-    # Connect to Redis
+    # Connect to Redis (before building the indexes, which invalidate cached retrieval results)
     try:
         await cache.connect()
         logger.info("Redis connected")
     except Exception as e:
         logger.warning(f"Redis connection failed: {e}")
+    
+    # Build in-memory search indexes
+    db = SessionLocal()
+    try:
+        await build_indexes(db)
+    except Exception as e:
+        logger.error(f"Search index build error: {e}")
+    finally:
+        db.close()
+    
+    # Periodic flush of buffered usage counters
+    usage_tracker.start()
+    llm_telemetry.start()
+    classification_log.start()
+    
+    # Shared read-only snapshot of knowledge, FAQs, templates and settings
+    await snapshot_store.start()
+    
+    # Workers answering queued webhook messages
+    job_queue.start()
 
 
 # Shutdown event
@@ -66,6 +93,12 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down...")
+    await job_queue.stop()
+    await usage_tracker.stop()
+    await llm_telemetry.stop()
+    await classification_log.stop()
+    await snapshot_store.stop()
+    await llm_clients.close()
     await cache.disconnect()
 
 
@@ -111,6 +144,7 @@ app.include_router(agents.router, tags=["agents"])
 app.include_router(flows.router, tags=["flows"])
 app.include_router(message_templates.router, tags=["message-templates"])
 app.include_router(settings_api.router, tags=["settings"])
+app.include_router(system.router, tags=["system"])
 
 
 if __name__ == "__main__":
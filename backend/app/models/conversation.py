@@ -34,6 +34,13 @@ class Conversation(Base):
     ended_at = Column(DateTime(timezone=True))
     avg_response_time = Column(Float)
     
+    # Uso del LLM (acumulado desde llm_calls por llm_telemetry)
+    llm_calls = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    llm_cost = Column(Float, default=0.0)  # USD estimado
+    llm_latency_ms = Column(Float, default=0.0)  # Suma de latencias
+    
     # Extra data
     extra_data = Column(JSON, default=dict)
     
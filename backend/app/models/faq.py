@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, JSON
 from sqlalchemy.sql import func
-from app.utils.database import Base
+from app.utils.database import Base, normalize_on_save
+from app.utils.text_processing import normalize_text, normalize_tokens
 
 
 class FAQ(Base):
@@ -20,6 +21,10 @@ class FAQ(Base):
     # Variaciones de la pregunta para mejor matching
     question_variations = Column(JSON, default=list)
     
+    # Pregunta y variaciones normalizadas (se calculan al guardar)
+    normalized_text = Column(Text)
+    normalized_tokens = Column(JSON)  # Una lista de tokens por variante (la pregunta primero)
+    
     # Estado
     is_active = Column(Boolean, default=True, index=True)
     priority = Column(Integer, default=0, index=True)
@@ -35,3 +40,15 @@ class FAQ(Base):
 
     def __repr__(self):
         return f"<FAQ {self.id}: {self.question[:50]}>"
+
+
+def normalize_faq(question: str, question_variations: list) -> dict:
+    """Normalized columns for a FAQ row (also used for bulk inserts)"""
+    variants = [question or ""] + [str(v) for v in question_variations or [] if v]
+    return {
+        "normalized_text": "\n".join(normalize_text(variant) for variant in variants),
+        "normalized_tokens": [normalize_tokens(variant) for variant in variants]
+    }
+
+
+normalize_on_save(FAQ, ("question", "question_variations"), normalize_faq)
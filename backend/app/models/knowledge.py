@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, JSON
 from sqlalchemy.sql import func
-from app.utils.database import Base
+from app.utils.database import Base, normalize_on_save
+from app.utils.text_processing import normalize_text, normalize_tokens
 
 
 class Knowledge(Base):
@@ -26,9 +27,29 @@ class Knowledge(Base):
     times_used = Column(Integer, default=0)
     last_used_at = Column(DateTime(timezone=True))
     
+    # Texto normalizado para búsqueda (se calcula al guardar)
+    normalized_text = Column(Text)
+    normalized_tokens = Column(JSON)  # {"title": [...], "keywords": [...], "content": [...]}
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     def __repr__(self):
         return f"<Knowledge {self.id}: {self.title}>"
+
+
+def normalize_knowledge(title: str, content: str, keywords: list) -> dict:
+    """Normalized columns for a knowledge row (also used for bulk inserts)"""
+    keywords = [str(keyword) for keyword in keywords or []]
+    return {
+        "normalized_text": normalize_text("\n".join([title or "", " ".join(keywords), content or ""])),
+        "normalized_tokens": {
+            "title": normalize_tokens(title),
+            "keywords": [token for keyword in keywords for token in normalize_tokens(keyword)],
+            "content": normalize_tokens(content)
+        }
+    }
+
+
+normalize_on_save(Knowledge, ("title", "content", "keywords"), normalize_knowledge)
@@ -0,0 +1,37 @@
+"""
+LLM Call Model
+Append-only telemetry: one row per LLM request (or reply served from a cache)
+"""
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from sqlalchemy.sql import func
+from app.utils.database import Base
+
+
+class LLMCall(Base):
+    """Tokens, latency and cost of one LLM request"""
+    __tablename__ = "llm_calls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, index=True)  # Chatwoot conversation id (None for tests/jobs)
+    turn_id = Column(String(32), index=True)  # Groups the calls of one customer message
+
+    stage = Column(String(30), nullable=False, index=True)  # intent, agent, agent_stream, combined, embedding, chat
+    agent = Column(String(100))
+    model = Column(String(100))
+    priority = Column(String(20))  # live, test, background
+    status = Column(String(20), nullable=False, default="ok")  # ok, error, timeout, shed
+
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)  # USD, from MODEL_PRICES
+
+    latency_ms = Column(Float)  # Including queue wait and retries
+    queue_ms = Column(Float)
+    retries = Column(Integer, default=0)
+    hedged = Column(Boolean, default=False)
+    cache_hit = Column(Boolean, default=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<LLMCall {self.stage} {self.model} {self.latency_ms}ms>"
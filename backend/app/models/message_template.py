@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, Boolean
 from sqlalchemy.sql import func
-from app.utils.database import Base
+from app.utils.database import Base, normalize_on_save
+from app.utils.text_processing import normalize_text, normalize_tokens
 
 
 class MessageTemplate(Base):
@@ -26,6 +27,12 @@ class MessageTemplate(Base):
     # Keywords that can trigger this template
     trigger_keywords = Column(JSON, nullable=True)  # Array of strings
     
+    # Normalized trigger keywords, computed on save
+    # normalized_text: one folded keyword per line
+    # normalized_tokens: one list of stems per keyword
+    normalized_text = Column(Text, nullable=True)
+    normalized_tokens = Column(JSON, nullable=True)
+    
     # Whether this template is active and can be used
     is_active = Column(Boolean, default=True, nullable=False)
     
@@ -35,3 +42,15 @@ class MessageTemplate(Base):
     
     def __repr__(self):
         return f"<MessageTemplate(id={self.id}, name={self.name})>"
+
+
+def normalize_template(trigger_keywords: list) -> dict:
+    """Normalized columns for a template row (also used for bulk inserts)"""
+    keywords = [str(keyword) for keyword in trigger_keywords or [] if keyword]
+    return {
+        "normalized_text": "\n".join(normalize_text(keyword) for keyword in keywords),
+        "normalized_tokens": [normalize_tokens(keyword) for keyword in keywords]
+    }
+
+
+normalize_on_save(MessageTemplate, ("trigger_keywords",), normalize_template)
@@ -23,6 +23,11 @@ class Conversation(ConversationBase):
     started_at: Optional[datetime]
     ended_at: Optional[datetime]
     avg_response_time: Optional[float]
+    llm_calls: Optional[int] = 0
+    prompt_tokens: Optional[int] = 0
+    completion_tokens: Optional[int] = 0
+    llm_cost: Optional[float] = 0.0
+    llm_latency_ms: Optional[float] = 0.0
     created_at: datetime
     
     class Config:
@@ -45,3 +50,12 @@ class ConversationStats(BaseModel):
     avg_response_time: float
     top_knowledge_used: List[dict]
     top_faqs_used: List[dict]
+    # LLM usage: totals from Conversation, percentiles from llm_calls in the last `days`
+    total_llm_calls: int = 0
+    total_prompt_tokens: int = 0
+    total_completion_tokens: int = 0
+    total_llm_cost: float = 0.0
+    avg_tokens_per_conversation: float = 0.0
+    llm_latency_p50_ms: Optional[float] = None
+    llm_latency_p95_ms: Optional[float] = None
+    llm_stages: List[dict] = []
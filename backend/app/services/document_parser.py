@@ -5,6 +5,7 @@ from typing import List
 from sqlalchemy.orm import Session
 from app.models.knowledge import Knowledge
 from app.models.document import DocumentType
+from app.bot import index_sync
 import logging
 import re
 
@@ -125,6 +126,7 @@ async def create_knowledge_from_document(
         chunks = split_text_intelligently(text, chunk_size)
         
         knowledge_count = 0
+        created_items = []
         
         for idx, chunk in enumerate(chunks):
             if len(chunk.strip()) < 50:  # Skip very short chunks
@@ -148,9 +150,13 @@ async def create_knowledge_from_document(
             )
             
             db.add(knowledge)
+            created_items.append(knowledge)
             knowledge_count += 1
         
         db.commit()
+        
+        await index_sync.knowledge_saved(created_items)
+        
         logger.info(f"Created {knowledge_count} knowledge items from document {document_id}")
         
         return knowledge_count
@@ -0,0 +1,129 @@
+"""
+Process-wide LLM client registry
+Every component that talks to the LLM API (openai_service, the intent
+classifier, the agents) shares one AsyncOpenAI client per (api key, base
+URL), backed by a pooled httpx client. Connections and TLS sessions are
+reused across turns instead of being set up for every reply.
+Which backend answers is chosen with settings.llm_provider (see llm_providers).
+"""
+from openai import AsyncOpenAI
+from app.config import get_settings
+from app.services.llm_providers import PROVIDERS, fake_llm_client, provider_settings
+from typing import Any, Dict, Optional, Tuple
+import threading
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMClientRegistry:
+    """Lazily created, shared AsyncOpenAI clients"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, Optional[str]], AsyncOpenAI] = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str = None, base_url: str = None) -> AsyncOpenAI:
+        """
+        Shared client for the given credentials
+
+        Args:
+            api_key: Defaults to settings.openai_api_key
+            base_url: Defaults to the OpenAI API
+        """
+        key = (api_key or settings.openai_api_key, base_url or None)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = AsyncOpenAI(
+                        api_key=key[0],
+                        base_url=key[1],
+                        timeout=settings.llm_timeout,
+                        max_retries=0,  # Retried by llm_gateway within the turn's deadline
+                        http_client=self._http_client()
+                    )
+                    self._clients[key] = client
+        return client
+
+    def stats(self) -> dict:
+        return {
+            **provider_settings(),
+            "clients": len(self._clients),
+            "max_connections": settings.llm_max_connections,
+            "max_keepalive_connections": settings.llm_max_keepalive_connections,
+            "keepalive_expiry": settings.llm_keepalive_expiry,
+            "http2": settings.llm_http2 and http2_available()
+        }
+
+    async def close(self):
+        """Close the pooled connections (application shutdown)"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Error closing LLM client: {e}")
+
+    @staticmethod
+    def _http_client() -> httpx.AsyncClient:
+        http2 = settings.llm_http2
+        if http2 and not http2_available():
+            logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(settings.llm_timeout, connect=settings.llm_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry
+            ),
+            follow_redirects=True
+        )
+
+
+# Global client registry
+llm_clients = LLMClientRegistry()
+
+
+def get_llm_client() -> Any:
+    """Shared client (OpenAI client interface) for the configured provider"""
+    provider = settings.llm_provider
+    if provider == "fake":
+        return fake_llm_client()
+    if provider == "openai_compatible":
+        if not settings.llm_base_url:
+            raise ValueError("LLM_PROVIDER=openai_compatible requires LLM_BASE_URL")
+        # Local servers usually ignore the key, but the client requires one
+        return llm_clients.get(settings.llm_api_key or settings.openai_api_key or "not-needed", settings.llm_base_url)
+    if provider != "openai":
+        raise ValueError(f"Unknown LLM_PROVIDER: {provider} (expected one of {', '.join(PROVIDERS)})")
+    return llm_clients.get()
+
+
+class SharedLLMClient:
+    """
+    Class attribute resolving get_llm_client() on every access
+    Components never keep a client that llm_clients.close() has shut down
+    (a later startup in the same process gets fresh ones); assigning
+    `instance.client` still overrides it for that instance.
+    """
+
+    def __get__(self, instance, owner=None) -> Any:
+        return get_llm_client()
@@ -0,0 +1,602 @@
+"""
+Process-wide LLM scheduler
+Every LLM request (intent classification, agent replies, embeddings) takes a
+slot here first. At most settings.llm_max_concurrency requests are in flight
+per worker (and, with settings.llm_global_max_concurrency, across all workers
+through Redis leases); the rest wait in a priority queue where live customer
+turns go ahead of the admin test bot, which goes ahead of background jobs
+(embedding builds). When the expected wait exceeds the latency budget of the
+request's priority it is rejected with LLMOverloaded, and the caller answers
+from templates/FAQs instead of queueing behind a spike.
+
+The priority comes from the current context (see llm_priority), so entry
+points mark their work once instead of threading it through every call.
+
+Each request also gets a deadline: the per-call limit, capped by the turn's
+remaining latency budget (see llm_deadline). Transient errors are retried
+with jittered backoff only while that budget allows another attempt, and
+idempotent requests still running at the p95 latency of their kind are
+hedged with a second request when a slot is free; the first to finish wins
+and the other one is reported to llm_telemetry as a call of its own.
+"""
+from app.config import get_settings
+from app.utils.cache import cache
+from app.utils.tokens import count_tokens
+from app.services.llm_telemetry import LLMCallRecord, llm_telemetry
+import openai
+import httpx
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from collections import deque
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class Priority(IntEnum):
+    LIVE = 0  # Customer turns (Chatwoot webhook)
+    TEST = 1  # Admin test bot
+    BACKGROUND = 2  # Embedding builds and other batch work
+
+
+class LLMOverloaded(Exception):
+    """Request shed because the LLM queue is over its latency budget"""
+
+    def __init__(self, priority: Priority, expected_wait: float):
+        super().__init__(f"LLM queue overloaded ({priority.name.lower()}, ~{expected_wait:.1f}s wait)")
+        self.priority = priority
+        self.expected_wait = expected_wait
+
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.LIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority):
+    """Run the enclosed LLM calls (and tasks started inside) at the given priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def llm_deadline(seconds: float):
+    """
+    Latency budget for the enclosed LLM calls (e.g. one customer turn)
+    Nested budgets never extend an outer one; 0 or less means no budget.
+    """
+    deadline = _deadline.get()
+    if seconds and seconds > 0:
+        own = time.monotonic() + seconds
+        deadline = own if deadline is None else min(deadline, own)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+# Errors worth another attempt (network, provider overload, 5xx, our own timeout)
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    httpx.TransportError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+
+class _Trace:
+    """What happened to one logical request, reported to llm_telemetry when it ends"""
+
+    __slots__ = ("kind", "priority", "agent", "model", "start", "queue_ms", "retries", "hedged",
+                 "prompt_tokens", "streamed", "hedges")
+
+    def __init__(self, kind: str, priority: Priority, agent: Optional[str], model: Optional[str]):
+        self.kind = kind
+        self.priority = priority
+        self.agent = agent
+        self.model = model
+        self.start = time.monotonic()
+        self.queue_ms = 0.0
+        self.retries = 0
+        self.hedged = False
+        self.prompt_tokens = 0
+        self.streamed: List[str] = []
+        self.hedges: List[Tuple[str, Any, float]] = []  # (status, usage, latency_ms) of unused requests
+
+    def add_hedge(self, task: "asyncio.Future[Any]", seconds: float):
+        """The request of a hedged pair whose answer was not used (billed all the same)"""
+        if not task.done() or task.cancelled():
+            status, usage = "cancelled", None
+        elif task.exception() is not None:
+            status = "timeout" if isinstance(task.exception(), asyncio.TimeoutError) else "error"
+            usage = None
+        else:
+            status, usage = "ok", getattr(task.result(), "usage", None)
+        self.hedges.append((status, usage, seconds * 1000))
+
+    def finish(self, error: Optional[BaseException] = None, usage: Any = None):
+        if error is None:
+            status = "ok"
+        elif isinstance(error, LLMOverloaded):
+            status = "shed"
+        elif isinstance(error, asyncio.TimeoutError):
+            status = "timeout"
+        elif isinstance(error, asyncio.CancelledError):
+            status = "cancelled"  # Speculative stage no longer needed
+        else:
+            status = "error"
+
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or self.prompt_tokens
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if completion_tokens is None:
+            # Streamed replies carry no usage: estimate from the text received
+            completion_tokens = count_tokens("".join(self.streamed)) if self.streamed else 0
+
+        llm_telemetry.record(LLMCallRecord(
+            stage=self.kind,
+            agent=self.agent,
+            model=self.model,
+            priority=self.priority.name.lower(),
+            status=status,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=(time.monotonic() - self.start) * 1000,
+            queue_ms=self.queue_ms,
+            retries=self.retries,
+            hedged=self.hedged
+        ))
+        # Same prompt as the answered request; a cancelled one reports no completion
+        for status, usage, latency_ms in self.hedges:
+            llm_telemetry.record(LLMCallRecord(
+                stage=self.kind,
+                agent=self.agent,
+                model=self.model,
+                priority=self.priority.name.lower(),
+                status=status,
+                prompt_tokens=getattr(usage, "prompt_tokens", None) or prompt_tokens,
+                completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+                latency_ms=latency_ms,
+                hedged=True
+            ))
+
+
+class LLMGateway:
+    """
+    Concurrency cap + priority queue in front of the LLM API
+
+    Args:
+        max_concurrency: Requests in flight per process
+        queue_budgets: Seconds a request of each priority may wait for a
+            slot before being shed (0 = wait as long as needed)
+        global_limit: Requests in flight across workers (Redis; 0 = off)
+        lease_ttl: Seconds before a lease of a crashed worker expires
+        call_timeout: Seconds per request when no turn budget is tighter
+        max_retries: Extra attempts after a transient error
+        retry_base_delay: First backoff in seconds (doubled per retry, jittered)
+        hedge: Whether idempotent requests are hedged at their p95 latency
+        hedge_min_samples: Latency samples of a kind needed before hedging it
+    """
+
+    GLOBAL_KEY = "llm:leases"
+    SAMPLES = 500  # Recent waits kept for percentiles
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        queue_budgets: Dict[Priority, float] = None,
+        global_limit: int = 0,
+        lease_ttl: float = 120.0,
+        call_timeout: float = 20.0,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.25,
+        hedge: bool = True,
+        hedge_min_samples: int = 20
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_budgets = queue_budgets or {
+            Priority.LIVE: 10.0, Priority.TEST: 20.0, Priority.BACKGROUND: 0.0
+        }
+        self.global_limit = global_limit
+        self.lease_ttl = lease_ttl
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._service_time = 1.0  # EWMA of seconds a slot is held
+        self._waits: Dict[Priority, deque] = {p: deque(maxlen=self.SAMPLES) for p in Priority}
+        self.admitted = dict.fromkeys(Priority, 0)
+        self.shed = dict.fromkeys(Priority, 0)
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies: Dict[str, deque] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        kind: str = "llm",
+        priority: Priority = None,
+        hedge: bool = True,
+        agent: str = None,
+        model: str = None
+    ) -> Any:
+        """
+        Run one LLM request within its deadline
+
+        Args:
+            func: Zero-argument coroutine factory (called once per attempt)
+            kind: Request kind for latency tracking and telemetry (intent, agent, ...)
+            priority: Defaults to the context priority (llm_priority)
+            hedge: Whether the request is idempotent and may be hedged
+            agent: Agent name recorded in the telemetry
+            model: Model recorded in the telemetry (for cost)
+
+        Raises:
+            LLMOverloaded: Shed by the scheduler
+            asyncio.TimeoutError: The deadline passed
+        """
+        priority = current_priority() if priority is None else priority
+        deadline = self._call_deadline()
+        trace = _Trace(kind, priority, agent, model)
+        try:
+            result = await self._with_retries(
+                lambda: self._attempt(func, kind, priority, deadline, hedge, trace), kind, deadline, trace
+            )
+        except BaseException as e:
+            trace.finish(e)
+            raise
+        trace.finish(usage=getattr(result, "usage", None))
+        return result
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        kind: str = "stream",
+        priority: Priority = None,
+        agent: str = None,
+        model: str = None,
+        prompt_tokens: int = 0
+    ) -> AsyncIterator[AsyncIterator[Any]]:
+        """
+        Open a streamed request and hold its slot until the block exits
+        Opening is retried like call(); chunks must keep arriving before the
+        deadline. Streams are never hedged. Streams report no usage, so the
+        caller passes its prompt size and the completion is counted locally.
+        """
+        priority = current_priority() if priority is None else priority
+        deadline = self._call_deadline()
+        trace = _Trace(kind, priority, agent, model)
+        trace.prompt_tokens = prompt_tokens
+        try:
+            async with self.slot(priority):
+                trace.queue_ms = (time.monotonic() - trace.start) * 1000
+                stream = await self._with_retries(lambda: self._timed(func, kind, deadline), kind, deadline, trace)
+                yield self._bounded(stream, deadline, trace)
+        except BaseException as e:
+            trace.finish(e)
+            raise
+        trace.finish()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the current turn budget (None without one)"""
+        deadline = _deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = None) -> AsyncIterator[None]:
+        """
+        Hold a slot for the enclosed request (e.g. a whole streamed reply)
+
+        Raises:
+            LLMOverloaded: The expected or actual wait exceeds the budget
+        """
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        await self._acquire(priority)
+        lease = None
+        try:
+            if self.global_limit:
+                lease = await self._acquire_global(priority, start)
+            self._waits[priority].append(time.monotonic() - start)
+            self.admitted[priority] += 1
+        except BaseException:
+            self._release()
+            raise
+
+        held_from = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - held_from)
+            if lease is not None:
+                await cache.release_lease(self.GLOBAL_KEY, lease)
+            self._release()
+
+    def expected_wait(self, priority: Priority) -> float:
+        """Estimated seconds until a new request of this priority gets a slot"""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            return 0.0
+        ahead = sum(1 for entry in self._waiters if entry[0] <= priority and not entry[2].done())
+        return (ahead + 1) * self._service_time / self.max_concurrency
+
+    def stats(self) -> Dict:
+        kinds = {}
+        for kind, counters in self._counters.items():
+            latencies = sorted(self._latencies.get(kind, ()))
+            kinds[kind] = {
+                **counters,
+                "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "latency_p95_ms": round(self._percentile(latencies, 0.95) * 1000, 1) if latencies else None
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "global_limit": self.global_limit,
+            "in_flight": self._in_flight,
+            "queued": {
+                p.name.lower(): sum(1 for entry in self._waiters if entry[0] == p and not entry[2].done())
+                for p in Priority
+            },
+            "service_time_ms": round(self._service_time * 1000, 1),
+            "priorities": {
+                p.name.lower(): {
+                    "budget_s": self.queue_budgets.get(p, 0.0),
+                    "admitted": self.admitted[p],
+                    "shed": self.shed[p],
+                    **self._wait_percentiles(p)
+                }
+                for p in Priority
+            },
+            "call_timeout_s": self.call_timeout,
+            "max_retries": self.max_retries,
+            "hedge": self.hedge,
+            "kinds": kinds
+        }
+
+    async def _acquire(self, priority: Priority):
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+
+        budget = self.queue_budgets.get(priority, 0.0)
+        expected = self.expected_wait(priority)
+        if budget and expected > budget:
+            self._shed(priority, expected)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        try:
+            # Slot handed over by _release (in_flight already counts it)
+            await asyncio.wait_for(future, budget or None)
+        except asyncio.TimeoutError:
+            self._shed(priority, budget)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    async def _acquire_global(self, priority: Priority, start: float) -> Optional[str]:
+        """Cross-worker lease; waits (jittered) within the same budget"""
+        member = uuid.uuid4().hex
+        budget = self.queue_budgets.get(priority, 0.0)
+        while True:
+            granted = await cache.acquire_lease(self.GLOBAL_KEY, member, self.global_limit, self.lease_ttl)
+            if granted is None:
+                return None  # Redis unavailable: per-process cap only
+            if granted:
+                return member
+            waited = time.monotonic() - start
+            if budget and waited > budget:
+                self._shed(priority, waited)
+            await asyncio.sleep(random.uniform(0.05, 0.15) * (1 + int(priority)))
+
+    async def _with_retries(
+        self,
+        attempt: Callable[[], Awaitable[Any]],
+        kind: str,
+        deadline: float,
+        trace: _Trace
+    ) -> Any:
+        """Retry transient errors with jittered backoff while the deadline allows"""
+        retries = 0
+        while True:
+            try:
+                return await attempt()
+            except LLMOverloaded:
+                raise
+            except RETRYABLE_ERRORS as e:
+                delay = self.retry_base_delay * (2 ** retries) * random.uniform(0.5, 1.5)
+                # Another attempt needs time for the backoff plus a typical response
+                needed = delay + self._percentile(sorted(self._latencies.get(kind, ())), 0.5)
+                if retries >= self.max_retries or deadline - time.monotonic() < needed:
+                    self._count(kind, "timeouts" if isinstance(e, asyncio.TimeoutError) else "errors")
+                    raise
+                retries += 1
+                trace.retries = retries
+                self._count(kind, "retries")
+                logger.warning(f"LLM {kind} request failed ({type(e).__name__}), retry {retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _attempt(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        kind: str,
+        priority: Optional[Priority],
+        deadline: float,
+        hedge: bool,
+        trace: _Trace
+    ) -> Any:
+        entered = time.monotonic()
+        async with self.slot(priority):
+            trace.queue_ms += (time.monotonic() - entered) * 1000
+            hedge_after = self._hedge_after(kind) if hedge else None
+            if hedge_after is None or hedge_after >= deadline - time.monotonic():
+                return await self._timed(func, kind, deadline)
+            return await self._hedged(func, kind, deadline, hedge_after, trace)
+
+    async def _timed(self, func: Callable[[], Awaitable[Any]], kind: str, deadline: float) -> Any:
+        self._count(kind, "calls")
+        start = time.monotonic()
+        result = await asyncio.wait_for(func(), max(0.0, deadline - start))
+        self._observe(kind, time.monotonic() - start)
+        return result
+
+    async def _hedged(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        kind: str,
+        deadline: float,
+        hedge_after: float,
+        trace: _Trace
+    ) -> Any:
+        """Primary request, plus a second one if the first is slower than hedge_after"""
+        self._count(kind, "calls")
+        start = time.monotonic()
+        primary = asyncio.ensure_future(func())
+        tasks = {primary}
+        hedge_task = winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            # Only hedge with a free slot: under load a second request would make things worse
+            if not done and self._try_acquire():
+                trace.hedged = True
+                self._count(kind, "hedges")
+                hedge_task = asyncio.ensure_future(func())
+                tasks.add(hedge_task)
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not primary:
+                            self._count(kind, "hedge_wins")
+                        self._observe(kind, time.monotonic() - start)
+                        return task.result()
+                # The other request may still succeed
+                if not tasks:
+                    raise next(iter(done)).exception()
+        finally:
+            if hedge_task is not None:
+                # Both requests cost tokens: report the one whose answer was not used
+                trace.add_hedge(primary if winner is hedge_task else hedge_task, time.monotonic() - start)
+                self._release()
+            for task in (primary, *tasks):
+                if not task.done():
+                    task.cancel()
+
+    async def _bounded(self, stream: Any, deadline: float, trace: _Trace) -> AsyncIterator[Any]:
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), max(0.0, deadline - time.monotonic()))
+            except StopAsyncIteration:
+                return
+            choices = getattr(chunk, "choices", None)
+            if choices and getattr(choices[0].delta, "content", None):
+                trace.streamed.append(choices[0].delta.content)
+            yield chunk
+
+    def _call_deadline(self) -> float:
+        deadline = time.monotonic() + self.call_timeout
+        turn_deadline = _deadline.get()
+        return deadline if turn_deadline is None else min(deadline, turn_deadline)
+
+    def _hedge_after(self, kind: str) -> Optional[float]:
+        """p95 latency of the kind, once there are enough samples"""
+        latencies = self._latencies.get(kind)
+        if not self.hedge or latencies is None or len(latencies) < self.hedge_min_samples:
+            return None
+        return self._percentile(sorted(latencies), 0.95)
+
+    def _observe(self, kind: str, seconds: float):
+        latencies = self._latencies.get(kind)
+        if latencies is None:
+            latencies = self._latencies[kind] = deque(maxlen=self.SAMPLES)
+        latencies.append(seconds)
+
+    def _count(self, kind: str, counter: str):
+        counters = self._counters.get(kind)
+        if counters is None:
+            counters = self._counters[kind] = dict.fromkeys(
+                ("calls", "retries", "hedges", "hedge_wins", "timeouts", "errors"), 0
+            )
+        counters[counter] += 1
+
+    @staticmethod
+    def _percentile(values: List[float], fraction: float) -> float:
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    def _try_acquire(self) -> bool:
+        """Take a slot only if one is free right now"""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def _shed(self, priority: Priority, expected: float):
+        self.shed[priority] += 1
+        logger.warning(f"LLM request shed ({priority.name.lower()}): expected wait {expected:.1f}s")
+        raise LLMOverloaded(priority, expected)
+
+    def _wait_percentiles(self, priority: Priority) -> Dict:
+        waits = sorted(self._waits[priority])
+        if not waits:
+            return {"wait_p50_ms": None, "wait_p95_ms": None, "wait_max_ms": None}
+        return {
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1),
+            "wait_p95_ms": round(self._percentile(waits, 0.95) * 1000, 1),
+            "wait_max_ms": round(waits[-1] * 1000, 1)
+        }
+
+
+# Global LLM gateway
+llm_gateway = LLMGateway(
+    max_concurrency=settings.llm_max_concurrency,
+    queue_budgets={
+        Priority.LIVE: settings.llm_queue_budget_live,
+        Priority.TEST: settings.llm_queue_budget_test,
+        Priority.BACKGROUND: settings.llm_queue_budget_background
+    },
+    global_limit=settings.llm_global_max_concurrency,
+    call_timeout=settings.llm_call_timeout,
+    max_retries=settings.llm_max_retries,
+    retry_base_delay=settings.llm_retry_base_delay,
+    hedge=settings.llm_hedge,
+    hedge_min_samples=settings.llm_hedge_min_samples
+)
@@ -0,0 +1,261 @@
+"""
+LLM providers
+Every LLM caller talks to an object with the OpenAI client interface
+(chat.completions.create, embeddings.create), returned by get_llm_client()
+for the backend selected with settings.llm_provider:
+- openai: the OpenAI API (settings.openai_api_key)
+- openai_compatible: any server exposing the OpenAI API at settings.llm_base_url
+  (vLLM, Ollama, LM Studio, llama.cpp server...)
+- fake: deterministic offline backend with configurable latency and token
+  counts, for load tests and running the whole pipeline without network
+"""
+from openai.types import CompletionUsage, CreateEmbeddingResponse, Embedding
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
+from openai.types.create_embedding_response import Usage as EmbeddingUsage
+from app.config import get_settings
+from app.utils.tokens import count_tokens
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import httpx
+import openai
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PROVIDERS = ("openai", "openai_compatible", "fake")
+
+# Vocabulario de las respuestas simuladas
+_FAKE_WORDS = (
+    "el megapack incluye más de 40 ias premium como chatgpt plus claude midjourney sora y veo "
+    "con cuentas personales acceso inmediato y soporte durante todo el plan puedes elegir "
+    "uno dos o tres meses y pagar por yape plin o transferencia"
+).split()
+
+_FAKE_INTENTS = ("sales", "design", "order_tracking", "support", "general")
+
+
+class LatencyModel:
+    """
+    Latency samples with a given median and 95th percentile
+
+    Args:
+        distribution: fixed (always p50) | uniform | lognormal
+        p50_ms: Median latency
+        p95_ms: 95th percentile latency
+    """
+
+    def __init__(self, distribution: str = "lognormal", p50_ms: float = 400.0, p95_ms: float = 1200.0):
+        self.distribution = distribution
+        self.p50 = max(0.0, p50_ms) / 1000
+        self.p95 = max(self.p50, p95_ms / 1000)
+
+    def sample(self, rng: random.Random) -> float:
+        """Seconds"""
+        if self.distribution == "fixed" or self.p95 == self.p50:
+            return self.p50
+        if self.distribution == "uniform":
+            width = (self.p95 - self.p50) / 0.45
+            low = max(0.0, self.p50 - width / 2)
+            return rng.uniform(low, low + width)
+        if self.p50 == 0:
+            return 0.0
+        sigma = math.log(self.p95 / self.p50) / 1.645
+        return rng.lognormvariate(math.log(self.p50), sigma)
+
+
+class _FakeCompletions:
+    def __init__(self, client: "FakeLLMClient"):
+        self._client = client
+
+    async def create(self, **request) -> Any:
+        return await self._client.complete(request)
+
+
+class _FakeChat:
+    def __init__(self, client: "FakeLLMClient"):
+        self.completions = _FakeCompletions(client)
+
+
+class _FakeEmbeddings:
+    def __init__(self, client: "FakeLLMClient"):
+        self._client = client
+
+    async def create(self, **request) -> CreateEmbeddingResponse:
+        return await self._client.embed(request)
+
+
+class FakeLLMClient:
+    """
+    Offline stand-in for AsyncOpenAI
+    Replies, token counts and latencies are derived from a hash of the
+    request and the seed, so the same conversation replays identically;
+    injected errors also depend on the call number, so retries can succeed.
+
+    Args:
+        latency: Time to the complete reply (or first streamed chunk)
+        completion_tokens: Mean reply length (capped by the request's max_tokens)
+        tokens_per_second: Streaming pace after the first chunk
+        error_rate: Fraction of calls failing with a connection error
+        seed: Changes every reply, latency and error pattern
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel = None,
+        completion_tokens: int = 60,
+        tokens_per_second: float = 80.0,
+        error_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.latency = latency or LatencyModel()
+        self.completion_tokens = completion_tokens
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self.chat = _FakeChat(self)
+        self.embeddings = _FakeEmbeddings(self)
+
+    async def complete(self, request: Dict) -> Any:
+        rng = self._rng(request)
+        self._maybe_fail(request)
+        prompt_tokens = sum(count_tokens(str(m.get("content") or "")) for m in request.get("messages", []))
+        limit = request.get("max_tokens") or 4 * self.completion_tokens
+        tokens = max(1, min(limit, int(rng.gauss(self.completion_tokens, self.completion_tokens / 4))))
+        text = self._reply(rng, request, tokens)
+        delay = self.latency.sample(rng)
+        model = request.get("model") or "fake"
+
+        if request.get("stream"):
+            return self._stream(text, delay, model)
+
+        await asyncio.sleep(delay)
+        return ChatCompletion(
+            id=f"fake-{self.calls}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[Choice(
+                index=0,
+                finish_reason="stop",
+                message=ChatCompletionMessage(role="assistant", content=text)
+            )],
+            usage=CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=count_tokens(text),
+                total_tokens=prompt_tokens + count_tokens(text)
+            )
+        )
+
+    async def embed(self, request: Dict) -> CreateEmbeddingResponse:
+        # Local embedder: deterministic and still meaningful for retrieval
+        from app.bot.vector_index import LocalEmbedder
+
+        texts = request.get("input") or []
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        self._maybe_fail(request)
+        await asyncio.sleep(self.latency.sample(self._rng(request)) / 4)
+        vectors = await LocalEmbedder(settings.embedding_dimensions).embed(texts)
+        tokens = sum(count_tokens(text) for text in texts)
+        return CreateEmbeddingResponse(
+            object="list",
+            model=request.get("model") or "fake",
+            data=[Embedding(object="embedding", index=i, embedding=vector.tolist()) for i, vector in enumerate(vectors)],
+            usage=EmbeddingUsage(prompt_tokens=tokens, total_tokens=tokens)
+        )
+
+    async def close(self):
+        pass
+
+    async def _stream(self, text: str, delay: float, model: str) -> AsyncIterator[ChatCompletionChunk]:
+        await asyncio.sleep(delay)
+        words = text.split(" ")
+        step = 4  # Words per chunk
+        for start in range(0, len(words), step):
+            if start:
+                await asyncio.sleep(step / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+            piece = " ".join(words[start:start + step])
+            yield ChatCompletionChunk(
+                id=f"fake-{self.calls}",
+                object="chat.completion.chunk",
+                created=int(time.time()),
+                model=model,
+                choices=[ChunkChoice(
+                    index=0,
+                    finish_reason=None,
+                    delta=ChoiceDelta(content=piece if not start else f" {piece}")
+                )]
+            )
+
+    def _reply(self, rng: random.Random, request: Dict, tokens: int) -> str:
+        words = [rng.choice(_FAKE_WORDS) for _ in range(max(1, int(tokens * 0.75)))]
+        text = " ".join(words).capitalize() + ". ¿Te gustaría más información?"
+        if (request.get("response_format") or {}).get("type") != "json_object":
+            return text
+        # JSON mode: intent classifier and combined agent
+        return json.dumps({
+            "intent": rng.choice(_FAKE_INTENTS),
+            "confidence": round(rng.uniform(0.6, 0.95), 2),
+            "reasoning": "Fake provider",
+            "response": text
+        }, ensure_ascii=False)
+
+    def _rng(self, request: Dict) -> random.Random:
+        payload = json.dumps(
+            {key: request.get(key) for key in ("model", "messages", "input")},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        digest = hashlib.sha1(f"{self.seed}:{payload}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _maybe_fail(self, request: Dict):
+        self.calls += 1
+        if self.error_rate > 0 and random.Random(f"{self.seed}:{self.calls}").random() < self.error_rate:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://fake-llm/v1"))
+
+
+_fake_client: Optional[FakeLLMClient] = None
+
+
+def fake_llm_client() -> FakeLLMClient:
+    """Shared fake client configured from settings"""
+    global _fake_client
+    if _fake_client is None:
+        _fake_client = FakeLLMClient(
+            latency=LatencyModel(
+                settings.fake_llm_latency_distribution,
+                settings.fake_llm_latency_p50_ms,
+                settings.fake_llm_latency_p95_ms
+            ),
+            completion_tokens=settings.fake_llm_completion_tokens,
+            tokens_per_second=settings.fake_llm_tokens_per_second,
+            error_rate=settings.fake_llm_error_rate,
+            seed=settings.fake_llm_seed
+        )
+    return _fake_client
+
+
+def provider_settings() -> Dict:
+    """Configured provider (for /api/system)"""
+    provider = settings.llm_provider
+    info = {"provider": provider, "model": settings.openai_model}
+    if provider == "openai_compatible":
+        info["base_url"] = settings.llm_base_url
+    elif provider == "fake":
+        info.update({
+            "latency_distribution": settings.fake_llm_latency_distribution,
+            "latency_p50_ms": settings.fake_llm_latency_p50_ms,
+            "latency_p95_ms": settings.fake_llm_latency_p95_ms,
+            "completion_tokens": settings.fake_llm_completion_tokens,
+            "error_rate": settings.fake_llm_error_rate,
+            "seed": settings.fake_llm_seed
+        })
+    return info
@@ -0,0 +1,239 @@
+"""
+Per-call LLM telemetry
+llm_gateway reports every request (and the pipeline every reply served from
+a cache) as an LLMCallRecord. Records are buffered in memory and flushed
+periodically: appended to the llm_calls table in one bulk insert, and
+summed into the per-conversation totals on Conversation with one UPDATE
+per conversation, keeping database writes off the reply path.
+"""
+from sqlalchemy import func, update
+from app.config import get_settings
+from app.models.conversation import Conversation
+from app.models.llm_call import LLMCall
+from app.utils.database import SessionLocal
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import threading
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# USD per 1M tokens (input, output); models not listed are recorded without cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4-turbo-preview": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+def call_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of a call (0 for unknown models)"""
+    prices = MODEL_PRICES.get(model or "")
+    if prices is None:
+        # Snapshot names such as gpt-4o-mini-2024-07-18
+        prices = next((p for name, p in MODEL_PRICES.items() if (model or "").startswith(f"{name}-")), None)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class LLMCallRecord(NamedTuple):
+    stage: str
+    agent: Optional[str] = None
+    model: Optional[str] = None
+    priority: Optional[str] = None
+    status: str = "ok"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+    queue_ms: float = 0.0
+    retries: int = 0
+    hedged: bool = False
+    cache_hit: bool = False
+    conversation_id: Optional[int] = None
+    turn_id: Optional[str] = None
+
+
+class TurnUsage:
+    """Totals of the calls made while answering one message"""
+
+    __slots__ = ("conversation_id", "turn_id", "calls", "prompt_tokens", "completion_tokens", "cost", "latency_ms")
+
+    def __init__(self, conversation_id: Optional[int]):
+        self.conversation_id = conversation_id
+        self.turn_id = uuid.uuid4().hex[:16]
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latency_ms = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "turn_id": self.turn_id,
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6),
+            "latency_ms": round(self.latency_ms, 1)
+        }
+
+
+_turn: ContextVar[Optional[TurnUsage]] = ContextVar("llm_turn", default=None)
+
+
+def _conversation_key(conversation_id) -> Optional[int]:
+    """Chatwoot ids arrive as int or str depending on the entry point"""
+    try:
+        return int(conversation_id) if conversation_id not in (None, "", 0) else None
+    except (TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def llm_turn(conversation_id=None):
+    """Attribute the enclosed LLM calls to one turn of a conversation"""
+    usage = TurnUsage(_conversation_key(conversation_id))
+    token = _turn.set(usage)
+    try:
+        yield usage
+    finally:
+        _turn.reset(token)
+
+
+class LLMTelemetry:
+    """Buffers call records and flushes them in batches"""
+
+    def __init__(self, flush_interval: int = 10, max_buffer: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.enabled = settings.llm_telemetry
+        self._buffer: List[LLMCallRecord] = []
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def record(self, record: LLMCallRecord):
+        """Register one call, attributed to the current turn (no I/O)"""
+        if not self.enabled:
+            return
+        turn = _turn.get()
+        if turn is not None:
+            record = record._replace(conversation_id=turn.conversation_id, turn_id=turn.turn_id)
+            turn.calls += 0 if record.cache_hit else 1
+            turn.prompt_tokens += record.prompt_tokens
+            turn.completion_tokens += record.completion_tokens
+            turn.cost += call_cost(record.model, record.prompt_tokens, record.completion_tokens)
+            turn.latency_ms += record.latency_ms
+
+        logger.debug(f"LLM call: {record._asdict()}")
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                # Database unreachable for a while: keep the newest records
+                self._buffer.pop(0)
+                self.dropped += 1
+            self._buffer.append(record)
+
+    def flush(self) -> int:
+        """
+        Write buffered records and conversation totals
+
+        Returns:
+            Number of records written
+        """
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return 0
+
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(LLMCall, [self._row(record) for record in records])
+            for conversation_id, totals in self._conversation_totals(records).items():
+                db.execute(
+                    update(Conversation)
+                    .where(Conversation.chatwoot_conversation_id == conversation_id)
+                    .values(
+                        llm_calls=func.coalesce(Conversation.llm_calls, 0) + totals["llm_calls"],
+                        prompt_tokens=func.coalesce(Conversation.prompt_tokens, 0) + totals["prompt_tokens"],
+                        completion_tokens=func.coalesce(Conversation.completion_tokens, 0) + totals["completion_tokens"],
+                        llm_cost=func.coalesce(Conversation.llm_cost, 0) + totals["llm_cost"],
+                        llm_latency_ms=func.coalesce(Conversation.llm_latency_ms, 0) + totals["llm_latency_ms"]
+                    )
+                )
+            db.commit()
+            logger.info(f"Flushed {len(records)} LLM call records")
+            return len(records)
+
+        except Exception as e:
+            logger.error(f"Error flushing LLM telemetry: {e}")
+            db.rollback()
+            # Keep the records for the next attempt
+            with self._lock:
+                self._buffer[:0] = records[-self.max_buffer:]
+            return 0
+
+        finally:
+            db.close()
+
+    def start(self):
+        """Start the periodic flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    @staticmethod
+    def _row(record: LLMCallRecord) -> Dict:
+        row = record._asdict()
+        row["cost"] = call_cost(record.model, record.prompt_tokens, record.completion_tokens)
+        row["latency_ms"] = round(record.latency_ms, 1)
+        row["queue_ms"] = round(record.queue_ms, 1)
+        return row
+
+    @staticmethod
+    def _conversation_totals(records: List[LLMCallRecord]) -> Dict[int, Dict]:
+        totals: Dict[int, Dict] = {}
+        for record in records:
+            if record.conversation_id is None:
+                continue
+            entry = totals.setdefault(record.conversation_id, dict.fromkeys(
+                ("llm_calls", "prompt_tokens", "completion_tokens", "llm_cost", "llm_latency_ms"), 0
+            ))
+            entry["llm_calls"] += 0 if record.cache_hit else 1
+            entry["prompt_tokens"] += record.prompt_tokens
+            entry["completion_tokens"] += record.completion_tokens
+            entry["llm_cost"] += call_cost(record.model, record.prompt_tokens, record.completion_tokens)
+            entry["llm_latency_ms"] += record.latency_ms
+        return totals
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                logger.error(f"LLM telemetry flush loop error: {e}")
+
+
+# Global telemetry sink
+llm_telemetry = LLMTelemetry(flush_interval=settings.usage_flush_interval)
@@ -1,16 +1,20 @@
-from openai import AsyncOpenAI
 from app.config import get_settings
+from app.services.llm_clients import SharedLLMClient
+from app.services.llm_gateway import llm_gateway
 import logging
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
 
 class OpenAIService:
     """Service for interacting with OpenAI API"""
     
+    client = SharedLLMClient()
+    
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
         self.model = settings.openai_model
         self.temperature = settings.openai_temperature
         self.max_tokens = settings.openai_max_tokens
@@ -35,13 +39,13 @@ class OpenAIService:
             dict with 'content' and 'usage' keys
         """
         try:
-            response = await self.client.chat.completions.create(
+            response = await llm_gateway.call(lambda: self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temperature or self.temperature,
                 max_tokens=max_tokens or self.max_tokens,
                 stream=stream
-            )
+            ), kind="chat", hedge=not stream, model=self.model)
             
             if stream:
                 return response
@@ -71,10 +75,10 @@ class OpenAIService:
             List of embedding vectors
         """
         try:
-            response = await self.client.embeddings.create(
-                model="text-embedding-3-small",
+            response = await llm_gateway.call(lambda: self.client.embeddings.create(
+                model=EMBEDDING_MODEL,
                 input=texts
-            )
+            ), kind="embedding", model=EMBEDDING_MODEL)
             
             return [item.embedding for item in response.data]
         
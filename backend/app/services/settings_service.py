@@ -0,0 +1,87 @@
+"""
+Typed view of the admin settings table
+Values are parsed once per content snapshot (see knowledge_snapshot), so a
+lookup while answering a message is an attribute access. Writes through
+app/api/settings.py invalidate the snapshot, which every worker picks up
+through Redis.
+"""
+from sqlalchemy.orm import Session
+from app.bot.knowledge_snapshot import snapshot_store
+from app.models.settings import Settings
+from app.utils.database import SessionLocal
+from typing import Mapping, NamedTuple, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BotSettings(NamedTuple):
+    """Settings read while answering messages, with their defaults"""
+    response_style: str = "concisa"  # concisa | normal | detallada
+    max_response_tokens: int = 150
+    retrieval_lexical_weight: float = 1.0  # Hybrid retrieval rank fusion
+    retrieval_vector_weight: float = 1.0
+    retrieval_rrf_k: float = 60.0
+    response_cache_intents: str = "sales,design,general"  # Comma-separated; "" disables the response cache
+
+
+def parse_settings(values: Mapping[str, Optional[str]]) -> BotSettings:
+    """BotSettings from raw key/value pairs (invalid values keep the default)"""
+    parsed = {}
+    for field, field_type in BotSettings.__annotations__.items():
+        value = values.get(field)
+        if value is None or value == "":
+            continue
+        try:
+            parsed[field] = field_type(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid value for setting {field}: {value!r}, using default")
+    return BotSettings(**parsed)
+
+
+class SettingsService:
+    """Current BotSettings, re-parsed only when the snapshot changes"""
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._values: Optional[BotSettings] = None
+
+    def get(self, db: Session = None) -> BotSettings:
+        """
+        Current settings
+
+        Args:
+            db: Session used only before the first snapshot exists
+                (scripts, benchmarks); a new one is opened if omitted
+        """
+        snapshot = snapshot_store.current
+        if snapshot is None:
+            if self._values is None:
+                self._values = self._load(db)
+            return self._values
+
+        if snapshot.version != self._version or self._values is None:
+            self._values = parse_settings({key: record.value for key, record in snapshot.settings.items()})
+            self._version = snapshot.version
+        return self._values
+
+    @property
+    def current(self) -> BotSettings:
+        return self.get()
+
+    @staticmethod
+    def _load(db: Optional[Session]) -> BotSettings:
+        session = db or SessionLocal()
+        try:
+            rows = session.query(Settings).filter(Settings.key.in_(list(BotSettings._fields))).all()
+            return parse_settings({row.key: row.value for row in rows})
+        except Exception as e:
+            logger.error(f"Error loading settings: {e}")
+            return BotSettings()
+        finally:
+            if db is None:
+                session.close()
+
+
+# Global settings service
+bot_settings = SettingsService()
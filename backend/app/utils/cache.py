@@ -1,7 +1,8 @@
 import redis.asyncio as redis
 from app.config import get_settings
 import json
-from typing import Optional, Any
+import time
+from typing import Optional, Any, List
 import logging
 
 logger = logging.getLogger(__name__)
@@ -47,6 +48,18 @@ class RedisCache:
             logger.error(f"Redis get error: {e}")
             return None
     
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in one round-trip (None for missing keys)"""
+        if not self.redis_client:
+            return [None] * len(keys)
+        
+        try:
+            values = await self.redis_client.mget(keys)
+            return [json.loads(value) if value else None for value in values]
+        except Exception as e:
+            logger.error(f"Redis mget error: {e}")
+            return [None] * len(keys)
+    
     async def set(self, key: str, value: Any, expire: int = 3600):
         """Set value in cache with expiration (default 1 hour)"""
         if not self.redis_client:
@@ -63,6 +76,241 @@ class RedisCache:
             logger.error(f"Redis set error: {e}")
             return False
     
+    async def incr(self, key: str) -> Optional[int]:
+        """Atomically increment a counter"""
+        if not self.redis_client:
+            return None
+        
+        try:
+            return await self.redis_client.incr(key)
+        except Exception as e:
+            logger.error(f"Redis incr error: {e}")
+            return None
+    
+    async def publish(self, channel: str, message: Any) -> bool:
+        """Publish a message on a pub/sub channel"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            await self.redis_client.publish(channel, json.dumps(message))
+            return True
+        except Exception as e:
+            logger.error(f"Redis publish error: {e}")
+            return False
+    
+    def pubsub(self):
+        """New pub/sub connection (None when Redis is not connected)"""
+        if not self.redis_client:
+            return None
+        return self.redis_client.pubsub()
+    
+    async def acquire_lease(self, key: str, member: str, limit: int, ttl: float) -> Optional[bool]:
+        """
+        Take one of `limit` shared leases (sorted set scored by expiry)
+        Expired leases are dropped first, so a crashed holder frees its lease
+        after `ttl` seconds. Returns None when Redis is not connected.
+        """
+        if not self.redis_client:
+            return None
+        
+        try:
+            now = time.time()
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.zadd(key, {member: now + ttl})
+                pipe.zcard(key)
+                pipe.expire(key, int(ttl) + 1)
+                _, _, holders, _ = await pipe.execute()
+            if holders > limit:
+                await self.redis_client.zrem(key, member)
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Redis lease error: {e}")
+            return None
+    
+    async def release_lease(self, key: str, member: str):
+        """Give back a lease taken with acquire_lease"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            await self.redis_client.zrem(key, member)
+            return True
+        except Exception as e:
+            logger.error(f"Redis lease release error: {e}")
+            return False
+    
+    async def set_if_absent(self, key: str, value: Any, expire: int = 3600) -> Optional[bool]:
+        """Set a key only if it does not exist (None when Redis is not connected)"""
+        if not self.redis_client:
+            return None
+        
+        try:
+            return bool(await self.redis_client.set(key, json.dumps(value), ex=expire, nx=True))
+        except Exception as e:
+            logger.error(f"Redis setnx error: {e}")
+            return None
+    
+    async def ensure_group(self, stream: str, group: str) -> bool:
+        """Create a stream consumer group (and the stream) if missing"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            await self.redis_client.xgroup_create(stream, group, id="0", mkstream=True)
+            return True
+        except redis.ResponseError as e:
+            if "BUSYGROUP" in str(e):
+                return True
+            logger.error(f"Redis xgroup error: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Redis xgroup error: {e}")
+            return False
+    
+    async def stream_add(self, stream: str, message: Any, maxlen: int = 10000) -> Optional[str]:
+        """Append a message to a stream; returns its entry id"""
+        if not self.redis_client:
+            return None
+        
+        try:
+            return await self.redis_client.xadd(
+                stream, {"data": json.dumps(message)}, maxlen=maxlen, approximate=True
+            )
+        except Exception as e:
+            logger.error(f"Redis xadd error: {e}")
+            return None
+    
+    async def stream_read(
+        self, stream: str, group: str, consumer: str, count: int = 1, block_ms: int = 1000
+    ) -> Optional[List[tuple]]:
+        """
+        Read new messages for a consumer group member
+        Returns [(entry_id, message)], or None when Redis is not usable.
+        """
+        if not self.redis_client:
+            return None
+        
+        try:
+            response = await self.redis_client.xreadgroup(
+                group, consumer, {stream: ">"}, count=count, block=block_ms
+            )
+        except redis.ResponseError as e:
+            if "NOGROUP" in str(e):
+                # Stream deleted (e.g. FLUSHALL): recreate it
+                await self.ensure_group(stream, group)
+                return []
+            logger.error(f"Redis xreadgroup error: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Redis xreadgroup error: {e}")
+            return None
+        
+        return [
+            (entry_id, json.loads(fields["data"]))
+            for _, entries in response or []
+            for entry_id, fields in entries
+            if fields and "data" in fields
+        ]
+    
+    async def stream_ack(self, stream: str, group: str, entry_id: str) -> bool:
+        """Acknowledge a message and drop it from the stream"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.xack(stream, group, entry_id)
+                pipe.xdel(stream, entry_id)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis xack error: {e}")
+            return False
+    
+    async def stream_claim(
+        self, stream: str, group: str, consumer: str, min_idle_ms: int, count: int = 10
+    ) -> List[tuple]:
+        """Take over messages left unacknowledged by another consumer for min_idle_ms"""
+        if not self.redis_client:
+            return []
+        
+        try:
+            response = await self.redis_client.xautoclaim(
+                stream, group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+            )
+        except Exception as e:
+            logger.error(f"Redis xautoclaim error: {e}")
+            return []
+        
+        return [
+            (entry_id, json.loads(fields["data"]))
+            for entry_id, fields in response[1]
+            if fields and "data" in fields
+        ]
+    
+    async def stream_stats(self, stream: str, group: str) -> Optional[dict]:
+        """Length, pending (delivered, unacknowledged) count and oldest entry id of a stream"""
+        if not self.redis_client:
+            return None
+        
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.xlen(stream)
+                pipe.xpending(stream, group)
+                pipe.xrange(stream, count=1)
+                length, pending, oldest = await pipe.execute()
+            return {
+                "length": length,
+                "pending": pending["pending"],
+                "oldest_id": oldest[0][0] if oldest else None
+            }
+        except Exception as e:
+            logger.error(f"Redis stream stats error: {e}")
+            return None
+    
+    async def schedule(self, key: str, message: Any, due: float) -> bool:
+        """Add a message to a sorted set scored by the time it becomes due"""
+        if not self.redis_client:
+            return False
+        
+        try:
+            await self.redis_client.zadd(key, {json.dumps(message): due})
+            return True
+        except Exception as e:
+            logger.error(f"Redis schedule error: {e}")
+            return False
+    
+    async def pop_due(self, key: str, now: float, count: int = 100) -> List[Any]:
+        """Remove and return scheduled messages due by `now` (each one goes to a single caller)"""
+        if not self.redis_client:
+            return []
+        
+        try:
+            members = await self.redis_client.zrangebyscore(key, "-inf", now, start=0, num=count)
+            due = []
+            for member in members:
+                # Another worker may have taken it between the read and the removal
+                if await self.redis_client.zrem(key, member):
+                    due.append(json.loads(member))
+            return due
+        except Exception as e:
+            logger.error(f"Redis pop due error: {e}")
+            return []
+    
+    async def count(self, key: str) -> int:
+        """Members of a sorted set"""
+        if not self.redis_client:
+            return 0
+        
+        try:
+            return await self.redis_client.zcard(key)
+        except Exception as e:
+            logger.error(f"Redis zcard error: {e}")
+            return 0
+    
     async def delete(self, key: str):
         """Delete key from cache"""
         if not self.redis_client:
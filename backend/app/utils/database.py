@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import get_settings
+from typing import Callable, Sequence
 
 settings = get_settings()
 
@@ -35,5 +36,53 @@ def get_db():
 
 def init_db():
     """Initialize database (create all tables)"""
-    from app.models import knowledge, faq, document, conversation, settings as settings_model, agent_config
+    from app.models import knowledge, faq, document, conversation, settings as settings_model, agent_config, message_template, llm_call
     Base.metadata.create_all(bind=engine)
+    
+    from app.utils.fulltext import fulltext_search
+    fulltext_search.ensure_schema(engine)
+    
+    backfill_normalized_columns()
+
+
+def backfill_normalized_columns(batch_size: int = 500):
+    """Fill normalized_* columns for rows written before they existed"""
+    from app.models.knowledge import Knowledge
+    from app.models.faq import FAQ
+    from app.models.message_template import MessageTemplate
+    
+    db = SessionLocal()
+    try:
+        for model in (Knowledge, FAQ, MessageTemplate):
+            while True:
+                rows = db.query(model).filter(model.normalized_tokens.is_(None)).limit(batch_size).all()
+                if not rows:
+                    break
+                for row in rows:
+                    # The before_update hook recomputes the columns
+                    row.normalized_text = ""
+                db.commit()
+    finally:
+        db.close()
+
+
+def normalize_on_save(model, fields: Sequence[str], builder: Callable[..., dict]):
+    """
+    Keep a model's normalized_* columns in sync with its source fields
+    The builder runs on insert and on updates that touch one of the fields
+
+    Args:
+        model: Mapped class with normalized_text/normalized_tokens columns
+        fields: Source attributes, passed positionally to the builder
+        builder: Returns {column: value} for the normalized columns
+    """
+    def listener(mapper, connection, target):
+        state = inspect(target)
+        changed = any(state.attrs[field].history.has_changes() for field in fields)
+        if target.normalized_tokens is not None and not changed:
+            return
+        for column, value in builder(*(getattr(target, field) for field in fields)).items():
+            setattr(target, column, value)
+
+    event.listen(model, "before_insert", listener)
+    event.listen(model, "before_update", listener)
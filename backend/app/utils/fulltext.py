@@ -0,0 +1,243 @@
+"""
+Database full-text search for knowledge and FAQs
+PostgreSQL: generated tsvector columns (spanish + unaccent) with GIN indexes
+SQLite: FTS5 external-content tables kept in sync by triggers
+"""
+from sqlalchemy import text, literal_column, func, Integer, Float
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, Query
+from app.utils.text_processing import tokenize
+from typing import Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Columns indexed per table: (column, postgres weight, sqlite bm25 weight)
+FULLTEXT_COLUMNS = {
+    "knowledge": [
+        ("title", "A", 3.0),
+        ("keywords", "B", 2.0),
+        ("content", "C", 1.0)
+    ],
+    "faqs": [
+        ("question", "A", 3.0),
+        ("question_variations", "A", 3.0),
+        ("tags", "B", 2.0),
+        ("answer", "C", 1.0)
+    ]
+}
+
+JSON_COLUMNS = {"keywords", "question_variations", "tags"}
+
+
+def postgres_statements() -> List[str]:
+    """DDL for the PostgreSQL tsvector columns and GIN indexes"""
+    statements = [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        # unaccent() is only STABLE; generated columns need an IMMUTABLE wrapper
+        """CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$"""
+    ]
+
+    for table, columns in FULLTEXT_COLUMNS.items():
+        parts = []
+        for column, weight, _ in columns:
+            source = f"{column}::text" if column in JSON_COLUMNS else column
+            parts.append(
+                f"setweight(to_tsvector('spanish', immutable_unaccent(coalesce({source}, ''))), '{weight}')"
+            )
+        statements.append(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({' || '.join(parts)}) STORED"
+        )
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"
+        )
+
+    return statements
+
+
+def postgres_downgrade_statements() -> List[str]:
+    statements = []
+    for table in FULLTEXT_COLUMNS:
+        statements.append(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+        statements.append(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+    statements.append("DROP FUNCTION IF EXISTS immutable_unaccent(text)")
+    return statements
+
+
+def sqlite_statements() -> List[str]:
+    """DDL for the SQLite FTS5 tables, sync triggers and initial load"""
+    statements = []
+
+    for table, columns in FULLTEXT_COLUMNS.items():
+        fts = f"{table}_fts"
+        names = [column for column, _, _ in columns]
+        column_list = ", ".join(names)
+        new_values = ", ".join(f"new.{name}" for name in names)
+        old_values = ", ".join(f"old.{name}" for name in names)
+
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, "
+            f"content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+        ]
+
+    return statements
+
+
+def sqlite_downgrade_statements() -> List[str]:
+    statements = []
+    for table in FULLTEXT_COLUMNS:
+        fts = f"{table}_fts"
+        for suffix in ("ai", "ad", "au"):
+            statements.append(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        statements.append(f"DROP TABLE IF EXISTS {fts}")
+    return statements
+
+
+def upgrade_statements(dialect: str) -> List[str]:
+    if dialect == "postgresql":
+        return postgres_statements()
+    if dialect == "sqlite":
+        return sqlite_statements()
+    return []
+
+
+def downgrade_statements(dialect: str) -> List[str]:
+    if dialect == "postgresql":
+        return postgres_downgrade_statements()
+    if dialect == "sqlite":
+        return sqlite_downgrade_statements()
+    return []
+
+
+class FullTextSearch:
+    """Ranked full-text queries against the database index"""
+
+    def __init__(self):
+        self._available: Dict[str, bool] = {}
+
+    def ensure_schema(self, engine: Engine):
+        """Create the full-text structures if missing (idempotent)"""
+        dialect = engine.dialect.name
+        try:
+            if dialect == "sqlite" and self._sqlite_ready(engine):
+                return
+            with engine.begin() as conn:
+                for statement in upgrade_statements(dialect):
+                    conn.execute(text(statement))
+        except Exception as e:
+            logger.warning(f"Full-text search setup failed ({dialect}): {e}")
+        self._available.clear()
+
+    def is_available(self, db: Session) -> bool:
+        """Whether the database has the full-text structures"""
+        dialect = db.bind.dialect.name
+        if dialect not in self._available:
+            try:
+                if dialect == "postgresql":
+                    found = db.execute(text(
+                        "SELECT 1 FROM information_schema.columns "
+                        "WHERE table_name = 'knowledge' AND column_name = 'search_vector'"
+                    )).first()
+                elif dialect == "sqlite":
+                    found = db.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+                    )).first()
+                else:
+                    found = None
+                self._available[dialect] = found is not None
+            except Exception as e:
+                logger.warning(f"Full-text availability check failed: {e}")
+                self._available[dialect] = False
+        return self._available[dialect]
+
+    def search(self, db: Session, table: str, query: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        Ranked search over active rows (any query term may match)
+
+        Args:
+            db: Database session
+            table: "knowledge" or "faqs"
+            query: User's message
+            limit: Maximum number of results
+
+        Returns:
+            List of (row_id, rank) sorted by rank desc
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        if db.bind.dialect.name == "postgresql":
+            sql = text(
+                f"SELECT id, ts_rank(search_vector, query) AS rank "
+                f"FROM {table}, to_tsquery('spanish', immutable_unaccent(:query)) AS query "
+                f"WHERE is_active AND search_vector @@ query "
+                f"ORDER BY rank DESC LIMIT :limit"
+            )
+            params = {"query": " | ".join(tokens), "limit": limit}
+        else:
+            fts = f"{table}_fts"
+            sql = text(
+                f"SELECT {fts}.rowid, -bm25({fts}, {self._bm25_weights(table)}) AS rank "
+                f"FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid "
+                f"WHERE {fts} MATCH :query AND {table}.is_active = 1 "
+                f"ORDER BY rank DESC LIMIT :limit"
+            )
+            params = {"query": " OR ".join(f'"{token}"' for token in tokens), "limit": limit}
+
+        return [(row[0], float(row[1])) for row in db.execute(sql, params)]
+
+    def filter_query(self, db: Session, query: Query, model, search: str) -> Query:
+        """
+        Restrict an ORM query to rows matching the search text, ordered by rank
+        All search terms must match (admin search semantics)
+        """
+        table = model.__tablename__
+        if db.bind.dialect.name == "postgresql":
+            ts_query = func.websearch_to_tsquery("spanish", func.immutable_unaccent(search))
+            search_vector = literal_column(f"{table}.search_vector")
+            return query.filter(search_vector.op("@@")(ts_query)).order_by(
+                func.ts_rank(search_vector, ts_query).desc()
+            )
+
+        tokens = list(dict.fromkeys(tokenize(search, remove_stop_words=False)))
+        if not tokens:
+            return query
+
+        fts = f"{table}_fts"
+        matches = text(
+            f"SELECT rowid AS id, bm25({fts}) AS rank FROM {fts} WHERE {fts} MATCH :search"
+        ).columns(id=Integer, rank=Float).subquery("fulltext_matches")
+        return query.join(matches, model.id == matches.c.id).order_by(
+            matches.c.rank
+        ).params(search=" AND ".join(f'"{token}"' for token in tokens))
+
+    def _sqlite_ready(self, engine: Engine) -> bool:
+        with engine.connect() as conn:
+            found = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+            )).first()
+        return found is not None
+
+    @staticmethod
+    def _bm25_weights(table: str) -> str:
+        return ", ".join(str(weight) for _, _, weight in FULLTEXT_COLUMNS[table])
+
+
+# Global full-text search instance
+fulltext_search = FullTextSearch()
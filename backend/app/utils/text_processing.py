@@ -0,0 +1,149 @@
+"""
+Text processing helpers shared by the retrieval components
+Lowercasing, accent folding, tokenization, stop words and light stemming
+"""
+from functools import lru_cache
+from typing import List, Union
+import re
+import unicodedata
+
+
+# Palabras vacías (español + inglés) que no aportan a la búsqueda
+STOP_WORDS = {
+    'el', 'la', 'los', 'las', 'de', 'del', 'que', 'y', 'a', 'al', 'en', 'un',
+    'una', 'unos', 'unas', 'ser', 'se', 'no', 'haber', 'por', 'con', 'su',
+    'sus', 'para', 'como', 'estar', 'tener', 'le', 'les', 'lo', 'todo', 'pero',
+    'mas', 'hacer', 'o', 'poder', 'decir', 'este', 'esta', 'esto', 'ir', 'otro',
+    'ese', 'esa', 'eso', 'si', 'me', 'mi', 'mis', 'te', 'tu', 'tus', 'ya',
+    'ver', 'porque', 'dar', 'cuando', 'muy', 'sin', 'es', 'son', 'hay', 'yo',
+    'quiero', 'tienen', 'tiene', 'tengo', 'hola', 'buenas', 'buenos', 'dias',
+    'tardes', 'noches', 'gracias', 'favor', 'algo', 'sobre', 'entre', 'nos',
+    'cual', 'cuales', 'donde', 'quien', 'ustedes', 'usted', 'puedo', 'puede',
+    'the', 'be', 'to', 'of', 'and', 'in', 'that', 'have', 'it', 'for', 'not',
+    'on', 'with', 'he', 'as', 'you', 'do', 'is', 'are', 'an'
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9ñ]+")
+
+
+def fold_accents(text: str) -> str:
+    """
+    Lowercase text and remove accents ("Diseño Gráfico" -> "diseño grafico")
+    The ñ is kept because it changes the meaning of Spanish words
+    """
+    text = text.lower().replace("ñ", "\x00")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace("\x00", "ñ")
+
+
+def tokenize(text: str, min_length: int = 2, remove_stop_words: bool = True) -> List[str]:
+    """
+    Split text into normalized tokens
+
+    Args:
+        text: Raw text
+        min_length: Minimum token length to keep
+        remove_stop_words: Whether to drop stop words
+
+    Returns:
+        List of tokens (order preserved, duplicates kept)
+    """
+    if not text:
+        return []
+
+    tokens = _TOKEN_RE.findall(fold_accents(text))
+    return [
+        token for token in tokens
+        if len(token) >= min_length and not (remove_stop_words and token in STOP_WORDS)
+    ]
+
+
+# Sufijos flexivos/derivativos del español, del más largo al más corto
+_SUFFIXES = (
+    'amientos', 'imientos', 'aciones', 'uciones', 'amiento', 'imiento',
+    'adoras', 'adores', 'ancias', 'encias', 'idades', 'acion', 'ucion',
+    'adora', 'ador', 'ancia', 'encia', 'mente', 'idad', 'ismos', 'ismo',
+    'istas', 'ista', 'ables', 'ibles', 'able', 'ible', 'ivas', 'ivos',
+    'iva', 'ivo', 'osas', 'osos', 'osa', 'oso', 'iendo', 'ando', 'ados',
+    'adas', 'idos', 'idas', 'ado', 'ada', 'ido', 'ida', 'ar', 'er', 'ir'
+)
+
+# Length a stem must keep after removing a suffix
+_MIN_STEM = 3
+
+
+@lru_cache(maxsize=50000)
+def stem(token: str) -> str:
+    """
+    Light Spanish stemmer for accent-folded tokens
+    Removes the plural, one derivational/verbal suffix and the final vowel,
+    so "programación", "programar" and "programas" all become "program"
+    """
+    token = token.replace("ñ", "n")
+    if len(token) <= _MIN_STEM or not token.isalpha():
+        return token
+
+    # Plural
+    if token.endswith("es") and len(token) - 2 >= _MIN_STEM:
+        token = token[:-2]
+    elif token.endswith("s") and len(token) - 1 >= _MIN_STEM:
+        token = token[:-1]
+
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            token = token[:-len(suffix)]
+            break
+
+    # Vocal final (diseño/diseñar, precio/precios)
+    if token[-1] in "aeo" and len(token) - 1 >= _MIN_STEM:
+        token = token[:-1]
+
+    return token
+
+
+def normalize_text(text: str) -> str:
+    """Accent-folded, lowercased text with collapsed whitespace"""
+    if not text:
+        return ""
+    return " ".join(fold_accents(text).split())
+
+
+def normalize_tokens(text: str, remove_stop_words: bool = True) -> List[str]:
+    """
+    Tokenize and stem text (the representation every matcher compares)
+
+    Args:
+        text: Raw text
+        remove_stop_words: Whether to drop stop words (before stemming)
+
+    Returns:
+        List of stems (order preserved, duplicates kept)
+    """
+    min_length = 2 if remove_stop_words else 1
+    return [stem(token) for token in tokenize(text, min_length, remove_stop_words)]
+
+
+class NormalizedText:
+    """
+    A message normalized once and shared by every matching stage
+    """
+    __slots__ = ("raw", "folded", "tokens")
+
+    def __init__(self, raw: str):
+        self.raw = raw or ""
+        self.folded = normalize_text(self.raw)
+        self.tokens = normalize_tokens(self.raw)
+
+    def __str__(self) -> str:
+        return self.raw
+
+    def __repr__(self) -> str:
+        return f"<NormalizedText {self.raw[:50]!r}>"
+
+
+def normalize(text: Union[str, NormalizedText]) -> NormalizedText:
+    """Normalize a message (already normalized input is returned as is)"""
+    if isinstance(text, NormalizedText):
+        return text
+    return NormalizedText(text)
@@ -0,0 +1,62 @@
+"""
+Token counting for prompts and LLM usage
+Uses tiktoken with the configured model's encoding when it is installed and a
+word-based estimate otherwise. Shared by the prompt builder, the LLM gateway
+(streamed completions carry no usage) and the fake provider.
+"""
+from app.config import get_settings
+from functools import lru_cache
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+
+def _load_encoding():
+    """tiktoken encoding for the configured model (None if tiktoken is not installed)"""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken not installed; prompt tokens are estimated")
+        return None
+    try:
+        return tiktoken.encoding_for_model(settings.openai_model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+_encoding = _load_encoding()
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    Tokens in a text (cached, so a knowledge row is counted once)
+    Without tiktoken, words count one token plus one per 6 characters and
+    each punctuation mark counts one, which slightly overestimates Spanish text.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return sum(1 + len(token) // 6 for token in _WORD.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of the text (cut at a word boundary) within max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        text = _encoding.decode(_encoding.encode(text)[:max_tokens])
+    else:
+        # Estimate first, then shrink until it fits
+        text = text[:max_tokens * 4]
+        while text and count_tokens(text) > max_tokens:
+            text = text[:int(len(text) * 0.9)]
+    cut = text.rsplit(" ", 1)[0] if " " in text else text
+    return cut.rstrip() + "…"
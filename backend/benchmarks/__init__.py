@@ -0,0 +1,3 @@
+"""
+Retrieval benchmarks (run from backend/: python -m benchmarks.retrieval --help)
+"""
@@ -0,0 +1,149 @@
+"""
+Synthetic Spanish-language corpora for retrieval benchmarks
+Generates Knowledge, FAQ and MessageTemplate rows resembling IA Club content
+"""
+from typing import Dict, List
+import random
+
+
+PRODUCTS = [
+    "MEGAPACK", "ChatGPT Plus", "Claude", "Sora 2", "Veo 3.1 Ultra", "Midjourney",
+    "CapCut PRO", "Runway", "Kling AI", "Perplexity", "Consensus", "Turnitin",
+    "Gemini Advanced", "Copilot", "Cursor AI", "ElevenLabs", "Leonardo AI",
+    "Higgsfield", "WriteHuman", "Scribd", "DALL-E", "Suno", "HeyGen", "Gamma"
+]
+
+TOPICS = [
+    "precios", "métodos de pago", "entrega del acceso", "renovación", "garantía",
+    "soporte técnico", "cuenta personal", "planes VIP", "uso ilimitado",
+    "promociones", "seguridad de la cuenta", "activación", "reembolsos",
+    "tutoriales", "grupo de WhatsApp", "facturación", "límites de uso",
+    "compatibilidad", "actualizaciones", "recomendaciones"
+]
+
+AUDIENCES = [
+    "estudiantes", "investigadores", "creadores de contenido", "programadores",
+    "diseñadores", "empresarios", "docentes", "agencias de marketing"
+]
+
+PAYMENT_METHODS = ["Yape", "Plin", "transferencia bancaria", "PayPal", "tarjeta de crédito"]
+
+SENTENCES = [
+    "El {product} está disponible para {audience} desde el primer día.",
+    "Con el plan de {months} meses pagas {price} soles y obtienes acceso a {product}.",
+    "La {topic} del {product} se gestiona por WhatsApp en menos de {hours} horas.",
+    "Aceptamos {payment} y la confirmación del pago es inmediata.",
+    "Los {audience} suelen usar {product} para proyectos de {usecase}.",
+    "Si tienes problemas con {topic}, nuestro equipo de soporte te ayuda las 24 horas.",
+    "El acceso a {product} es personal y no se comparte con otros miembros.",
+    "La promoción vigente incluye {product} sin costo adicional durante {months} meses.",
+    "Cada cuenta incluye tutoriales en video para sacar provecho a {product}.",
+    "Renovar el plan mantiene tu historial y configuraciones de {product}.",
+    "Para {usecase}, recomendamos combinar {product} con {product2}.",
+    "La entrega de credenciales se realiza el mismo día después de confirmar el pago.",
+    "Nuestros miembros {audience} destacan la calidad de {product} para {usecase}.",
+    "El uso de {product} es ilimitado dentro de las políticas del proveedor."
+]
+
+USE_CASES = [
+    "tesis", "videos cortos", "edición de audio", "programación", "redes sociales",
+    "presentaciones", "investigación académica", "publicidad", "automatización",
+    "diseño de logos", "análisis de datos", "traducción"
+]
+
+QUESTION_PATTERNS = [
+    "¿Cuánto cuesta {product}?",
+    "¿Cómo pago el {product}?",
+    "¿{product} incluye {topic}?",
+    "¿Es seguro comprar {product}?",
+    "¿Cuándo recibo el acceso a {product}?",
+    "¿Sirve {product} para {usecase}?",
+    "¿Qué pasa con la {topic}?",
+    "¿Puedo pagar con {payment}?",
+    "¿El {product} tiene {topic}?"
+]
+
+VARIATION_PATTERNS = [
+    "precio de {product}",
+    "cuanto vale {product}",
+    "{product} {topic}",
+    "info sobre {topic}",
+    "{product} para {usecase}",
+    "pago con {payment}"
+]
+
+
+class CorpusGenerator:
+    """Deterministic generator (same seed and size -> same corpus)"""
+
+    def __init__(self, seed: int = 42):
+        self.random = random.Random(seed)
+
+    def _fill(self, pattern: str) -> str:
+        r = self.random
+        return pattern.format(
+            product=r.choice(PRODUCTS),
+            product2=r.choice(PRODUCTS),
+            topic=r.choice(TOPICS),
+            audience=r.choice(AUDIENCES),
+            payment=r.choice(PAYMENT_METHODS),
+            usecase=r.choice(USE_CASES),
+            months=r.choice([1, 2, 3, 6, 12]),
+            price=r.choice([30, 55, 75, 99, 150]),
+            hours=r.choice([1, 2, 4, 12, 24])
+        )
+
+    def knowledge(self, count: int) -> List[Dict]:
+        """Knowledge rows (~300-900 characters each, like document chunks)"""
+        rows = []
+        for i in range(count):
+            product = self.random.choice(PRODUCTS)
+            topic = self.random.choice(TOPICS)
+            sentences = [self._fill(p) for p in self.random.sample(SENTENCES, self.random.randint(4, 9))]
+            rows.append({
+                "title": f"{product} - {topic} ({i})",
+                "category": self.random.choice(["productos", "pagos", "soporte", "empresa", "ventas"]),
+                "content": " ".join(sentences),
+                "keywords": [product.lower(), topic] + self.random.sample(USE_CASES, 2),
+                "source": "benchmark",
+                "priority": self.random.choice([0, 0, 0, 1, 2, 5]),
+                "is_active": True,
+                "times_used": self.random.randint(0, 50)
+            })
+        return rows
+
+    def faqs(self, count: int) -> List[Dict]:
+        """FAQ rows with 2-5 question variations each"""
+        rows = []
+        for _ in range(count):
+            rows.append({
+                "question": self._fill(self.random.choice(QUESTION_PATTERNS)),
+                "answer": " ".join(self._fill(p) for p in self.random.sample(SENTENCES, 2)),
+                "category": self.random.choice(["precios", "pagos", "acceso", "soporte"]),
+                "tags": self.random.sample(TOPICS, 2),
+                "question_variations": [
+                    self._fill(p) for p in self.random.sample(VARIATION_PATTERNS, self.random.randint(2, 5))
+                ],
+                "is_active": True,
+                "priority": self.random.choice([0, 0, 1, 2]),
+                "times_used": self.random.randint(0, 20)
+            })
+        return rows
+
+    def templates(self, count: int) -> List[Dict]:
+        """MessageTemplate rows with trigger keywords"""
+        rows = []
+        for i in range(count):
+            product = self.random.choice(PRODUCTS)
+            rows.append({
+                "name": f"plantilla_{i}",
+                "description": f"Plantilla sintética sobre {product}",
+                "category": self.random.choice(["bienvenida", "ventas", "pagos"]),
+                "trigger_keywords": [f"{product.lower()} promo {i}", f"codigo{i}"],
+                "messages": [
+                    {"order": 0, "type": "text", "content": self._fill(self.random.choice(SENTENCES))},
+                    {"order": 1, "type": "image", "content": f"{product}.png"}
+                ],
+                "is_active": True
+            })
+        return rows
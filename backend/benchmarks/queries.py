@@ -0,0 +1,46 @@
+"""
+Query set modeled on real WhatsApp/Chatwoot customer messages
+"""
+
+CHAT_QUERIES = [
+    "hola",
+    "precio?",
+    "info",
+    "buenas tardes, cuánto cuesta el megapack?",
+    "cómo pago",
+    "es seguro?",
+    "aceptan yape o plin?",
+    "tienen sora 2?",
+    "quiero comprar el plan de 3 meses",
+    "hola quisiera información sobre las IAs que incluye el paquete",
+    "cuando me llega el acceso después de pagar",
+    "sirve para hacer mi tesis? necesito algo para referencias bibliográficas",
+    "tienen midjourney y capcut pro? soy creador de contenido en tiktok",
+    "el chatgpt plus es cuenta personal o compartida",
+    "cuanto dura la garantia",
+    "no me funciona el login de claude, me sale error",
+    "hay descuento si pago 6 meses?",
+    "qué diferencia hay entre VIP 1 y VIP 2",
+    "puedo pagar con tarjeta de crédito desde méxico?",
+    "me interesa veo 3.1 ultra para publicidad de mi negocio",
+    "programación con cursor ai o copilot, cuál recomiendan",
+    "es muy caro, no tengo tanto dinero",
+    "ya pagué, cómo hago para recibir las credenciales?",
+    "renovación automática?",
+    "tienen turnitin para detectar plagio",
+    "buenos dias, soy docente universitario y quiero usar IA en mis clases, qué me recomiendan",
+    "el uso es ilimitado?",
+    "diseno de logos con ia",
+    "programacion",
+    "cuánto vale el plan de un mes",
+    "me pueden enviar el catálogo completo de IAs",
+    "hay grupo de whatsapp para miembros?",
+    "gracias!",
+    "quiero hablar con un humano",
+    "funciona en celular?",
+    "tengo problemas con la activación de mi cuenta personal",
+    "hacen factura?",
+    "qué incluye el combo de creación de contenido audiovisual",
+    "promo",
+    "ok, cómo compro"
+]
@@ -4,6 +4,8 @@ Script para configurar la longitud de las respuestas del bot
 from sqlalchemy.orm import Session
 from app.utils.database import SessionLocal
 from app.models.settings import Settings
+from app.bot.knowledge_snapshot import announce_change
+import asyncio
 
 
 def configurar_longitud():
@@ -89,8 +91,11 @@ def configurar_longitud():
         print("CONFIGURACIÓN GUARDADA EXITOSAMENTE")
         print("=" * 60)
         print()
-        print("Los cambios se aplicarán en las próximas respuestas del bot.")
-        print("Si el backend está corriendo, los cambios son automáticos.")
+        if asyncio.run(announce_change()):
+            print("Los cambios se aplicarán en las próximas respuestas del bot.")
+        else:
+            print("Redis no disponible: si el backend está corriendo, aplica los cambios")
+            print("con POST /api/system/snapshot/refresh")
         print()
         
         # Mostrar configuración actual
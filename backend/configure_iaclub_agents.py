@@ -6,6 +6,8 @@ sys.path.append('C:/Users/Guerr/Music/BOT PYTHON + CHATWOOT/backend')
 
 from app.utils.database import SessionLocal
 from app.models.agent_config import AgentConfig
+from app.bot.knowledge_snapshot import announce_change
+import asyncio
 
 db = SessionLocal()
 
@@ -189,5 +191,7 @@ print(f"👥 {len(agents_config)} agentes listos")
 print("\nAgentes configurados:")
 for config in agents_config:
     print(f"  • {config['agent_name']}")
+if not asyncio.run(announce_change()):
+    print("\nRedis no disponible: si el backend está corriendo, aplica los cambios con POST /api/system/snapshot/refresh")
 
 db.close()
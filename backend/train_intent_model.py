@@ -0,0 +1,111 @@
+"""
+Script para entrenar el clasificador local de intenciones
+Usa las clasificaciones del LLM registradas en INTENT_LOG_PATH (más los
+ejemplos semilla) y guarda el modelo en INTENT_MODEL_PATH
+
+Uso:
+    python train_intent_model.py
+    python train_intent_model.py --log otro_registro.jsonl --min-confidence 0.8
+"""
+from app.config import get_settings
+from app.bot.intent_model import IntentModel, SEED_EXAMPLES, read_classification_log
+from app.utils.text_processing import normalize_text
+from collections import Counter
+from pathlib import Path
+import argparse
+import random
+
+settings = get_settings()
+
+
+def collect_examples(log_paths, min_confidence: float, include_seed: bool):
+    """Ejemplos únicos por mensaje normalizado (la clasificación más reciente gana)"""
+    examples = {}
+    if include_seed:
+        for message, intent in SEED_EXAMPLES:
+            examples[normalize_text(message)] = (message, intent)
+
+    for path in log_paths:
+        if not Path(path).exists():
+            print(f"⚠ No existe el registro {path}, se omite")
+            continue
+        for message, intent in read_classification_log(path, min_confidence):
+            examples[normalize_text(message)] = (message, intent)
+
+    return list(examples.values())
+
+
+def evaluate(examples, holdout: float, seed: int):
+    """Precisión sobre una porción reservada, global y por intención"""
+    shuffled = list(examples)
+    random.Random(seed).shuffle(shuffled)
+    cut = int(len(shuffled) * (1 - holdout))
+    train, test = shuffled[:cut], shuffled[cut:]
+    if not test:
+        return None
+
+    model = IntentModel().fit(train)
+    hits, totals = Counter(), Counter()
+    confident = confident_hits = 0
+    for message, intent in test:
+        predicted, confidence = model.predict(message)
+        totals[intent] += 1
+        hits[intent] += predicted == intent
+        if confidence >= settings.intent_local_threshold:
+            confident += 1
+            confident_hits += predicted == intent
+
+    return {
+        "test_size": len(test),
+        "accuracy": sum(hits.values()) / len(test),
+        "per_intent": {intent: hits[intent] / totals[intent] for intent in totals},
+        "local_coverage": confident / len(test),
+        "local_accuracy": confident_hits / confident if confident else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el clasificador local de intenciones")
+    parser.add_argument("--log", action="append",
+                        help=f"Registro JSONL de clasificaciones (por defecto {settings.intent_log_path})")
+    parser.add_argument("--output", default=settings.intent_model_path, help="Ruta del modelo")
+    parser.add_argument("--min-confidence", type=float, default=0.7,
+                        help="Ignorar clasificaciones del LLM con menor confianza")
+    parser.add_argument("--no-seed", action="store_true", help="No incluir los ejemplos semilla")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fracción reservada para evaluar")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("ENTRENAMIENTO DEL CLASIFICADOR DE INTENCIONES")
+    print("=" * 60)
+
+    examples = collect_examples(args.log or [settings.intent_log_path], args.min_confidence, not args.no_seed)
+    if not examples:
+        print("✗ No hay ejemplos para entrenar")
+        return
+
+    distribution = Counter(intent for _, intent in examples)
+    print(f"\nEjemplos: {len(examples)}")
+    for intent, count in distribution.most_common():
+        print(f"  - {intent}: {count}")
+
+    report = evaluate(examples, args.holdout, args.seed)
+    if report:
+        print(f"\nEvaluación ({report['test_size']} ejemplos reservados):")
+        print(f"  Precisión global: {report['accuracy']:.1%}")
+        for intent, accuracy in sorted(report["per_intent"].items()):
+            print(f"  - {intent}: {accuracy:.1%}")
+        print(f"  Resueltos sin LLM (umbral {settings.intent_local_threshold}): {report['local_coverage']:.1%}")
+        if report["local_accuracy"] is not None:
+            print(f"  Precisión de esos casos: {report['local_accuracy']:.1%}")
+
+    # El modelo final se entrena con todos los ejemplos
+    model = IntentModel().fit(examples)
+    model.save(args.output)
+    print(f"\n✓ Modelo guardado en {args.output}")
+    print("  Reinicia el backend para cargarlo")
+
+
+if __name__ == "__main__":
+    main()
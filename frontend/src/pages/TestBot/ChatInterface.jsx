@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import client from '../../api/client';
+import { streamPost } from '../../api/client';
 import { Send } from 'lucide-react';
 import Markdown from 'react-markdown';
 
@@ -24,46 +24,70 @@ export default function ChatInterface() {
     setInput('');
     setLoading(true);
 
+    // La respuesta se muestra mientras el bot la escribe (SSE)
+    let replyStarted = false;
+    const startReply = () => {
+      if (replyStarted) return;
+      replyStarted = true;
+      setLoading(false);
+      setMessages((prev) => [...prev, { role: 'assistant', content: '' }]);
+    };
+    const updateReply = (changes) =>
+      setMessages((prev) => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, ...changes(last) };
+        return next;
+      });
+
     try {
-      const { data } = await client.post('/api/test/chat', {
+      await streamPost('/api/test/chat/stream', {
         message: input,
         conversation_history: messages,
+      }, (event, data) => {
+        if (event === 'token') {
+          startReply();
+          updateReply((last) => ({ content: last.content + data.text }));
+        } else if (event === 'done') {
+          startReply();
+          updateReply(() => ({
+            content: data.response || 'Error: respuesta vacía',
+            metadata: {
+              agent: data.agent_used || 'Unknown',
+              intent: data.intent || 'unknown',
+              confidence: data.confidence || 0,
+              knowledge_count: data.knowledge_used?.length || 0,
+              faq_count: data.faqs_used?.length || 0,
+              profile: data.customer_profile || null,
+              engagement: data.engagement_level || null,
+              first_token_ms: data.first_token_ms,
+              total_ms: data.total_ms
+            }
+          }));
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
       });
-
-      setMessages((prev) => [
-        ...prev,
-        { 
-          role: 'assistant', 
-          content: data.response || 'Error: respuesta vacía',
-          metadata: {
-            agent: data.agent_used || 'Unknown',
-            intent: data.intent || 'unknown',
-            confidence: data.confidence || 0,
-            knowledge_count: data.knowledge_used?.length || 0,
-            faq_count: data.faqs_used?.length || 0,
-            profile: data.customer_profile || null,
-            engagement: data.engagement_level || null
-          }
-        },
-      ]);
     } catch (error) {
       console.error('Error sending message:', error);
-      setMessages((prev) => [
-        ...prev,
-        { 
-          role: 'assistant', 
-          content: '❌ **Error de conexión**\n\nNo pude conectarme con el servidor. Por favor verifica que el backend esté funcionando.',
-          metadata: {
-            agent: 'Error Handler',
-            intent: 'error',
-            confidence: 0,
-            knowledge_count: 0,
-            faq_count: 0,
-            profile: null,
-            engagement: null
-          }
-        },
-      ]);
+      const errorReply = {
+        role: 'assistant', 
+        content: '❌ **Error de conexión**\n\nNo pude conectarme con el servidor. Por favor verifica que el backend esté funcionando.',
+        metadata: {
+          agent: 'Error Handler',
+          intent: 'error',
+          confidence: 0,
+          knowledge_count: 0,
+          faq_count: 0,
+          profile: null,
+          engagement: null
+        }
+      };
+      if (replyStarted) {
+        updateReply(() => errorReply);
+      } else {
+        setMessages((prev) => [...prev, errorReply]);
+      }
     } finally {
       setLoading(false);
     }
@@ -158,6 +182,14 @@ export default function ChatInterface() {
                         <span>❓ {msg.metadata.faq_count} FAQs</span>
                       </>
                     )}
+                    {msg.metadata.first_token_ms != null && (
+                      <>
+                        <span className="mx-2">•</span>
+                        <span title={`Total: ${msg.metadata.total_ms} ms`}>
+                          ⏱️ {msg.metadata.first_token_ms} ms al primer token
+                        </span>
+                      </>
+                    )}
                   </div>
                 )}
               </div>